@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2023 Celonis SE
+# Covered under the included MIT License:
+#   https://github.com/celonis/homcc/blob/main/LICENSE
+
+"""
+Benchmark of the homcc client startup for each entry path.
+
+Runs the homcc entry point via "python -X importtime" for each path, e.g. linking-only or remote compilation, and
+reports the best wall time of the whole invocation, the time spent on imports and the amount of imported modules.
+Specifying --max-import-time turns the benchmark into a regression check which fails if any path exceeds the budget.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+REPOSITORY: Path = Path(__file__).resolve().parent.parent
+MAIN: Path = REPOSITORY / "homcc" / "client" / "main.py"
+AGENT: Path = REPOSITORY / "homcc" / "client" / "agent.py"
+
+
+class Measurement(NamedTuple):
+    """Startup measurement of a single entry path."""
+
+    wall_time: float
+    """Best wall time of the whole invocation in milliseconds."""
+    import_time: float
+    """Time spent on top-level imports in milliseconds."""
+    modules: int
+    """Amount of imported modules."""
+    heaviest: List[str]
+    """Modules with the highest cumulative import time."""
+
+
+def parse_importtime(output: str) -> Measurement:
+    """parse the stderr output of "python -X importtime" where nested imports are indented below their importer"""
+    import_time: float = 0
+    modules: Dict[str, float] = {}
+
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line[len("import time:") :].split("|")
+        modules[name.strip()] = int(cumulative) / 1000
+
+        if not name.startswith("  "):  # top-level import
+            import_time += int(cumulative) / 1000
+
+    heaviest: List[str] = sorted(modules, key=lambda module: modules[module], reverse=True)[:5]
+    return Measurement(0, import_time, len(modules), [f"{module} ({modules[module]:.1f} ms)" for module in heaviest])
+
+
+def measure(args: List[str], cwd: Path, env: Dict[str, str], repetitions: int) -> Measurement:
+    """return the best measurement of running the homcc entry point with the given arguments"""
+    best: Optional[Measurement] = None
+
+    for _ in range(repetitions):
+        start: float = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", str(MAIN), *args],
+            cwd=cwd,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            encoding="utf-8",
+            check=False,
+        )
+        wall_time: float = (time.perf_counter() - start) * 1000
+        measurement: Measurement = parse_importtime(result.stderr)._replace(wall_time=wall_time)
+
+        if best is None or measurement.wall_time < best.wall_time:
+            best = measurement
+
+    assert best is not None
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--compiler", default="g++", help="compiler used for all entry paths")
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--max-import-time", type=float, help="fail if any entry path exceeds this budget in ms")
+    parser.add_argument("--verbose", action="store_true", help="list the heaviest imports of each entry path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cwd: Path = Path(tmp_dir)
+        (cwd / "main.cpp").write_text("int main() {}\n")
+        subprocess.run([args.compiler, "-c", "main.cpp", "-o", "main.o"], cwd=cwd, check=True)
+
+        env: Dict[str, str] = dict(os.environ)
+        env.update({"HOMCC_DIR": str(cwd / "homcc"), "HOMCC_HOSTS": "localhost/1\n127.0.0.1:1/1"})
+        env.pop("_HOMCC_SAFEGUARD", None)
+
+        entry_paths: Dict[str, List[str]] = {
+            "version": ["--version"],
+            "unsendable": [args.compiler, "--version"],
+            "linking-only": [args.compiler, "main.o", "-o", "main"],
+            "remote compilation": [args.compiler, "-c", "main.cpp", "-o", "remote.o"],
+        }
+
+        measurements: Dict[str, Measurement] = {
+            entry_path: measure(entry_args, cwd, env, args.repetitions)
+            for entry_path, entry_args in entry_paths.items()
+        }
+
+        # invocations forwarded to a running agent only import the forwarder
+        with subprocess.Popen([sys.executable, str(AGENT)], env=env, stderr=subprocess.DEVNULL) as agent:
+            while not (cwd / "homcc" / "agent.sock").exists():
+                time.sleep(0.05)
+
+            measurements["agent forwarding"] = measure(entry_paths["remote compilation"], cwd, env, args.repetitions)
+            agent.terminate()
+
+    print(f"{'entry path':<20}{'wall time':>12}{'imports':>12}{'modules':>10}")
+
+    for entry_path, measurement in measurements.items():
+        print(
+            f"{entry_path:<20}{measurement.wall_time:9.1f} ms{measurement.import_time:9.1f} ms{measurement.modules:10}"
+        )
+
+        if args.verbose:
+            print(f"{'':<20}{', '.join(measurement.heaviest)}")
+
+    if args.max_import_time is not None:
+        exceeding: List[str] = [
+            entry_path
+            for entry_path, measurement in measurements.items()
+            if measurement.import_time > args.max_import_time
+        ]
+
+        if exceeding:
+            sys.exit(f"Import time budget of {args.max_import_time} ms exceeded by: {', '.join(exceeding)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2023 Celonis SE
+# Covered under the included MIT License:
+#   https://github.com/celonis/homcc/blob/main/LICENSE
+
+"""
+Benchmark of the client-side dependency hashing that happens during the preprocessing phase.
+
+Generates a synthetic translation unit with many header dependencies (and optionally a few huge generated headers)
+and compares hashing whole files read into memory, hashing files chunk-wise by different amounts of threads and lookups
+in a warm client cache. The speedup of concurrent hashing depends on the amount of available CPUs.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from homcc.client.cache import ClientCache  # pylint: disable=wrong-import-position
+from homcc.common.hashing import (  # pylint: disable=wrong-import-position
+    MAX_HASHING_WORKERS,
+    hash_file_with_bytes,
+    hash_files_with_paths,
+)
+
+
+def measure(function: Callable[[], object], repetitions: int) -> float:
+    """return the best wall time of the given function in milliseconds"""
+    timings: List[float] = []
+
+    for _ in range(repetitions):
+        start: float = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings) * 1000
+
+
+def hash_whole_files(paths: List[str]) -> Dict[str, str]:
+    """hash the files by reading each of them into memory at once, like before chunk-wise hashing"""
+    hashes: Dict[str, str] = {}
+
+    for path in paths:
+        with open(path, "rb") as file:
+            hashes[path] = hash_file_with_bytes(file.read())
+
+    return hashes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--headers", type=int, default=5000, help="amount of generated headers")
+    parser.add_argument("--header-size", type=int, default=16 << 10, help="size of each generated header in bytes")
+    parser.add_argument("--huge-headers", type=int, default=2, help="amount of additional 64 MiB generated headers")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({1, 2, 4, MAX_HASHING_WORKERS}),
+        help="amounts of hashing threads to compare",
+    )
+    parser.add_argument("--repetitions", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dependencies: List[str] = []
+
+        for index in range(args.headers):
+            header: Path = Path(tmp_dir) / f"header{index}.h"
+            header.write_bytes(os.urandom(args.header_size))
+            dependencies.append(str(header))
+
+        for index in range(args.huge_headers):
+            header = Path(tmp_dir) / f"generated{index}.h"
+            header.write_bytes(os.urandom(64 << 20))
+            dependencies.append(str(header))
+
+        # mark all headers as unmodified for long enough to be cacheable
+        old_time_ns: int = time.time_ns() - 2 * ClientCache.RACY_MTIME_NS
+        for dependency in dependencies:
+            os.utime(dependency, ns=(old_time_ns, old_time_ns))
+
+        print(f"{len(dependencies)} dependencies, {os.cpu_count()} CPUs")
+
+        whole: float = measure(lambda: hash_whole_files(dependencies), args.repetitions)
+        print(f"whole file hashing:\t{whole:8.1f} ms")
+
+        for workers in args.workers:
+            chunked: float = measure(
+                lambda workers=workers: hash_files_with_paths(dependencies, max_workers=workers), args.repetitions
+            )
+            print(f"{workers} hashing workers:\t{chunked:8.1f} ms ({whole / chunked:.2f}x)")
+
+        cache_path: Path = Path(tmp_dir) / ClientCache.FILENAME
+
+        with ClientCache(cache_path) as cache:
+            cache.hash_files(dependencies)
+
+        def hash_with_warm_cache():
+            with ClientCache(cache_path) as warm_cache:
+                warm_cache.hash_files(dependencies)
+
+        cached: float = measure(hash_with_warm_cache, args.repetitions)
+        print(f"warm client cache:\t{cached:8.1f} ms ({whole / cached:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2023 Celonis SE
+# Covered under the included MIT License:
+#   https://github.com/celonis/homcc/blob/main/LICENSE
+
+"""
+Simulation of the remote host selection of the homcc client.
+
+Simulates a build of many translation units with a fixed amount of parallel jobs, e.g. "make -j24", on a set of hosts
+that differ in latency, speed, upload bandwidth and load caused by other users. Hosts refuse requests once all of their
+slots are occupied, in which case the next host is tried and the translation unit is compiled locally after all tries
+failed. Each translation unit selects its hosts via the actual RemoteHostSelector, either weighted by the host limits
+only or additionally by the statistics of previous requests, which are recorded like the client cache does.
+"""
+import argparse
+import heapq
+import random
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from statistics import mean, quantiles
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# pylint: disable=wrong-import-position
+from homcc.client.cache import ClientCache, HostStatistics
+from homcc.client.client import RemoteHostSelector, host_statistics_key
+from homcc.common.errors import RemoteHostsFailure
+from homcc.common.host import Host
+
+# pylint: enable=wrong-import-position
+
+
+class SimulatedHost(NamedTuple):
+    """Remote compilation host of the simulation."""
+
+    name: str
+    limit: int
+    """Slots of the host, shared with other users."""
+    rtt: float
+    """Round trip time in seconds."""
+    slowdown: float
+    """Factor of the compilation time compared to the reference machine."""
+    upload_time: float
+    """Time in seconds to upload all dependencies of a translation unit if none of them are cached."""
+    external_load: float
+    """Probability of each slot to be occupied by other users."""
+
+
+HOSTS: List[SimulatedHost] = [
+    SimulatedHost("near", limit=8, rtt=0.003, slowdown=1.0, upload_time=0.1, external_load=0.1),
+    SimulatedHost("vpn", limit=16, rtt=0.08, slowdown=1.0, upload_time=1.5, external_load=0.85),
+    SimulatedHost("slow", limit=8, rtt=0.01, slowdown=1.6, upload_time=0.2, external_load=0.2),
+]
+LOCAL_SLOWDOWN: float = 1.5
+"""Factor of the compilation time of the local fallback compared to the reference machine."""
+CACHE_WARMUP: int = 50
+"""Amount of translation units after which half of the dependencies are cached on a host."""
+
+
+@dataclass
+class Result:
+    """Result of a simulated build."""
+
+    latencies: List[float]
+    refusals: int = 0
+    local_fallbacks: int = 0
+
+
+class Simulation:
+    """Discrete event simulation of a build with the given host selection policy."""
+
+    def __init__(self, use_statistics: bool, jobs: int, translation_units: int, tries: int, seed: int):
+        self.use_statistics = use_statistics
+        self.jobs = jobs
+        self.translation_units = translation_units
+        self.tries = tries
+        self.rng = random.Random(seed)
+        random.seed(seed)  # used by the RemoteHostSelector
+
+        self.hosts: Dict[str, SimulatedHost] = {host_statistics_key(Host.from_str(host.name)): host for host in HOSTS}
+        self.in_flight: Dict[str, int] = dict.fromkeys(self.hosts, 0)
+        self.compiled: Dict[str, int] = dict.fromkeys(self.hosts, 0)
+        self.statistics: Dict[str, HostStatistics] = {}
+        self.distribution: Dict[str, int] = dict.fromkeys([*self.hosts, "local"], 0)
+
+        self.events: List[Tuple[float, int, Callable[[float], None]]] = []
+        self.event_counter: int = 0
+        self.result = Result([])
+
+    def schedule(self, event_time: float, callback: Callable[[float], None]):
+        self.event_counter += 1
+        heapq.heappush(self.events, (event_time, self.event_counter, callback))
+
+    def record(self, key: str, refused: bool, connect_time=None, turnaround=None, cache_hit_ratio=None):
+        """fold a request into the moving averages analogously to ClientCache.record_host_request"""
+        smoothing: float = ClientCache.HOST_STATISTICS_SMOOTHING
+
+        def average(previous: Optional[float], sample: Optional[float]) -> Optional[float]:
+            if sample is None or previous is None:
+                return previous if sample is None else sample
+            return previous + smoothing * (sample - previous)
+
+        previous = self.statistics.get(key, HostStatistics(None, None, None, float(refused), time.time()))
+        self.statistics[key] = HostStatistics(
+            average(previous.connect_time, connect_time),
+            average(previous.turnaround, turnaround),
+            average(previous.cache_hit_ratio, cache_hit_ratio),
+            average(previous.refusal_rate, float(refused)),  # type: ignore[arg-type]
+            time.time(),
+        )
+
+    def start_translation_unit(self, start_time: float):
+        work: float = self.rng.lognormvariate(0, 0.5)  # compilation time on the reference machine
+        selector = RemoteHostSelector(
+            [Host.from_str(f"{host.name}/{host.limit}") for host in HOSTS],
+            self.tries,
+            dict(self.statistics) if self.use_statistics else None,
+        )
+        self.attempt(start_time, start_time, work, selector)
+
+    def attempt(self, now: float, start_time: float, work: float, selector: RemoteHostSelector):
+        try:
+            key: str = host_statistics_key(next(selector))
+        except (StopIteration, RemoteHostsFailure):
+            self.result.local_fallbacks += 1
+            self.distribution["local"] += 1
+            self.schedule(now + work * LOCAL_SLOWDOWN, lambda end_time: self.finish(end_time, start_time))
+            return
+
+        host: SimulatedHost = self.hosts[key]
+
+        # the client itself never occupies more slots than the limit of the host, try the next host right away
+        if self.in_flight[key] >= host.limit:
+            self.attempt(now, start_time, work, selector)
+            return
+
+        occupied_slots: int = sum(self.rng.random() < host.external_load for _ in range(host.limit))
+        self.in_flight[key] += 1
+
+        if self.in_flight[key] + occupied_slots > host.limit:
+            # the host refuses the request after connecting and sending the arguments
+            def refused(refusal_time: float):
+                self.in_flight[key] -= 1
+                self.result.refusals += 1
+                self.record(key, True, connect_time=host.rtt)
+                self.attempt(refusal_time, start_time, work, selector)
+
+            self.schedule(now + 2 * host.rtt, refused)
+            return
+
+        cache_hit_ratio: float = self.compiled[key] / (self.compiled[key] + CACHE_WARMUP)
+        turnaround: float = 2 * host.rtt + (1 - cache_hit_ratio) * host.upload_time + work * host.slowdown
+
+        def compiled(end_time: float):
+            self.in_flight[key] -= 1
+            self.compiled[key] += 1
+            self.distribution[key] += 1
+            self.record(key, False, host.rtt, turnaround, cache_hit_ratio)
+            self.finish(end_time, start_time)
+
+        self.schedule(now + host.rtt + turnaround, compiled)
+
+    def finish(self, end_time: float, start_time: float):
+        self.result.latencies.append(end_time - start_time)
+
+        if len(self.result.latencies) + self.jobs <= self.translation_units:
+            self.start_translation_unit(end_time)
+
+    def run(self) -> Result:
+        for _ in range(min(self.jobs, self.translation_units)):
+            self.start_translation_unit(0)
+
+        while self.events:
+            event_time, _, callback = heapq.heappop(self.events)
+            callback(event_time)
+
+        return self.result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=12, help="amount of parallel jobs of the build")
+    parser.add_argument("--translation-units", type=int, default=2000)
+    parser.add_argument("--tries", type=int, default=3, help="remote compilation tries per translation unit")
+    parser.add_argument("--seeds", type=int, default=5, help="amount of simulated builds per policy")
+    args = parser.parse_args()
+
+    print("hosts: " + ", ".join(f"{host.name} ({host.limit} slots, {host.rtt * 1000:g} ms)" for host in HOSTS))
+    print(f"{'policy':<12}{'mean TU':>10}{'p95 TU':>10}{'refusals':>10}{'local':>8}  distribution")
+
+    for policy, use_statistics in [("limits", False), ("statistics", True)]:
+        results: List[Result] = []
+        distribution: Dict[str, int] = {}
+
+        for seed in range(args.seeds):
+            simulation = Simulation(use_statistics, args.jobs, args.translation_units, args.tries, seed)
+            results.append(simulation.run())
+
+            for key, amount in simulation.distribution.items():
+                distribution[key.split(":")[0]] = distribution.get(key.split(":")[0], 0) + amount
+
+        latencies: List[float] = [latency for result in results for latency in result.latencies]
+        total: int = sum(distribution.values())
+        print(
+            f"{policy:<12}{mean(latencies):9.2f}s{quantiles(latencies, n=20)[-1]:9.2f}s"
+            f"{sum(result.refusals for result in results) // args.seeds:10}"
+            f"{sum(result.local_fallbacks for result in results) // args.seeds:8}  "
+            + ", ".join(f"{name} {amount / total:.0%}" for name, amount in distribution.items())
+        )
+
+
+if __name__ == "__main__":
+    main()
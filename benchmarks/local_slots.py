@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2023 Celonis SE
+# Covered under the included MIT License:
+#   https://github.com/celonis/homcc/blob/main/LICENSE
+
+"""
+Benchmark of the hand-off of local compilation slots between homcc client processes.
+
+Starts as many client processes as a build with "make -j128" would, which repeatedly acquire one of the few local
+compilation slots, hold it for a short compilation and release it again. Reports the hand-off latency, i.e. the time
+between the release of a slot and its acquisition by a waiting process, and the amount of FIFO inversions, i.e. how
+often a process acquired a slot before another process that had been waiting longer. The build is repeated after a
+few processes have been killed while occupying a slot, whose slots are reclaimed instead of being lost.
+"""
+from __future__ import annotations
+
+import argparse
+import bisect
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import time
+from pathlib import Path
+from statistics import median, quantiles
+from typing import List, NamedTuple, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# pylint: disable=wrong-import-position
+from homcc.client.semaphores import LocalHostCompilationSemaphore
+from homcc.common.host import Host
+from homcc.common.parsing import HOMCC_DIR_ENV_VAR
+
+# pylint: enable=wrong-import-position
+
+
+class QueueSemaphore(LocalHostCompilationSemaphore):
+    """Acquisition of local slots via the FIFO queue, which records when the process started waiting."""
+
+    enqueue_time: float
+
+    def _enqueue(self) -> int:
+        ticket: int = super()._enqueue()
+        self.enqueue_time = time.monotonic()
+        return ticket
+
+
+class Acquisition(NamedTuple):
+    """Monotonic timestamps of a single slot acquisition."""
+
+    enqueue_time: float
+    acquire_time: float
+    release_time: float
+
+
+def run_job(host: Host, rounds: int, hold: float, start, results):
+    start.wait()
+
+    for _ in range(rounds):
+        semaphore = QueueSemaphore(host)
+
+        with semaphore:
+            acquire_time: float = time.monotonic()
+            time.sleep(hold)
+            release_time: float = time.monotonic()
+
+        results.put(Acquisition(semaphore.enqueue_time, acquire_time, release_time))
+
+
+def kill_holder(host: Host):
+    """occupy a slot and get killed like make or an IDE would do, i.e. without releasing it"""
+    with LocalHostCompilationSemaphore(host):
+        os.kill(os.getpid(), signal.SIGKILL)
+
+
+def measure(jobs: int, slots: int, rounds: int, hold: float, killed: int) -> Tuple[List[float], int]:
+    """return the hand-off latencies in milliseconds and the amount of FIFO inversions"""
+    host: Host = Host.localhost_with_limit(slots)
+    context = multiprocessing.get_context("fork")
+    start = context.Event()
+    results = context.Queue()
+
+    for _ in range(killed):
+        holder = context.Process(target=kill_holder, args=(host,))
+        holder.start()
+        holder.join()
+
+    processes = [context.Process(target=run_job, args=(host, rounds, hold, start, results)) for _ in range(jobs)]
+
+    for process in processes:
+        process.start()
+
+    start.set()
+    acquisitions: List[Acquisition] = sorted(
+        (results.get() for _ in range(jobs * rounds)), key=lambda acquisition: acquisition.acquire_time
+    )
+
+    for process in processes:
+        process.join()
+
+    release_times: List[float] = sorted(acquisition.release_time for acquisition in acquisitions)
+    latencies: List[float] = []
+
+    for acquisition in acquisitions:
+        # latest release before the acquisition, only relevant if the process was already waiting for it
+        index: int = bisect.bisect_right(release_times, acquisition.acquire_time)
+
+        if index and release_times[index - 1] > acquisition.enqueue_time:
+            latencies.append((acquisition.acquire_time - release_times[index - 1]) * 1000)
+
+    inversions: int = sum(
+        later.enqueue_time < earlier.enqueue_time
+        for index, earlier in enumerate(acquisitions)
+        for later in acquisitions[index + 1 :]
+    )
+
+    return latencies, inversions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=128, help="amount of concurrent client processes")
+    parser.add_argument("--slots", type=int, default=8, help="amount of local compilation slots")
+    parser.add_argument("--rounds", type=int, default=5, help="amount of compilations per client process")
+    parser.add_argument("--hold", type=float, default=0.01, help="time in seconds a slot is held per compilation")
+    parser.add_argument("--killed", type=int, default=4, help="amount of processes killed while occupying a slot")
+    args = parser.parse_args()
+
+    print(f"{args.jobs} jobs, {args.slots} slots, {args.rounds} x {args.hold * 1000:g} ms holds per job")
+    print(f"{'scenario':<12}{'p50':>11}{'p95':>11}{'max':>11}{'inversions':>12}{'total':>10}")
+
+    for name, killed in [("clean", 0), (f"{args.killed} killed", args.killed)]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.environ[HOMCC_DIR_ENV_VAR] = tmp_dir  # keep the slots and queues of each scenario separate
+
+            start: float = time.monotonic()
+            latencies, inversions = measure(args.jobs, args.slots, args.rounds, args.hold, killed)
+            total: float = time.monotonic() - start
+
+        print(
+            f"{name:<12}{median(latencies):8.2f} ms{quantiles(latencies, n=20, method='inclusive')[-1]:8.2f} ms"
+            f"{max(latencies):8.2f} ms{inversions:12}{total:9.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2023 Celonis SE
+# Covered under the included MIT License:
+#   https://github.com/celonis/homcc/blob/main/LICENSE
+
+"""
+Benchmark of the request setup of the homcc server with and without memoized probes.
+
+Executes the probes that homccd runs for each compilation request, i.e. whether the compiler exists, whether it
+supports the requested target, which target it produces and its fingerprint, and reports the mean setup time per
+request. Probes can optionally be executed inside of a schroot profile or docker container.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# pylint: disable=wrong-import-position
+from homcc.common.arguments import Arguments
+from homcc.common.compression import NoCompression
+from homcc.server.cache import ProbeCache
+from homcc.server.environment import Environment
+
+# pylint: enable=wrong-import-position
+
+
+def measure(
+    arguments: Arguments,
+    schroot_profile: Optional[str],
+    docker_container: Optional[str],
+    probe_cache: Optional[ProbeCache],
+    requests: int,
+) -> float:
+    """return the mean setup time per request in milliseconds"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start: float = time.perf_counter()
+
+        for _ in range(requests):
+            environment = Environment(
+                Path(tmp_dir), os.getcwd(), schroot_profile, docker_container, NoCompression(), -1, probe_cache
+            )
+            target: str = environment.get_compiler_target_triple(arguments)
+
+            assert environment.compiler_exists(arguments)
+            assert environment.compiler_supports_target(arguments, target)
+            environment.get_compiler_fingerprint(arguments)
+            del environment  # remove the instance folder before the temporary directory
+
+        return (time.perf_counter() - start) * 1000 / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--compiler", default="g++", help="compiler that is probed")
+    parser.add_argument("--schroot-profile", help="probe the compiler inside of this schroot profile")
+    parser.add_argument("--docker-container", help="probe the compiler inside of this docker container")
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    arguments: Arguments = Arguments.from_vargs(args.compiler, "-c", "main.cpp")
+    sandbox = (args.schroot_profile, args.docker_container)
+
+    uncached: float = measure(arguments, *sandbox, None, args.requests)
+    cached: float = measure(arguments, *sandbox, ProbeCache(ttl=60), args.requests)
+
+    print(f"{'probes':<12}{'setup time':>14}")
+    print(f"{'executed':<12}{uncached:11.2f} ms")
+    print(f"{'memoized':<12}{cached:11.2f} ms")
+    print(f"saved {uncached - cached:.2f} ms ({(1 - cached / uncached) * 100:.0f} %) per request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# Copyright (c) 2023 Celonis SE
+# Covered under the included MIT License:
+#   https://github.com/celonis/homcc/blob/main/LICENSE
+
+"""
+Optional long-lived agent of the homcc client.
+
+Without the agent, every single compiler invocation starts a new interpreter which imports and sets up the complete
+homcc client. If the agent is running, the homcc entry point instead forwards its invocation, i.e. its arguments,
+working directory, environment and standard streams, via a Unix socket to the agent. The agent has all client modules
+imported already and serves each forwarded invocation in a forked child process that runs the regular client, so that
+the semantics of a homcc invocation are identical with and without the agent. The agent therefore neither reuses
+connections to remote hosts nor keeps any state in memory across invocations, their state is shared via the client cache
+and slot tables on disk as without the agent.
+
+This module is imported by the homcc entry point before anything else and therefore must only import lightweight
+modules at the top level.
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+import traceback
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
+
+from homcc.common.parsing import (  # pylint: disable=wrong-import-position
+    HOMCC_DIR_ENV_VAR,
+)
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+AGENT_SOCKET_FILENAME: str = "agent.sock"
+FORWARDED_FDS: List[int] = [0, 1, 2]  # stdin, stdout and stderr of the forwarding process
+REQUEST_HEADER: struct.Struct = struct.Struct("!I")  # size of the following JSON request
+EXIT_CODE: struct.Struct = struct.Struct("!i")
+PEER_CREDENTIALS: struct.Struct = struct.Struct("3i")  # pid, uid and gid of the forwarding process
+REAP_INTERVAL: float = 1.0  # interval in seconds in which the agent reaps terminated child processes
+PRELOADED_MODULES: List[str] = [
+    "homcc.client.main",
+    "homcc.client.parsing",
+    "homcc.client.compilation",
+    # modules that are only imported lazily once an invocation compiles remotely
+    "asyncio",
+    "sqlite3",
+    "lzma",
+    "lzo",
+    "homcc.common.hashing",
+    "homcc.common.messages",
+    "homcc.client.cache",
+    "homcc.client.client",
+    "homcc.client.include_scanner",
+]
+
+
+def default_agent_socket_path() -> Path:
+    """Path of the agent socket, e.g. ~/.homcc/agent.sock"""
+    if homcc_dir_env_var := os.getenv(HOMCC_DIR_ENV_VAR):
+        return Path(homcc_dir_env_var) / AGENT_SOCKET_FILENAME
+
+    return Path.home() / ".homcc" / AGENT_SOCKET_FILENAME
+
+
+def _receive_exactly(connection: socket.socket, size: int) -> Optional[bytes]:
+    """receive exactly size bytes, return None if the connection was closed before"""
+    data: bytearray = bytearray()
+
+    while len(data) < size:
+        if not (chunk := connection.recv(size - len(data))):
+            return None
+        data += chunk
+
+    return bytes(data)
+
+
+def forward_to_agent(argv: List[str], socket_path: Optional[Path] = None) -> Optional[int]:
+    """
+    Forward the homcc invocation with the given argv to a running agent and return its exit code. If no agent is
+    available, return None so that the caller can run the invocation itself.
+    """
+    socket_path = socket_path or default_agent_socket_path()
+
+    if not socket_path.exists():
+        return None
+
+    request: bytes = json.dumps({"argv": argv, "cwd": os.getcwd(), "environment": dict(os.environ)}).encode()
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as agent_socket:
+        try:
+            agent_socket.connect(str(socket_path))
+            socket.send_fds(agent_socket, [REQUEST_HEADER.pack(len(request))], FORWARDED_FDS)
+            agent_socket.sendall(request)
+        except OSError:
+            # stale socket of an agent that is not running anymore
+            return None
+
+        # the invocation may already have produced output, it therefore must not be repeated if the agent fails
+        if (exit_code := _receive_exactly(agent_socket, EXIT_CODE.size)) is None:
+            print("homcc: the homcc agent terminated unexpectedly", file=sys.stderr)
+            return os.EX_SOFTWARE
+
+        return EXIT_CODE.unpack(exit_code)[0]
+
+
+def _terminate_on_disconnect(connection: socket.socket):
+    """terminate the invocation and all processes it started once the forwarding process is gone, e.g. on Ctrl+C"""
+    try:
+        connection.recv(1)
+    except OSError:
+        pass
+
+    os.killpg(0, signal.SIGTERM)
+
+
+def _run_client() -> int:
+    """run the regular homcc client and return its exit code"""
+    try:
+        importlib.import_module("homcc.client.main").run()
+    except SystemExit as sys_exit:
+        if sys_exit.code is None or isinstance(sys_exit.code, int):
+            return sys_exit.code or 0
+
+        print(sys_exit.code, file=sys.stderr)
+        return 1
+    except BaseException:  # pylint: disable=broad-except
+        traceback.print_exc()
+        return 1
+
+    return 0
+
+
+def _serve_invocation(connection: socket.socket) -> int:
+    """receive a forwarded invocation and run it in place of the forwarding process, return its exit code"""
+    _, uid, _ = PEER_CREDENTIALS.unpack(
+        connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, PEER_CREDENTIALS.size)
+    )
+
+    if uid != os.getuid():
+        logger.error("Rejecting invocation of foreign user %i.", uid)
+        return os.EX_NOPERM
+
+    header, fds, _, _ = socket.recv_fds(connection, REQUEST_HEADER.size, len(FORWARDED_FDS))
+
+    if len(header) != REQUEST_HEADER.size or len(fds) != len(FORWARDED_FDS):
+        logger.error("Rejecting malformed invocation.")
+        return os.EX_PROTOCOL
+
+    if (request_bytes := _receive_exactly(connection, REQUEST_HEADER.unpack(header)[0])) is None:
+        logger.error("Rejecting incomplete invocation.")
+        return os.EX_PROTOCOL
+
+    request: Dict[str, Any] = json.loads(request_bytes)
+
+    # take over the standard streams, working directory, environment and arguments of the forwarding process
+    for target_fd, fd in zip(FORWARDED_FDS, fds):
+        os.dup2(fd, target_fd)
+        os.close(fd)
+
+    logging.getLogger().handlers.clear()
+    os.environ.clear()
+    os.environ.update(request["environment"])
+    sys.argv = request["argv"]
+
+    try:
+        os.chdir(request["cwd"])
+    except OSError as error:
+        print(f"homcc: {error}", file=sys.stderr)
+        exit_code: int = os.EX_OSERR
+    else:
+        threading.Thread(target=_terminate_on_disconnect, args=(connection,), daemon=True).start()
+        exit_code = _run_client()
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    connection.sendall(EXIT_CODE.pack(exit_code))
+
+    return exit_code
+
+
+def _reap_children():
+    """reap all terminated child processes without blocking"""
+    try:
+        while os.waitpid(-1, os.WNOHANG)[0] != 0:
+            pass
+    except ChildProcessError:
+        pass
+
+
+def _preload_modules():
+    """import all modules of the client once, so that forked children do not need to import them again"""
+    for module in PRELOADED_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError as error:
+            logger.debug("Could not preload module '%s': %s", module, error)
+
+
+def serve(socket_path: Path):
+    """Serve forwarded homcc invocations on the given socket path until the agent is terminated."""
+    _preload_modules()
+
+    socket_path.parent.mkdir(exist_ok=True, parents=True)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+        try:
+            listener.connect(str(socket_path))
+        except OSError:
+            socket_path.unlink(missing_ok=True)  # remove the stale socket of a previous agent
+        else:
+            raise SystemExit(f"homcc agent is already running on '{socket_path}'")
+
+    def signal_handler(*_):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+        # the socket is only published once it is listening, invocations would otherwise consider it to be stale
+        unpublished_socket_path: Path = socket_path.with_name(f".{socket_path.name}.{os.getpid()}")
+        unpublished_socket_path.unlink(missing_ok=True)
+        listener.bind(str(unpublished_socket_path))
+        unpublished_socket_path.chmod(0o600)
+        listener.listen(socket.SOMAXCONN)
+        listener.settimeout(REAP_INTERVAL)
+        unpublished_socket_path.rename(socket_path)
+        logger.info("homcc agent is listening on '%s'.", socket_path)
+
+        try:
+            while True:
+                _reap_children()
+
+                try:
+                    connection, _ = listener.accept()
+                except socket.timeout:
+                    continue
+
+                with connection:
+                    if os.fork() == 0:
+                        exit_code: int = os.EX_SOFTWARE
+
+                        try:
+                            os.setpgid(0, 0)
+                            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                            signal.signal(signal.SIGINT, signal.default_int_handler)
+                            listener.close()
+                            exit_code = _serve_invocation(connection)
+                        finally:
+                            os._exit(exit_code)  # pylint: disable=protected-access
+        finally:
+            socket_path.unlink(missing_ok=True)
+            logger.info("homcc agent stopped.")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Long-lived agent which serves homcc invocations to avoid the startup of a new homcc client for "
+        "each compiler invocation. homcc invocations automatically use the agent while it is running.",
+    )
+    parser.add_argument("--verbose", action="store_true", help="enable a verbose mode which implies detailed logging")
+    args = parser.parse_args()
+
+    from homcc.common.logging import (  # pylint: disable=import-outside-toplevel
+        Formatter,
+        FormatterConfig,
+        FormatterDestination,
+        LoggingConfig,
+        LogLevel,
+        setup_logging,
+    )
+
+    logging_config: LoggingConfig = LoggingConfig(
+        config=FormatterConfig.COLORED,
+        formatter=Formatter.CLIENT,
+        destination=FormatterDestination.STREAM,
+        level=LogLevel.INFO,
+    )
+
+    if args.verbose:
+        logging_config.set_verbose()
+
+    setup_logging(logging_config)
+    serve(default_agent_socket_path())
+
+
+if __name__ == "__main__":
+    main()
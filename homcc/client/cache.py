@@ -0,0 +1,461 @@
+# Copyright (c) 2023 Celonis SE
+# Covered under the included MIT License:
+#   https://github.com/celonis/homcc/blob/main/LICENSE
+
+"""
+Persistent cache of the homcc client which is shared by all concurrently running homcc processes of a user
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from stat import S_ISDIR
+from typing import Any, ClassVar, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from homcc.common.arguments import Compiler
+from homcc.common.hashing import hash_files_with_paths
+from homcc.common.parsing import HOMCC_DIR_ENV_VAR
+
+logger = logging.getLogger(__name__)
+
+
+def stat_fingerprint(stat: os.stat_result) -> Tuple[int, int, int]:
+    """Inode, size and mtime of a stat result which identify the version of a file or directory"""
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+BUILD_OUTPUT_SUFFIXES: Tuple[str, ...] = (".o", ".obj", ".d")
+"""Suffixes of files that compilations commonly write next to their sources and which are never included."""
+
+
+def directory_fingerprint(path: str) -> str:
+    """Hash of the names of all entries of the directory at the given path except for build outputs"""
+    names: List[str] = sorted(name for name in os.listdir(path) if not name.endswith(BUILD_OUTPUT_SUFFIXES))
+    return hashlib.sha1("\0".join(names).encode()).hexdigest()
+
+
+def fingerprint(path: str) -> Optional[Union[Tuple[int, int, int], str]]:
+    """
+    Fingerprint of the file or directory at the given path, None if there is none. Directories are identified by the
+    names of their entries instead of their mtimes, as the latter change whenever a build output is written to them.
+    """
+    try:
+        path_stat: os.stat_result = os.stat(path)
+        return directory_fingerprint(path) if S_ISDIR(path_stat.st_mode) else stat_fingerprint(path_stat)
+    except OSError:
+        return None
+
+
+def compiler_fingerprint(compiler: Compiler) -> Optional[Tuple[str, int, int]]:
+    """Resolved path, size and mtime of the compiler executable, None if it can not be found"""
+    if (compiler_path := shutil.which(str(compiler))) is None:
+        return None
+
+    compiler_path = os.path.realpath(compiler_path)
+    compiler_stat: os.stat_result = os.stat(compiler_path)
+
+    return compiler_path, compiler_stat.st_size, compiler_stat.st_mtime_ns
+
+
+@dataclass
+class HostStatistics:
+    """Exponentially weighted moving averages and recent turnarounds of remote compilation requests to a single host"""
+
+    connect_time: Optional[float]
+    """Time in seconds to establish a connection, None if no connection was established yet."""
+    turnaround: Optional[float]
+    """Time in seconds from sending the compilation request until receiving its result, None if no result was
+    received yet."""
+    cache_hit_ratio: Optional[float]
+    """Ratio of dependencies that were already cached on the host, None if no dependencies were sent yet."""
+    refusal_rate: float
+    """Ratio of requests that the host refused or failed to serve."""
+    updated: float
+    """Time of the most recent request as seconds since the epoch."""
+    recent_turnarounds: List[float] = field(default_factory=list)
+    """Most recent turnarounds in seconds, from which high percentiles of the turnaround distribution are estimated."""
+
+
+def default_cache_path() -> Path:
+    """Path of the client cache database, e.g. ~/.homcc/cache.db"""
+    if homcc_dir_env_var := os.getenv(HOMCC_DIR_ENV_VAR):
+        return Path(homcc_dir_env_var) / ClientCache.FILENAME
+
+    return Path.home() / ".homcc" / ClientCache.FILENAME
+
+
+class ClientCache:
+    """
+    SQLite based cache to persist results across homcc client processes.
+
+    Concurrent access by many client processes (e.g. via "make -j64") is handled by SQLite itself: the database runs in
+    WAL mode so that readers never block, while writers wait for each other up to BUSY_TIMEOUT. Since all entries can
+    be recomputed, failing to access the cache is never fatal and callers may simply fall back to uncached behavior.
+    """
+
+    FILENAME: ClassVar[str] = "cache.db"
+    """Filename of the cache database."""
+    BUSY_TIMEOUT: ClassVar[float] = 5
+    """Time in seconds to wait for concurrent writers before giving up on a cache access."""
+    RACY_MTIME_NS: ClassVar[int] = 2_000_000_000
+    """Files modified more recently than this are not cached, as a coarse mtime granularity may hide further writes."""
+    MAX_QUERY_PARAMETERS: ClassVar[int] = 500
+    """Upper bound of parameters per query, older SQLite versions limit them to 999."""
+    TABLES: ClassVar[List[str]] = [
+        "file_hashes (path TEXT PRIMARY KEY, inode INTEGER NOT NULL, size INTEGER NOT NULL, "
+        "mtime_ns INTEGER NOT NULL, sha1sum TEXT NOT NULL)",
+        "dependency_manifests (key TEXT PRIMARY KEY, dependency_result TEXT NOT NULL, fingerprints TEXT NOT NULL)",
+        "header_includes (path TEXT PRIMARY KEY, inode INTEGER NOT NULL, size INTEGER NOT NULL, "
+        "mtime_ns INTEGER NOT NULL, includes TEXT NOT NULL)",
+        "memos (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+        "host_statistics (host TEXT PRIMARY KEY, connect_time REAL, turnaround REAL, cache_hit_ratio REAL, "
+        "refusal_rate REAL NOT NULL, updated REAL NOT NULL)",
+        "host_turnarounds (host TEXT NOT NULL, recorded REAL NOT NULL, turnaround REAL NOT NULL, "
+        "PRIMARY KEY (host, recorded))",
+        "host_breakers (host TEXT PRIMARY KEY, failures INTEGER NOT NULL, open_until REAL NOT NULL, "
+        "probe_until REAL NOT NULL)",
+    ]
+    """Definitions of all cache tables."""
+    HOST_STATISTICS_SMOOTHING: ClassVar[float] = 0.3
+    """Weight of the most recent request in the moving averages of host statistics."""
+    HOST_TURNAROUND_SAMPLES: ClassVar[int] = 100
+    """Number of the most recent turnarounds kept per host."""
+    HOST_BREAKER_COOLDOWN: ClassVar[float] = 1
+    """Time in seconds for which requests to a host are suspended after a failed request, doubled for each further
+    consecutive failure."""
+    HOST_BREAKER_MAX_COOLDOWN: ClassVar[float] = 60
+    """Upper bound of the time in seconds for which requests to a host are suspended."""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path: Path = path or default_cache_path()
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+
+        self.connection: sqlite3.Connection = sqlite3.connect(self.path, timeout=self.BUSY_TIMEOUT)
+
+        try:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self._create_tables()
+        except sqlite3.Error:
+            self.connection.close()
+            raise
+
+    def _create_tables(self):
+        existing_tables: Set[str] = {
+            name for (name,) in self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+
+        if all(table.split(" ", 1)[0] in existing_tables for table in self.TABLES):
+            return
+
+        # the write lock is acquired before the schema is read, as a concurrent process creating the tables in between
+        # would otherwise fail the upgrade of the read to a write transaction right away instead of waiting for it
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+
+            for table in self.TABLES:
+                self.connection.execute(f"CREATE TABLE IF NOT EXISTS {table} WITHOUT ROWID")
+
+    def __enter__(self) -> ClientCache:
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _select_fingerprinted(
+        self, table: str, value_column: str, fingerprints: Dict[str, Tuple[int, int, int]]
+    ) -> Dict[str, Any]:
+        """select the stored values of all paths whose fingerprints are unchanged"""
+        values: Dict[str, Any] = {}
+        paths: List[str] = list(fingerprints)
+
+        try:
+            for offset in range(0, len(paths), self.MAX_QUERY_PARAMETERS):
+                chunk: List[str] = paths[offset : offset + self.MAX_QUERY_PARAMETERS]
+                query: str = (
+                    f"SELECT path, inode, size, mtime_ns, {value_column} FROM {table} "
+                    f"WHERE path IN ({', '.join('?' * len(chunk))})"
+                )
+
+                for path, inode, size, mtime_ns, value in self.connection.execute(query, chunk):
+                    if (inode, size, mtime_ns) == fingerprints[path]:
+                        values[path] = value
+        except sqlite3.Error as error:
+            logger.debug("Could not read from '%s' of the client cache '%s': %s", table, self.path, error)
+            return {}
+
+        return values
+
+    def _insert_fingerprinted(self, table: str, fingerprints: Dict[str, Tuple[int, int, int]], values: Dict[str, Any]):
+        """insert the values of all paths together with their fingerprints, skipping recently modified paths"""
+        racy_mtime_ns: int = time.time_ns() - self.RACY_MTIME_NS
+        rows: List[Tuple[Any, ...]] = [
+            (path, *fingerprints[path], value)
+            for path, value in values.items()
+            if fingerprints[path][2] < racy_mtime_ns
+        ]
+
+        if not rows:
+            return
+
+        try:
+            with self.connection:
+                self.connection.executemany(f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?)", rows)
+        except sqlite3.Error as error:
+            logger.debug("Could not write to '%s' of the client cache '%s': %s", table, self.path, error)
+
+    def hash_files(self, paths: Iterable[str]) -> Dict[str, str]:
+        """
+        Hash all files at the given paths. Hashes of files whose path, inode, size and mtime did not change since they
+        were last hashed are taken from the cache, all other files are hashed and their hashes stored in the cache.
+        """
+        fingerprints: Dict[str, Tuple[int, int, int]] = {path: stat_fingerprint(os.stat(path)) for path in paths}
+        hashes: Dict[str, str] = self._select_fingerprinted("file_hashes", "sha1sum", fingerprints)
+
+        new_hashes: Dict[str, str] = hash_files_with_paths(path for path in fingerprints if path not in hashes)
+        self._insert_fingerprinted("file_hashes", fingerprints, new_hashes)
+        hashes.update(new_hashes)
+
+        return hashes
+
+    def get_header_includes(self, fingerprints: Dict[str, Tuple[int, int, int]]) -> Dict[str, str]:
+        """Return the serialized include directives of all headers whose fingerprints are unchanged."""
+        return self._select_fingerprinted("header_includes", "includes", fingerprints)
+
+    def put_header_includes(self, fingerprints: Dict[str, Tuple[int, int, int]], includes: Dict[str, str]):
+        """Store the serialized include directives of headers with the given fingerprints."""
+        self._insert_fingerprinted("header_includes", fingerprints, includes)
+
+    def get_memo(self, key: str) -> Optional[str]:
+        """Return the value memoized for the given key, if any."""
+        try:
+            row: Optional[Tuple[str]] = self.connection.execute(
+                "SELECT value FROM memos WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as error:
+            logger.debug("Could not read memo from the client cache '%s': %s", self.path, error)
+            return None
+
+        return None if row is None else row[0]
+
+    def put_memo(self, key: str, value: str):
+        """Memoize the value for the given key, the key must cover everything the value depends on."""
+        try:
+            with self.connection:
+                self.connection.execute("INSERT OR REPLACE INTO memos VALUES (?, ?)", (key, value))
+        except sqlite3.Error as error:
+            logger.debug("Could not write memo to the client cache '%s': %s", self.path, error)
+
+    def get_host_statistics(self, hosts: Iterable[str]) -> Dict[str, HostStatistics]:
+        """Return the statistics of all given hosts to which requests were sent before."""
+        hosts = list(hosts)
+
+        try:
+            rows: List[Tuple[Any, ...]] = self.connection.execute(
+                f"SELECT * FROM host_statistics WHERE host IN ({', '.join('?' * len(hosts))})", hosts
+            ).fetchall()
+        except sqlite3.Error as error:
+            logger.debug("Could not read host statistics from the client cache '%s': %s", self.path, error)
+            return {}
+
+        statistics: Dict[str, HostStatistics] = {host: HostStatistics(*statistics) for host, *statistics in rows}
+
+        try:
+            for host, turnaround in self.connection.execute(
+                f"SELECT host, turnaround FROM host_turnarounds WHERE host IN ({', '.join('?' * len(hosts))}) "
+                "ORDER BY recorded",
+                hosts,
+            ):
+                if host in statistics:
+                    statistics[host].recent_turnarounds.append(turnaround)
+        except sqlite3.Error as error:
+            logger.debug("Could not read host turnarounds from the client cache '%s': %s", self.path, error)
+
+        return statistics
+
+    def record_host_request(
+        self,
+        host: str,
+        *,
+        refused: bool,
+        connect_time: Optional[float] = None,
+        turnaround: Optional[float] = None,
+        cache_hit_ratio: Optional[float] = None,
+    ):
+        """
+        Fold a request to the given host into its moving averages and recent turnarounds. Measurements that are None,
+        e.g. the turnaround of a refused request, leave their averages unchanged. Updates are atomic, so that
+        concurrent homcc processes never lose each other's requests.
+        """
+
+        def moving_average(column: str) -> str:
+            return (
+                f"{column} = CASE WHEN excluded.{column} IS NULL THEN {column} WHEN {column} IS NULL THEN "
+                f"excluded.{column} ELSE {column} + :smoothing * (excluded.{column} - {column}) END"
+            )
+
+        averaged_columns: List[str] = ["connect_time", "turnaround", "cache_hit_ratio", "refusal_rate"]
+        now: float = time.time()
+
+        try:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT INTO host_statistics VALUES "
+                    "(:host, :connect_time, :turnaround, :cache_hit_ratio, :refusal_rate, :updated) "
+                    "ON CONFLICT (host) DO UPDATE SET "
+                    f"{', '.join(map(moving_average, averaged_columns))}, "
+                    "updated = excluded.updated",
+                    {
+                        "host": host,
+                        "connect_time": connect_time,
+                        "turnaround": turnaround,
+                        "cache_hit_ratio": cache_hit_ratio,
+                        "refusal_rate": float(refused),
+                        "updated": now,
+                        "smoothing": self.HOST_STATISTICS_SMOOTHING,
+                    },
+                )
+
+                if turnaround is not None:
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO host_turnarounds VALUES (?, ?, ?)", (host, now, turnaround)
+                    )
+                    self.connection.execute(
+                        "DELETE FROM host_turnarounds WHERE host = :host AND recorded < (SELECT recorded FROM "
+                        "host_turnarounds WHERE host = :host ORDER BY recorded DESC LIMIT 1 OFFSET :samples)",
+                        {"host": host, "samples": self.HOST_TURNAROUND_SAMPLES - 1},
+                    )
+        except sqlite3.Error as error:
+            logger.debug("Could not write host statistics to the client cache '%s': %s", self.path, error)
+
+    def get_unavailable_hosts(self, hosts: Iterable[str], probe_timeout: float) -> Set[str]:
+        """
+        Return all given hosts whose circuit breaker is open, i.e. to which requests are suspended due to recent
+        failures. Once the cooldown of a breaker expired, it is half-open: a single caller claims the host to probe it
+        for up to probe_timeout seconds, while the host remains unavailable for everyone else until the probe either
+        succeeded and closed the breaker, failed and reopened it, or timed out.
+        """
+        hosts = list(hosts)
+        unavailable_hosts: Set[str] = set()
+        now: float = time.time()
+
+        try:
+            rows: List[Tuple[str, float, float]] = self.connection.execute(
+                "SELECT host, open_until, probe_until FROM host_breakers "
+                f"WHERE host IN ({', '.join('?' * len(hosts))})",
+                hosts,
+            ).fetchall()
+
+            for host, open_until, probe_until in rows:
+                if open_until > now or probe_until > now:
+                    unavailable_hosts.add(host)
+                    continue
+
+                # claim the probe of the half-open breaker, unless a concurrent homcc process was faster
+                with self.connection:
+                    claimed: bool = (
+                        self.connection.execute(
+                            "UPDATE host_breakers SET probe_until = ? WHERE host = ? AND probe_until <= ?",
+                            (now + probe_timeout, host, now),
+                        ).rowcount
+                        == 1
+                    )
+
+                if claimed:
+                    logger.debug("Probing host '%s' as its circuit breaker is half-open.", host)
+                else:
+                    unavailable_hosts.add(host)
+        except sqlite3.Error as error:
+            logger.debug("Could not read host circuit breakers from the client cache '%s': %s", self.path, error)
+
+        return unavailable_hosts
+
+    def record_host_breaker(self, host: str, *, failed: bool):
+        """
+        Close the circuit breaker of the host after a successful request or open it after a failed one. The cooldown
+        doubles with each consecutive failure, failures of requests that started before the breaker opened, e.g. of
+        concurrent homcc processes, do not prolong it.
+        """
+        try:
+            with self.connection:
+                if not failed:
+                    self.connection.execute("DELETE FROM host_breakers WHERE host = ?", (host,))
+                    return
+
+                self.connection.execute(
+                    "INSERT INTO host_breakers VALUES (:host, 1, :now + :cooldown, 0) ON CONFLICT (host) DO UPDATE SET "
+                    "failures = failures + 1, open_until = :now + MIN(:cooldown * (1 << MIN(failures, 16)), "
+                    ":max_cooldown), probe_until = 0 WHERE open_until <= :now",
+                    {
+                        "host": host,
+                        "now": time.time(),
+                        "cooldown": self.HOST_BREAKER_COOLDOWN,
+                        "max_cooldown": self.HOST_BREAKER_MAX_COOLDOWN,
+                    },
+                )
+        except sqlite3.Error as error:
+            logger.debug("Could not write host circuit breaker to the client cache '%s': %s", self.path, error)
+
+    def get_dependency_manifest(self, key: str) -> Optional[str]:
+        """
+        Return the dependency finding result stored for the given key if none of the files and directories it was
+        recorded with changed since, otherwise return None.
+        """
+        try:
+            row: Optional[Tuple[str, str]] = self.connection.execute(
+                "SELECT dependency_result, fingerprints FROM dependency_manifests WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as error:
+            logger.debug("Could not read dependency manifest from the client cache '%s': %s", self.path, error)
+            return None
+
+        if row is None:
+            return None
+
+        dependency_result, fingerprints = row
+
+        for path, recorded_fingerprint in json.loads(fingerprints).items():
+            if isinstance(recorded_fingerprint, list):
+                recorded_fingerprint = tuple(recorded_fingerprint)  # file fingerprints are stored as JSON arrays
+
+            if fingerprint(path) != recorded_fingerprint:
+                logger.debug("Dependency manifest '%s' is outdated due to changes of '%s'.", key, path)
+                return None
+
+        return dependency_result
+
+    def put_dependency_manifest(self, key: str, dependency_result: str, paths: Iterable[str]):
+        """
+        Store the dependency finding result for the given key together with fingerprints of all files and directories
+        at the given paths which it depends on. Results depending on recently modified files are not stored.
+        """
+        fingerprints: Dict[str, Optional[Union[Tuple[int, int, int], str]]] = {
+            path: fingerprint(path) for path in paths
+        }
+        racy_mtime_ns: int = time.time_ns() - self.RACY_MTIME_NS
+
+        if any(
+            isinstance(path_fingerprint, tuple) and path_fingerprint[2] >= racy_mtime_ns
+            for path_fingerprint in fingerprints.values()
+        ):
+            logger.debug("Not storing dependency manifest '%s' as it depends on recently modified files.", key)
+            return
+
+        try:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO dependency_manifests VALUES (?, ?, ?)",
+                    (key, dependency_result, json.dumps(fingerprints)),
+                )
+        except sqlite3.Error as error:
+            logger.debug("Could not write dependency manifest to the client cache '%s': %s", self.path, error)
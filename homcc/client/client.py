@@ -10,17 +10,15 @@ from __future__ import annotations
 import asyncio
 import logging
 import random
-import signal
 import socket
-import sys
 import time
-import types
-from abc import ABC, abstractmethod
+from collections import deque
 from pathlib import Path
-from typing import ClassVar, Dict, Iterator, List, Optional
-
-import sysv_ipc
+from statistics import median
+from typing import Deque, Dict, Iterator, List, Optional, Set
 
+from homcc.client.cache import HostStatistics
+from homcc.client.semaphores import RemoteHostSemaphore
 from homcc.common.arguments import Arguments
 from homcc.common.constants import TCP_BUFFER_SIZE
 from homcc.common.errors import (
@@ -31,29 +29,64 @@ from homcc.common.errors import (
     SlotsExhaustedError,
 )
 from homcc.common.host import ConnectionType, Host
-from homcc.common.messages import ArgumentMessage, DependencyReplyMessage, Message
+from homcc.common.messages import (
+    ArgumentMessage,
+    DependencyReplyMessage,
+    Message,
+    MessageDecoder,
+)
 from homcc.common.statefile import StateFile
 
 logger = logging.getLogger(__name__)
 
 
+def host_statistics_key(host: Host) -> str:
+    """Key under which the statistics of requests to a remote host are recorded"""
+    return f"{host.name}:{host.port}"
+
+
 class RemoteHostSelector:
     """
     Class to enable random but weighted host selection on a load balancing principle. Hosts with more capacity have a
     higher probability of being chosen for remote compilation. The selection policy is agnostic to the server job
     limit and only relies on the limit information provided on the client side via the host format. If parameter "tries"
     is not provided, a host will be randomly selected until all hosts are exhausted.
+
+    If statistics of recent requests are provided, hosts are additionally weighted by their estimated throughput, i.e.
+    their limit divided by the time a compilation request takes, which includes connecting to the host. Hosts that
+    refuse requests or cache fewer dependencies are less likely to be selected. Hosts without recent statistics are
+    assumed to perform like the median of all other hosts, so that they are still tried and their statistics recover.
+    Hosts that are known to be unavailable, e.g. due to their open circuit breaker, are skipped entirely.
     """
 
-    def __init__(self, hosts: List[Host], tries: Optional[int] = None):
+    STATISTICS_MAX_AGE: float = 600
+    """Time in seconds after which statistics of a host are outdated and therefore ignored."""
+    MIN_AVAILABILITY: float = 0.05
+    """Lower bound of the assumed ratio of served requests, so that refusing hosts are eventually retried."""
+
+    def __init__(
+        self,
+        hosts: List[Host],
+        tries: Optional[int] = None,
+        statistics: Optional[Dict[str, HostStatistics]] = None,
+        unavailable_hosts: Optional[Set[str]] = None,
+    ):
         if any(host.is_local() for host in hosts):
             raise ValueError("Selecting localhost is not permitted")
 
         if tries is not None and tries <= 0:
             raise ValueError(f"Amount of tries must be greater than 0, but was {tries}")
 
-        self._hosts: List[Host] = [host for host in hosts if host.limit > 0]
-        self._limits: List[int] = [host.limit for host in self._hosts]
+        unavailable_hosts = unavailable_hosts or set()
+
+        for host in hosts:
+            if host_statistics_key(host) in unavailable_hosts:
+                logger.debug("Skipping host '%s' as its circuit breaker is open.", host)
+
+        self._hosts: List[Host] = [
+            host for host in hosts if host.limit > 0 and host_statistics_key(host) not in unavailable_hosts
+        ]
+        self._weights: List[float] = self._get_weights(self._hosts, statistics or {})
 
         self._count: int = 0
         self._tries: Optional[int] = tries
@@ -69,205 +102,242 @@ class RemoteHostSelector:
             return self._get_random_host()
         raise StopIteration
 
+    @classmethod
+    def _get_weights(cls, hosts: List[Host], statistics: Dict[str, HostStatistics]) -> List[float]:
+        """weight hosts by their limit and, if available, by their recent statistics"""
+        now: float = time.time()
+        recent_statistics: List[Optional[HostStatistics]] = [
+            host_statistics
+            if (host_statistics := statistics.get(host_statistics_key(host))) is not None
+            and now - host_statistics.updated <= cls.STATISTICS_MAX_AGE
+            else None
+            for host in hosts
+        ]
+
+        def get_averages(attribute: str) -> List[float]:
+            """averages of all hosts, where unknown averages are substituted by the median of the known ones"""
+            averages: List[Optional[float]] = [
+                None if host_statistics is None else getattr(host_statistics, attribute)
+                for host_statistics in recent_statistics
+            ]
+            known_averages: List[float] = [average for average in averages if average is not None]
+            default: float = median(known_averages) if known_averages else 0
+
+            return [default if average is None else average for average in averages]
+
+        latencies: List[float] = [
+            connect_time + turnaround
+            for connect_time, turnaround in zip(get_averages("connect_time"), get_averages("turnaround"))
+        ]
+        weights: List[float] = []
+
+        for host, latency, cache_hit_ratio, host_statistics in zip(
+            hosts, latencies, get_averages("cache_hit_ratio"), recent_statistics
+        ):
+            availability: float = 1 if host_statistics is None else 1 - host_statistics.refusal_rate
+            weights.append(
+                host.limit
+                * max(availability, cls.MIN_AVAILABILITY)
+                * (1 + cache_hit_ratio)
+                / (latency if latency > 0 else 1)
+            )
+
+        return weights
+
     def _get_random_host(self) -> Host:
-        """return a random host where hosts with higher limits are more likely to be selected"""
+        """return a random host where hosts with higher weights are more likely to be selected"""
         self._count += 1
         if self._tries is not None and self._count > self._tries:
             raise RemoteHostsFailure(f"{self._tries} hosts refused the connection")
 
         # select one host and find its index
-        host: Host = random.choices(population=self._hosts, weights=self._limits, k=1)[0]
+        host: Host = random.choices(population=self._hosts, weights=self._weights, k=1)[0]
         index: int = self._hosts.index(host)
 
         # remove chosen host from being picked again
         del self._hosts[index]
-        del self._limits[index]
+        del self._weights[index]
 
         return host
 
 
-class HostSemaphore(ABC):
-    """
-    Abstract bass class to create and exit from semaphore contexts.
+class HostConnection:
+    """Connection attempt to a remote host, which occupies a slot of the host via its semaphore until it is exited"""
 
-    Inheriting classes only have to implement the context manager enter method.
-    """
+    host: Host
+    client: TCPClient
+    task: asyncio.Task
+    """Task that establishes the connection of the client."""
 
-    _semaphore: sysv_ipc.Semaphore
-    """SysV named semaphore to manage host slots between client processes."""
-    _host_limit: int
-    """Maximal semaphore value."""
+    def __init__(self, host: Host, timeout: float):
+        self.host = host
+        self._semaphore: RemoteHostSemaphore = RemoteHostSemaphore(host).__enter__()
+        self.client = TCPClient(host, timeout=timeout)
+        self.task = asyncio.ensure_future(self.client.connect())
 
-    def __init__(self, host: Host):
-        # signal handling to properly remove the semaphore
-        signal.signal(signal.SIGINT, self._handle_interrupt)
-        signal.signal(signal.SIGTERM, self._handle_termination)
+    def is_established(self) -> bool:
+        return self.task.done() and not self.task.cancelled() and self.task.exception() is None
 
-        self._semaphore_key = int(host)
-        self._host_limit = host.limit
+    def result(self) -> TCPClient:
+        """return the connected client or raise the error that occurred while connecting"""
+        self.task.result()
+        return self.client
 
-        self._create_semaphore()
-
-    def _create_semaphore(self):
-        """Create and set host id semaphore with host slot limit if not already existing"""
-        try:
-            self._semaphore = sysv_ipc.Semaphore(
-                key=self._semaphore_key, flags=sysv_ipc.IPC_CREX, initial_value=self._host_limit
-            )
-        except sysv_ipc.ExistentialError:
-            self._semaphore = sysv_ipc.Semaphore(key=self._semaphore_key)
-
-            # SysV semaphores are broken by design. To work around a race condition, this code is in place.
-            # See https://semanchuk.com/philip/sysv_ipc/#sem_init
-            while not self._semaphore.o_time:
-                time.sleep(0.1)
-
-    def _acquire(self, timeout: float):
-        try:
-            self._semaphore.acquire(timeout)
-        except sysv_ipc.ExistentialError:
-            logger.debug("Semaphore has been deleted while trying to acquire it. Recreating it again now.")
-            self._create_semaphore()
-            self._acquire(timeout)
-
-    def _handle_interrupt(self, _, frame):
-        self.__exit__()
-        logger.debug("SIGINT:\n%s", repr(frame))
-        sys.exit("Stopped by SIGINT signal")
-
-    def _handle_termination(self, _, frame):
-        self.__exit__()
-        logger.debug("SIGTERM:\n%s", repr(frame))
-        sys.exit("Stopped by SIGTERM signal")
-
-    def _clean_up(self):
-        if self._semaphore is not None:
-            try:
-                logger.debug("Exiting semaphore '%s' with value '%i'", self._semaphore.id, self._semaphore.value)
-
-                self._semaphore.release()
-
-                if self._semaphore.value == self._host_limit:
-                    # remove the semaphore from the system if no other process currently holds it
-                    self._semaphore.remove()
-            except sysv_ipc.ExistentialError:
-                pass
-
-            # prevent double release while receiving signal during normal context manager exit
-            self._semaphore = None  # type: ignore
-
-    @abstractmethod
-    def __enter__(self):
-        pass
+    def __enter__(self) -> HostConnection:
+        return self
 
     def __exit__(self, *_):
-        self._clean_up()
+        self.task.cancel()
+        self._semaphore.__exit__()
 
 
-class RemoteHostSemaphore(HostSemaphore):
+class HostConnector:
     """
-    Class to track remote compilation jobs via a SysV semaphore.
-
-    Each semaphore for a host is uniquely identified by host_id which includes the host name itself and ConnectionType
-    specific information like the port for TCP and the user for SSH connections. The semaphore will be acquired with a
-    non-blocking call and might therefore throw an exception on failure. This indicates that the current machine already
-    exhausts all slots of the specified host.
+    Class to connect to multiple candidate hosts of a RemoteHostSelector concurrently ("happy eyeballs"), so that slow
+    or unreachable hosts do not delay remote compilations. Connection attempts are started with a small stagger, or
+    right away once a previous attempt failed, and are iterated in the order in which they finished. Hosts whose slots
+    are exhausted are skipped, but if all attempts failed, the first slot that becomes free at any of them is used until
+    the given time to wait for slots has passed. Once a connection is chosen, the attempts that lost the race are
+    released, so that they do not occupy slots of their hosts while it is used, but their hosts are connected to again
+    if further connections are iterated. Attempts that were not iterated are cancelled or closed on exit.
     """
 
-    _host: Host
-    """Selected host."""
-
-    def __init__(self, host: Host):
-        if host.is_local():
-            raise ValueError(f"Invalid remote host: '{host}'")
+    CANDIDATES: int = 3
+    """Maximal amount of concurrent connection attempts."""
+    STAGGER: float = 0.1
+    """Time in seconds after which a further connection attempt is started if no attempt finished yet."""
+    SLOT_POLL_INTERVAL: float = 0.05
+    """Interval in seconds in which the slots of exhausted hosts are checked while waiting for one of them."""
+
+    def __init__(self, hosts: Iterator[Host], timeout: float, slot_wait: float = 0):
+        self._hosts: Iterator[Host] = hosts
+        self._timeout: float = timeout
+        self._exhausted: bool = False
+        self._pending: List[HostConnection] = []
+        self._finished: Deque[HostConnection] = deque()
+        self._exhausted_hosts: List[Host] = []
+        self._released_hosts: Deque[Host] = deque()
+        self._slot_deadline: float = time.monotonic() + slot_wait
+
+    def _has_candidates(self) -> bool:
+        return bool(self._released_hosts) or not self._exhausted
+
+    def _start_connection(self):
+        """start a connection attempt to the next host, hosts of released attempts first"""
+        while self._has_candidates():
+            host: Host
+
+            if self._released_hosts:
+                host = self._released_hosts.popleft()
+            else:
+                try:
+                    host = next(self._hosts)
+                except StopIteration:
+                    self._exhausted = True
+                    return
+                except RemoteHostsFailure as error:
+                    logger.debug("%s", error)
+                    self._exhausted = True
+                    return
 
-        self._host = host
-        super().__init__(host)
+            try:
+                self._pending.append(HostConnection(host, self._timeout))
+                return
+            except SlotsExhaustedError as error:
+                logger.debug("%s", error)
+                self._exhausted_hosts.append(host)
+
+    async def _wait_for_slot(self) -> bool:
+        """
+        wait until a slot of any host whose slots were exhausted is free and start a connection attempt to it, return
+        False if no slot became free before the deadline, the slot tables of multiple hosts can not be awaited jointly
+        and are therefore checked periodically
+        """
+        if self._exhausted_hosts and self._slot_deadline > time.monotonic():
+            logger.debug(
+                "Waiting up to %.1fs for a free slot at hosts '%s'.",
+                self._slot_deadline - time.monotonic(),
+                ", ".join(str(host) for host in self._exhausted_hosts),
+            )
 
-    def __enter__(self) -> RemoteHostSemaphore:
-        logger.debug("Entering semaphore '%s' with value '%i'", self._semaphore.id, self._semaphore.value)
-
-        try:
-            self._acquire(0)  # non-blocking acquisition
-        except sysv_ipc.BusyError as error:
-            raise SlotsExhaustedError(f"All compilation slots for host {self._host} are occupied.") from error
-        return self
+        while self._exhausted_hosts and (remaining := self._slot_deadline - time.monotonic()) > 0:
+            for host in self._exhausted_hosts:
+                try:
+                    self._pending.append(HostConnection(host, self._timeout))
+                except SlotsExhaustedError:
+                    continue
 
+                self._exhausted_hosts.remove(host)
+                return True
 
-class LocalHostSemaphore(HostSemaphore):
-    """
-    Class to track local jobs via an IPC semaphore.
-
-    In order to increase the chance of longer waiting requests to be chosen, an inverse exponential backoff
-    strategy is used, where newer requests have to wait longer and the timeout value increases exponentially. This
-    should increase the chance of keeping the general order of incoming requests as it is desired by build systems and
-    still allows for high throughput when localhost slots are not exhausted.
-    Due to the behaviour of this class, multiple semaphores may be created in a time period with multiple homcc calls if
-    localhost is specified with different limits. Each localhost semaphore blocks for the specified timeout amount in
-    seconds during acquisition. Adding multiple different or changing localhost hosts during builds with homcc will
-    currently lead to non-deterministic behaviour regarding the total amount of concurrent local compilation jobs.
-    """
+            await asyncio.sleep(min(self.SLOT_POLL_INTERVAL, remaining))
 
-    _expected_average_job_time: float
-    """Expected average operation time [s]."""
-    _timeout: float
-    """Timeout [s] after failing semaphore acquisition."""
+        return False
 
-    def __init__(self, host: Host, expected_average_job_time: float):
-        if not host.is_local():
-            raise ValueError(f"Invalid localhost: '{host}'")
+    def __aiter__(self) -> HostConnector:
+        return self
 
-        self._expected_average_job_time = expected_average_job_time
-        self._timeout = expected_average_job_time - 1
-        super().__init__(host)
+    async def __anext__(self) -> HostConnection:
+        while not self._finished:
+            if len(self._pending) < self.CANDIDATES:
+                self._start_connection()
 
-    def __enter__(self) -> LocalHostSemaphore:
-        logger.debug("Entering local semaphore '%s' with value '%i'", self._semaphore.id, self._semaphore.value)
+            # once there are no further candidates, wait for the first slot that becomes free at an exhausted host
+            if not self._pending and not await self._wait_for_slot():
+                raise StopAsyncIteration
 
-        while True:
-            try:
-                super()._acquire(self._expected_average_job_time - self._timeout)  # blocking acquisition
-                return self
-            except sysv_ipc.BusyError:
-                # inverse exponential backoff: https://www.desmos.com/calculator/uniats0s4c
-                time.sleep(self._timeout)
-                self._timeout = self._timeout / 3 * 2
+            # wait for the stagger only if a further attempt can be started afterwards
+            stagger: Optional[float] = (
+                self.STAGGER if len(self._pending) < self.CANDIDATES and self._has_candidates() else None
+            )
+            await asyncio.wait(
+                [connection.task for connection in self._pending], timeout=stagger, return_when=asyncio.FIRST_COMPLETED
+            )
 
+            self._finished.extend(connection for connection in self._pending if connection.task.done())
+            self._pending = [connection for connection in self._pending if not connection.task.done()]
 
-class LocalHostCompilationSemaphore(LocalHostSemaphore):
-    """
-    Tracks that we issue a certain maximum amount of concurrent compilation jobs on the local machine.
-    """
+        return self._finished.popleft()
 
-    DEFAULT_EXPECTED_COMPILATION_TIME: ClassVar[float] = 10.0
-    """Default average expected compilation time. [s]"""
+    async def release_unchosen(self):
+        """
+        cancel all pending connection attempts and close all established connections that were not iterated to free
+        their slots, failed attempts are kept to be iterated
+        """
+        failed: List[HostConnection] = []
 
-    def __init__(self, host: Host, expected_compilation_time: float = DEFAULT_EXPECTED_COMPILATION_TIME):
-        if expected_compilation_time <= 1.0:
-            raise ValueError(f"Invalid expected compilation time: {expected_compilation_time}")
+        for connection in [*self._pending, *self._finished]:
+            if connection.task.done() and not connection.is_established():
+                failed.append(connection)
+                continue
 
-        super().__init__(host, expected_compilation_time)
+            with connection:
+                if connection.is_established():
+                    await connection.client.__aexit__()
 
+            self._released_hosts.append(connection.host)
 
-class LocalHostPreprocessingSemaphore(LocalHostSemaphore):
-    """
-    Tracks that we issue a certain maximum amount of concurrent preprocessing jobs on the local machine.
-    """
+        self._pending.clear()
+        self._finished = deque(failed)
 
-    DEFAULT_EXPECTED_PREPROCESSING_TIME: ClassVar[float] = 2.0
-    """Default average expected preprocessing time. [s]"""
+    async def __aenter__(self) -> HostConnector:
+        return self
 
-    def __init__(self, host: Host, expected_preprocessing_time: float = DEFAULT_EXPECTED_PREPROCESSING_TIME):
-        if expected_preprocessing_time <= 1.0:
-            raise ValueError(f"Invalid expected preprocessing time: {expected_preprocessing_time}")
+    async def __aexit__(self, *_):
+        """cancel all pending connection attempts and close all established connections that were not iterated"""
+        for connection in [*self._pending, *self._finished]:
+            with connection:
+                if connection.is_established():
+                    await connection.client.__aexit__()
 
-        super().__init__(host, expected_preprocessing_time)
+        self._pending.clear()
+        self._finished.clear()
 
 
 class TCPClient:
     """Wrapper class to exchange homcc protocol messages via TCP"""
 
-    def __init__(self, host: Host, timeout: float, state: StateFile):
+    def __init__(self, host: Host, timeout: float, state: Optional[StateFile] = None):
         connection_type: ConnectionType = host.type
 
         if connection_type != ConnectionType.TCP:
@@ -278,16 +348,26 @@ class TCPClient:
         self.compression = host.compression
 
         self.timeout: float = timeout
+        self.connect_time: Optional[float] = None
 
-        self._data: bytes = bytes()
+        self._decoder: MessageDecoder = MessageDecoder()
         self._reader: asyncio.StreamReader
         self._writer: asyncio.StreamWriter
 
-        state.set_connect()
+        if state is not None:
+            state.set_connect()
 
     async def __aenter__(self) -> TCPClient:
+        """connect to specified server at host:port if the client is not connected yet"""
+        if self.connect_time is None:
+            await self.connect()
+
+        return self
+
+    async def connect(self):
         """connect to specified server at host:port"""
         logger.debug("Connecting to '%s:%i'.", self.host, self.port)
+        connect_start: float = time.monotonic()
         try:
             self._reader, self._writer = await asyncio.wait_for(
                 asyncio.open_connection(host=self.host, port=self.port, limit=TCP_BUFFER_SIZE),
@@ -298,7 +378,8 @@ class TCPClient:
             raise error from None
         except socket.gaierror as error:
             raise FailedHostNameResolutionError(f"Host {self.host} could not be resolved.") from error
-        return self
+
+        self.connect_time = time.monotonic() - connect_start
 
     async def __aexit__(self, *_):
         """disconnect from server and close client socket"""
@@ -314,7 +395,7 @@ class TCPClient:
     async def _send(self, message: Message):
         """send a message to homcc server"""
         logger.debug("Sending %s to '%s:%i':\n%s", message.message_type, self.host, self.port, message.get_json_str())
-        self._writer.write(message.to_bytes())
+        self._writer.writelines(message.to_buffers())
         await self._writer.drain()
 
     async def send_argument_message(
@@ -359,35 +440,20 @@ class TCPClient:
         content: bytearray = bytearray(Path(dependency).read_bytes())
         await self._send(DependencyReplyMessage(content, self.compression))
 
-    @types.coroutine
-    def check_timeout(self):
-        """Yield control to the event loop so that asyncio respects timeouts."""
-        yield
-
     async def receive(self) -> Message:
         """receive data from homcc server and convert it to Message"""
-        self._data += await self._reader.read(TCP_BUFFER_SIZE)
-        bytes_needed, parsed_message = Message.from_bytes(bytearray(self._data))
-
-        # if message is incomplete, continue reading from stream until no more bytes are missing
-        while bytes_needed > 0:
-            logger.debug("Message is incomplete by #%i bytes.", bytes_needed)
-            await self.check_timeout()
-            self._data += await self._reader.read(bytes_needed)
-            bytes_needed, parsed_message = Message.from_bytes(bytearray(self._data))
-
-        # manage internal buffer consistency
-        if bytes_needed == 0:
-            # reset the internal buffer
-            logger.debug("Resetting internal buffer.")
-            self._data = bytes()
-        elif bytes_needed < 0:
-            # remove the already parsed message
-            logger.debug("Additional data of #%i bytes in buffer.", abs(bytes_needed))
-            self._data = self._data[len(self._data) - abs(bytes_needed) :]
-
-        if not parsed_message:
-            raise ClientParsingError("Received data could not be parsed to a message!")
+        parsed_messages: List[Message] = []
+
+        # read exactly the missing parts of the message, so that no data of subsequent messages is consumed
+        while not parsed_messages:
+            try:
+                data: bytes = await self._reader.readexactly(self._decoder.bytes_needed())
+            except asyncio.IncompleteReadError as error:
+                raise ClientParsingError("Connection closed before the message was received completely!") from error
+
+            parsed_messages = self._decoder.feed(data)
+
+        parsed_message: Message = parsed_messages[0]
 
         logger.debug(
             "Received %s message from '%s:%i':\n%s",
@@ -5,21 +5,36 @@
 """fundamental compilation functions and classes for the homcc client"""
 from __future__ import annotations
 
-import asyncio
+import json
 import logging
+import math
 import os
 import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Optional, Set
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
-from homcc.client.client import (
+from homcc.client import __version__
+from homcc.client.config import ClientConfig
+from homcc.client.semaphores import (
     LocalHostCompilationSemaphore,
+    LocalHostHedgingSemaphore,
     LocalHostPreprocessingSemaphore,
-    RemoteHostSelector,
     RemoteHostSemaphore,
-    TCPClient,
 )
-from homcc.client.config import ClientConfig
 from homcc.common.arguments import Arguments, ArgumentsExecutionResult, Compiler
 from homcc.common.constants import ENCODING, EXCLUDED_DEPENDENCY_PREFIXES
 from homcc.common.errors import (
@@ -33,22 +48,113 @@ from homcc.common.errors import (
     TargetInferationError,
     UnexpectedMessageTypeError,
 )
-from homcc.common.hashing import hash_file_with_path
 from homcc.common.host import Host
-from homcc.common.messages import (
-    CompilationResultMessage,
-    ConnectionRefusedMessage,
-    DependencyRequestMessage,
-    File,
-    Message,
-)
 from homcc.common.shell_environment import HostShellEnvironment
 from homcc.common.statefile import StateFile
 
+if TYPE_CHECKING:
+    from asyncio import Task
+
+    from homcc.client.cache import HostStatistics
+    from homcc.client.client import RemoteHostSelector, TCPClient
+    from homcc.common.messages import File
+
+# Modules which are only required for remote compilations, e.g. networking, the client cache and the include scanner,
+# are imported by the functions using them. Local compilations and linking therefore do not pay for their import.
+# pylint: disable=import-outside-toplevel
+
 logger = logging.getLogger(__name__)
 
 RECURSIVE_ERROR_MESSAGE: str = "_HOMCC_CALLED_RECURSIVELY"
 
+HEDGING_QUANTILE: float = 0.95
+"""Quantile of the recent turnarounds of a host after which its request is hedged."""
+HEDGING_MIN_SAMPLES: int = 20
+"""Minimal number of recent turnarounds of a host to estimate the hedging quantile from."""
+HEDGING_DELAY_FACTOR: float = 3.0
+"""Multiple of the average turnaround of a host after which its request is hedged while too few turnarounds were
+recorded to estimate their quantile."""
+HEDGING_MIN_DELAY: float = 1.0
+"""Minimal time in seconds after which a request is hedged, avoids hedging short requests due to jitter."""
+
+
+@dataclass
+class RemoteRequestMeasurement:
+    """Measurements of a single remote compilation request which are recorded in the statistics of its host"""
+
+    connect_time: Optional[float] = None
+    """Time in seconds to connect to the host, None if no connection was established."""
+    turnaround: Optional[float] = None
+    """Time in seconds from sending the compilation request until receiving its result, None if no result arrived."""
+    cache_hit_ratio: Optional[float] = None
+    """Ratio of dependencies that the host did not request, None if there were no dependencies to request."""
+    superseded: bool = False
+    """Whether the request was cancelled because a hedged duplicate of it finished first."""
+
+
+class HedgedCompilation:
+    """
+    Race of a compilation against a duplicate which is only started if the compilation straggles, i.e. did not finish
+    after a delay. Both compilations have to claim the race before writing any results, so that only the first finished
+    compilation writes its results. The other one is cancelled afterwards.
+    """
+
+    delay: Optional[float]
+    """Time in seconds after which the duplicate is started, None disables hedging."""
+    winner: Optional[Task]
+    """Task of the compilation that claimed the race first."""
+
+    def __init__(self, delay: Optional[float]):
+        self.delay = delay
+        self.winner = None
+
+    def claim(self) -> bool:
+        """claim the race for the current task, return False if the other compilation already claimed it"""
+        import asyncio
+
+        if self.winner is None:
+            self.winner = asyncio.current_task()
+
+        return self.winner is asyncio.current_task()
+
+    def lost(self) -> bool:
+        """return whether the other compilation already claimed the race"""
+        import asyncio
+
+        return self.winner is not None and self.winner is not asyncio.current_task()
+
+    async def run(self, compilation: Awaitable[int], start_hedge: Callable[[], Awaitable[int]]) -> int:
+        """
+        run the compilation and start the hedge via start_hedge once it straggles, return the result of the claiming
+        compilation or raise the error of the compilation if none of them claimed the race
+        """
+        import asyncio
+
+        if self.delay is None:
+            return await compilation
+
+        tasks: List[asyncio.Future] = [asyncio.ensure_future(compilation)]
+
+        try:
+            if not (await asyncio.wait(tasks, timeout=self.delay))[0]:
+                logger.debug("Hedging compilation request after %.1fs.", self.delay)
+                tasks.append(asyncio.ensure_future(start_hedge()))
+
+            # failing hedges are ignored, the compilation itself may still finish
+            while (self.winner is None or not self.winner.done()) and not all(task.done() for task in tasks):
+                await asyncio.wait([task for task in tasks if not task.done()], return_when=asyncio.FIRST_COMPLETED)
+
+            if len(tasks) > 1 and tasks[1].done() and not tasks[1].cancelled() and tasks[1].exception() is not None:
+                logger.debug("Hedged compilation failed: %s", tasks[1].exception())
+
+            return (self.winner or tasks[0]).result()
+        finally:
+            # cancel the loser and wait until it released its slots
+            for task in tasks:
+                task.cancel()
+
+            await asyncio.gather(*tasks, return_exceptions=True)
+
 
 def check_recursive_call(compiler: Compiler, error: subprocess.CalledProcessError):
     """check if homcc was called recursively"""
@@ -57,62 +163,106 @@ def check_recursive_call(compiler: Compiler, error: subprocess.CalledProcessErro
         raise SystemExit(os.EX_USAGE) from error
 
 
-def _preprocess(arguments: Arguments, localhost: Host) -> Dict[str, str]:
+def _preprocess(arguments: Arguments, localhost: Host, config: ClientConfig) -> Dict[str, str]:
     with LocalHostPreprocessingSemaphore(localhost), StateFile(arguments, localhost) as state:
         state.set_preprocessing()
-        return calculate_dependency_dict(find_dependencies(arguments))
+        return calculate_dependency_dict(find_dependencies(arguments, config.include_scanner))
 
 
 async def compile_remotely(arguments: Arguments, hosts: List[Host], localhost: Host, config: ClientConfig) -> int:
     """main function to control remote compilation"""
+    import asyncio
+
+    from homcc.client.client import HostConnector, RemoteHostSelector
 
-    dependency_dict = _preprocess(arguments, localhost)
+    dependency_dict = _preprocess(arguments, localhost, config)
 
     # try to connect to remote hosts before falling back to local compilation and track which hosts we failed at
     failed_hosts: List[Host] = []
+    timed_out_hosts: List[Host] = []
 
-    for host in RemoteHostSelector(hosts, config.remote_compilation_tries):
-        # overwrite host compression if none was explicitly specified but provided via config
+    # overwrite host compression if none was explicitly specified but provided via config
+    for host in hosts:
         host.compression = host.compression or config.compression
 
-        try:
-            with RemoteHostSemaphore(host), StateFile(arguments, host) as state:
-                return await asyncio.wait_for(
-                    compile_remotely_at(
-                        arguments=arguments,
-                        dependency_dict=dependency_dict,
-                        host=host,
-                        timeout=config.establish_connection_timeout,
-                        schroot_profile=config.schroot_profile,
-                        docker_container=config.docker_container,
-                        state=state,
-                    ),
-                    timeout=config.compilation_request_timeout,
+    # the statistics of localhost stem from local fallback compilations
+    statistics, unavailable_hosts = _get_host_states([*hosts, localhost], config)
+    selector = RemoteHostSelector(hosts, config.remote_compilation_tries, statistics, unavailable_hosts)
+
+    # exhausted remote slots are only waited for as long as this is expected to be faster than compiling locally
+    slot_wait: float = get_remote_slot_wait(hosts, localhost, statistics) if config.wait_for_remote_slots else 0
+
+    # connect to multiple candidates concurrently and use the connections in the order in which they were established
+    async with HostConnector(selector, config.establish_connection_timeout, slot_wait) as connector:
+        async for connection in connector:
+            host = connection.host
+            measurement: Optional[RemoteRequestMeasurement] = None
+
+            try:
+                with connection, StateFile(arguments, host) as state:
+                    measurement = RemoteRequestMeasurement()
+                    client: TCPClient = connection.result()
+
+                    # the attempts that lost the race must not occupy slots of their hosts during the compilation
+                    await connector.release_unchosen()
+
+                    race = HedgedCompilation(get_hedging_delay(host, statistics) if config.hedging else None)
+
+                    # straggling requests are duplicated locally or at further hosts of the selector
+                    return await asyncio.wait_for(
+                        race.run(
+                            compile_remotely_at(
+                                arguments=arguments,
+                                dependency_dict=dependency_dict,
+                                host=host,
+                                timeout=config.establish_connection_timeout,
+                                schroot_profile=config.schroot_profile,
+                                docker_container=config.docker_container,
+                                state=state,
+                                measurement=measurement,
+                                race=race,
+                                client=client,
+                            ),
+                            partial(
+                                _hedge_compilation, arguments, dependency_dict, selector, localhost, config, state, race
+                            ),
+                        ),
+                        timeout=config.compilation_request_timeout,
+                    )
+
+            # compilation request timed out, retry with different host
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "Compilation request for %s at host '%s' timed out.", " ".join(arguments.source_files), host
                 )
+                timed_out_hosts.append(host)
 
-        # compilation request timed out, local compilation fallback
-        except asyncio.TimeoutError as error:
-            raise RemoteCompilationTimeoutError(
-                f"Compilation request for {' '.join(arguments.source_files)} at host '{host}' timed out."
-            ) from error
+            # client could not connect or lost connection, retry with different host
+            except FailedHostNameResolutionError:
+                logger.warning("Could not resolve host name of %s. Could be a DNS issue?", host.name)
+            except HostRefusedConnectionError as error:
+                logger.warning("%s", error)
+            except ConnectionError as error:
+                logger.warning("Lost connection to host %s due to '%s'", host.name, error)
 
-        # remote semaphore could not be acquired, retry with different host
-        except SlotsExhaustedError as error:
-            logger.debug("%s", error)
+            # host could not compile temporarily, retry with different host
+            except RetryableRemoteCompilationError as error:
+                logger.warning("Host %s could not compile temporarily:\n%s", host, error)
 
-        # client could not connect or lost connection, retry with different host
-        except FailedHostNameResolutionError:
-            logger.warning("Could not resolve host name of %s. Could be a DNS issue?", host.name)
-        except HostRefusedConnectionError as error:
-            logger.warning("%s", error)
-        except ConnectionError as error:
-            logger.warning("Lost connection to host %s due to '%s'", host.name, error)
+            # track all failing hosts
+            finally:
+                failed_hosts.append(host)
 
-        # track all failing hosts
-        finally:
-            failed_hosts.append(host)
+                if measurement is not None:
+                    _record_host_request(host, measurement)
 
     # all selected hosts failed, local compilation fallback
+    if failed_hosts and failed_hosts == timed_out_hosts:
+        raise RemoteCompilationTimeoutError(
+            f"Compilation request for {' '.join(arguments.source_files)} timed out at hosts: "
+            f"'{', '.join(str(host) for host in timed_out_hosts)}'."
+        )
+
     raise RemoteHostsFailure(
         f"Failed to compile {' '.join(arguments.source_files)} remotely on hosts: "
         f"'{', '.join(str(host) for host in failed_hosts)}'."
@@ -127,50 +277,105 @@ async def compile_remotely_at(
     schroot_profile: Optional[str],
     docker_container: Optional[str],
     state: StateFile,
+    measurement: Optional[RemoteRequestMeasurement] = None,
+    race: Optional[HedgedCompilation] = None,
+    client: Optional[TCPClient] = None,
 ) -> int:
-    """main function for the communication between client and a remote compilation host"""
+    """
+    main function for the communication between client and a remote compilation host, which either uses the given
+    already connected client or connects itself, results are only written if race is None or this request claims it,
+    i.e. if it won the race against a hedged duplicate of it
+    """
+    import asyncio
+
+    from homcc.client.client import TCPClient
+    from homcc.common.messages import (
+        CompilationResultMessage,
+        ConnectionRefusedMessage,
+        DependencyBatchRequestMessage,
+        DependencyRequestMessage,
+        Message,
+        QueuedMessage,
+    )
 
-    async with TCPClient(host, timeout=timeout, state=state) as client:
-        remote_arguments: Arguments = arguments.copy().remove_local_args()
+    measurement = measurement or RemoteRequestMeasurement()
 
-        target: Optional[str] = None
-        try:
-            target = arguments.get_compiler_target_triple(shell_env=HostShellEnvironment())
-        except TargetInferationError as err:
-            logger.warning(
-                "Could not get target architecture. Omitting passing explicit target to remote compilation host. "
-                "This may lead to unexpected results if the remote compilation host has a different architecture. %s",
-                err,
-            )
+    try:
+        async with client or TCPClient(host, timeout=timeout, state=state) as client:
+            measurement.connect_time = client.connect_time
+            remote_arguments: Arguments = arguments.copy().remove_local_args()
+
+            target: Optional[str] = None
+            try:
+                target = get_compiler_target_triple(arguments)
+            except TargetInferationError as err:
+                logger.warning(
+                    "Could not get target architecture. Omitting passing explicit target to remote compilation host. "
+                    "This may lead to unexpected results if the remote compilation host has a different architecture. "
+                    "%s",
+                    err,
+                )
 
-        # normalize compiler, e.g. /usr/bin/g++ -> g++
-        remote_arguments.normalize_compiler()
+            # normalize compiler, e.g. /usr/bin/g++ -> g++
+            remote_arguments.normalize_compiler()
 
-        state.set_compile()
+            state.set_compile()
+            request_start: float = time.monotonic()
 
-        await client.send_argument_message(
-            arguments=remote_arguments,
-            cwd=os.getcwd(),
-            dependency_dict=dependency_dict,
-            target=target,
-            schroot_profile=schroot_profile,
-            docker_container=docker_container,
-        )
-        host_response: Message = await client.receive()
-        if isinstance(host_response, ConnectionRefusedMessage):
-            raise HostRefusedConnectionError(
-                f"Host {client.host}:{client.port} refused the connection:\n{host_response.info}!"
+            await client.send_argument_message(
+                arguments=remote_arguments,
+                cwd=os.getcwd(),
+                dependency_dict=dependency_dict,
+                target=target,
+                schroot_profile=schroot_profile,
+                docker_container=docker_container,
             )
+            host_response: Message = await client.receive()
+            if isinstance(host_response, ConnectionRefusedMessage):
+                raise HostRefusedConnectionError(
+                    f"Host {client.host}:{client.port} refused the connection:\n{host_response.info}!"
+                )
+
+            # invert dependency dictionary to access dependencies via hash
+            dependency_dict = {file_hash: dependency for dependency, file_hash in dependency_dict.items()}
+
+            # provide requested dependencies, batched requests are answered back to back without awaiting further
+            # requests
+            requested_dependencies: int = 0
+
+            while isinstance(host_response, (DependencyRequestMessage, DependencyBatchRequestMessage, QueuedMessage)):
+                # hosts whose compilation slots are all occupied queue the compilation until one of them is free
+                if isinstance(host_response, QueuedMessage):
+                    logger.debug(
+                        "Compilation is queued at position %i on host %s:%i, estimated wait: %ss.",
+                        host_response.get_position(),
+                        client.host,
+                        client.port,
+                        "unknown" if (wait := host_response.get_estimated_wait()) is None else f"{wait:.1f}",
+                    )
+                    host_response = await client.receive()
+                    continue
+
+                requested_hashes: List[str] = (
+                    host_response.get_sha1sums()
+                    if isinstance(host_response, DependencyBatchRequestMessage)
+                    else [host_response.get_sha1sum()]
+                )
+
+                for requested_hash in requested_hashes:
+                    await client.send_dependency_reply_message(dependency_dict[requested_hash])
 
-        # invert dependency dictionary to access dependencies via hash
-        dependency_dict = {file_hash: dependency for dependency, file_hash in dependency_dict.items()}
+                requested_dependencies += len(requested_hashes)
+                host_response = await client.receive()
 
-        # provide requested dependencies
-        while isinstance(host_response, DependencyRequestMessage):
-            requested_dependency: str = dependency_dict[host_response.get_sha1sum()]
-            await client.send_dependency_reply_message(requested_dependency)
+            measurement.turnaround = time.monotonic() - request_start
 
-            host_response = await client.receive()
+            if dependency_dict:
+                measurement.cache_hit_ratio = max(1 - requested_dependencies / len(dependency_dict), 0)
+    except asyncio.CancelledError:
+        # requests cancelled for other reasons, e.g. by the compilation request timeout, still count as failed
+        measurement.superseded = race is not None and race.lost()
+        raise
 
     # extract and use compilation result if possible
     if not isinstance(host_response, CompilationResultMessage):
@@ -181,11 +386,17 @@ async def compile_remotely_at(
     if host_result.stdout:
         logger.debug("Host stdout:\n%s", host_result.stdout)
 
-    if host_result.return_code != os.EX_OK:
-        # check whether the compilation should be retried locally
-        if host_result.return_code == os.EX_TEMPFAIL:
-            raise RetryableRemoteCompilationError(host_result.stderr)
+    # check whether the compilation should be retried at another host or locally, e.g. as the compilation queue of the
+    # host timed out, the host then counts as having refused the request
+    if host_result.return_code == os.EX_TEMPFAIL:
+        measurement.turnaround = None
+        raise RetryableRemoteCompilationError(host_result.stderr)
 
+    # the result of a hedged request is discarded if its duplicate already finished
+    if race is not None and not race.claim():
+        raise asyncio.CancelledError
+
+    if host_result.return_code != os.EX_OK:
         raise RemoteCompilationError(
             f"Host stderr of {remote_arguments}:\n{host_result.stderr}",
             host_result.return_code,
@@ -208,6 +419,168 @@ async def compile_remotely_at(
     return os.EX_OK
 
 
+def get_compiler_target_triple(arguments: Arguments) -> str:
+    """
+    get the target triple of the compiler, which is memoized in the client cache per invoked compiler and executable as
+    it only changes together with them, e.g. clang derives the target from the name it was invoked with
+    """
+    import sqlite3
+
+    from homcc.client.cache import ClientCache, compiler_fingerprint
+
+    try:
+        if (compiler := compiler_fingerprint(arguments.compiler)) is not None:
+            memo_key: str = (
+                f"target_triple_{json.dumps([type(arguments.compiler).__name__, str(arguments.compiler), *compiler])}"
+            )
+
+            with ClientCache() as cache:
+                if (target := cache.get_memo(memo_key)) is None:
+                    target = arguments.get_compiler_target_triple(shell_env=HostShellEnvironment())
+                    cache.put_memo(memo_key, target)
+
+                return target
+    except (OSError, sqlite3.Error) as error:
+        logger.debug("Could not open the client cache, inferring the target triple of the compiler: %s", error)
+
+    return arguments.get_compiler_target_triple(shell_env=HostShellEnvironment())
+
+
+def get_hedging_delay(host: Host, statistics: Dict[str, HostStatistics]) -> Optional[float]:
+    """
+    get the time after which a request to the host straggles and is therefore hedged, None if the host has no recorded
+    turnarounds yet
+    """
+    from homcc.client.client import host_statistics_key
+
+    if (host_statistics := statistics.get(host_statistics_key(host))) is None or host_statistics.turnaround is None:
+        return None
+
+    turnarounds: List[float] = sorted(host_statistics.recent_turnarounds)
+
+    if len(turnarounds) < HEDGING_MIN_SAMPLES:
+        return max(HEDGING_DELAY_FACTOR * host_statistics.turnaround, HEDGING_MIN_DELAY)
+
+    # nearest-rank quantile
+    return max(turnarounds[math.ceil(HEDGING_QUANTILE * len(turnarounds)) - 1], HEDGING_MIN_DELAY)
+
+
+def get_remote_slot_wait(hosts: List[Host], localhost: Host, statistics: Dict[str, HostStatistics]) -> float:
+    """
+    get the time for which waiting for a free slot at the remote hosts is still expected to be faster than compiling
+    locally, i.e. the expected local compilation time minus the latency of the fastest remote host, 0 if none of the
+    hosts has recorded turnarounds yet
+    """
+    from homcc.client.client import host_statistics_key
+
+    latencies: List[float] = [
+        (host_statistics.connect_time or 0) + host_statistics.turnaround
+        for host in hosts
+        if (host_statistics := statistics.get(host_statistics_key(host))) is not None
+        and host_statistics.turnaround is not None
+    ]
+
+    if not latencies:
+        return 0
+
+    # local compilations are assumed to take the default expected time until they were measured
+    local_compilation_time: float = LocalHostCompilationSemaphore.DEFAULT_EXPECTED_COMPILATION_TIME
+
+    if (local_statistics := statistics.get(host_statistics_key(localhost))) is not None:
+        local_compilation_time = local_statistics.turnaround or local_compilation_time
+
+    return max(local_compilation_time - min(latencies), 0)
+
+
+async def _hedge_compilation(
+    arguments: Arguments,
+    dependency_dict: Dict[str, str],
+    selector: RemoteHostSelector,
+    localhost: Host,
+    config: ClientConfig,
+    state: StateFile,
+    race: HedgedCompilation,
+) -> int:
+    """duplicate a straggling request locally if a local compilation slot is free or else at the next selected host"""
+    if config.local_compilation_enabled and is_locally_hedgeable(arguments):
+        try:
+            with LocalHostHedgingSemaphore(localhost):
+                return await _compile_locally_hedged(arguments, race)
+        except SlotsExhaustedError as error:
+            logger.debug("%s", error)
+
+    for host in selector:
+        measurement: Optional[RemoteRequestMeasurement] = None
+
+        try:
+            with RemoteHostSemaphore(host):
+                measurement = RemoteRequestMeasurement()
+                return await compile_remotely_at(
+                    arguments=arguments,
+                    dependency_dict=dependency_dict,
+                    host=host,
+                    timeout=config.establish_connection_timeout,
+                    schroot_profile=config.schroot_profile,
+                    docker_container=config.docker_container,
+                    state=state,
+                    measurement=measurement,
+                    race=race,
+                )
+        except SlotsExhaustedError as error:
+            logger.debug("%s", error)
+        finally:
+            if measurement is not None:
+                _record_host_request(host, measurement)
+
+    raise SlotsExhaustedError(f"No slots left to hedge the compilation of {' '.join(arguments.source_files)}.")
+
+
+def is_locally_hedgeable(arguments: Arguments) -> bool:
+    """check whether arguments can be compiled locally to a temporary output, i.e. produce exactly one object file"""
+    return not arguments.is_linking() and len(arguments.source_files) == 1 and not arguments.has_fission()
+
+
+async def _compile_locally_hedged(arguments: Arguments, race: HedgedCompilation) -> int:
+    """compile locally to a temporary output which replaces the actual output only if the race is claimed"""
+    import asyncio
+
+    output: Path = Path(arguments.output or f"{Path(arguments.source_files[0]).stem}.o")
+    hedged_output: Path = output.with_name(f".{output.name}.{os.getpid()}.homcc")
+
+    # dependency files were already created during preprocessing
+    hedged_arguments: Arguments = (
+        arguments.copy().remove_local_args().remove_output_args().add_output(str(hedged_output))
+    )
+    logger.debug("Executing: [%s]", " ".join(hedged_arguments))
+
+    process = await asyncio.create_subprocess_exec(
+        *HostShellEnvironment().transform_command(list(hedged_arguments)),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    try:
+        stdout, stderr = await process.communicate()
+        return_code: int = await process.wait()
+
+        if not race.claim():
+            raise asyncio.CancelledError
+
+        sys.stdout.write(stdout.decode(ENCODING))
+        sys.stderr.write(stderr.decode(ENCODING))
+
+        if return_code == os.EX_OK:
+            hedged_output.replace(output)
+
+        return return_code
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+        hedged_output.unlink(missing_ok=True)
+
+
 def execute_linking(arguments: Arguments, localhost: Host) -> int:
     """execute linking command, no StateFile necessary"""
 
@@ -217,23 +590,30 @@ def execute_linking(arguments: Arguments, localhost: Host) -> int:
         return result.return_code
 
 
-def compile_locally(arguments: Arguments, localhost: Host) -> int:
-    """execute local compilation"""
+def compile_locally(arguments: Arguments, localhost: Host, record_statistics: bool = False) -> int:
+    """
+    execute local compilation, the duration of successful compilations is recorded in the client cache if requested,
+    e.g. for local fallbacks of remote compilations, so that waiting for remote hosts can be weighed against it
+    """
 
     with LocalHostCompilationSemaphore(localhost), StateFile(arguments, localhost) as state:
         state.set_compile()
+        compilation_start: float = time.monotonic()
 
         # execute compile command, e.g.: "g++ -c foo.cpp -o foo"
         result: ArgumentsExecutionResult = arguments.execute(output=True, shell_env=HostShellEnvironment())
 
+        if record_statistics and result.return_code == os.EX_OK:
+            _record_local_compilation(localhost, time.monotonic() - compilation_start)
+
         return result.return_code
 
 
-def scan_includes(arguments: Arguments) -> List[str]:
+def scan_includes(arguments: Arguments, include_scanner: bool = False) -> List[str]:
     """find all included dependencies"""
 
     try:
-        dependencies: Set[str] = find_dependencies(arguments)
+        dependencies: Set[str] = find_dependencies(arguments, include_scanner)
     except subprocess.CalledProcessError as error:
         check_recursive_call(arguments.compiler, error)
         logger.error(error.stderr)
@@ -242,17 +622,48 @@ def scan_includes(arguments: Arguments) -> List[str]:
     return [dependency for dependency in dependencies if not Arguments.is_source_file_arg(dependency)]
 
 
-def find_dependencies(arguments: Arguments) -> Set[str]:
-    """get unique set of dependencies by calling the preprocessor and filtering the result"""
+def find_dependencies(arguments: Arguments, include_scanner: bool = False) -> Set[str]:
+    """
+    get unique set of dependencies by calling the preprocessor and filtering the result, the preprocessor call is
+    skipped if the dependencies of an unchanged translation unit are already known by the client cache or if the
+    optional include scanner succeeds
+    """
 
-    # execute preprocessor command, e.g.: "g++ foo.cpp -M"
+    # dependency finding arguments, e.g.: "g++ foo.cpp -M"
     arguments, filename = arguments.dependency_finding()
-    result: ArgumentsExecutionResult = arguments.execute(check=True, shell_env=HostShellEnvironment())
+    dependency_file: Optional[str] = filename if filename != "-" else None
 
-    # read from the dependency file if it was created as a side effect
-    dependency_result: str = (
-        Path(filename).read_text(encoding=ENCODING) if filename is not None and filename != "-" else result.stdout
-    )
+    # the include scanner can not reproduce dependency files which are created as a side effect of the preprocessor
+    if include_scanner and dependency_file is None:
+        from homcc.client.include_scanner import scan_dependencies
+
+        if (scanned_dependencies := scan_dependencies(arguments)) is not None:
+            logger.debug("Include scanner result:\n%s", scanned_dependencies)
+            return filter_sendable_dependencies(scanned_dependencies)
+
+    manifest_key: Optional[str] = get_dependency_manifest_key(arguments)
+    cached_dependency_result: Optional[str] = None
+
+    if manifest_key is not None:
+        cached_dependency_result = _get_dependency_manifest(manifest_key)
+
+    dependency_result: str
+
+    if cached_dependency_result is not None:
+        dependency_result = cached_dependency_result
+        logger.debug("Skipping the preprocessor for unchanged dependency manifest '%s'.", manifest_key)
+
+        # restore the dependency file side effect of the skipped preprocessor call
+        if dependency_file is not None:
+            Path(dependency_file).write_text(dependency_result, encoding=ENCODING)
+    else:
+        # execute preprocessor command
+        result: ArgumentsExecutionResult = arguments.execute(check=True, shell_env=HostShellEnvironment())
+
+        # read from the dependency file if it was created as a side effect
+        dependency_result = (
+            Path(dependency_file).read_text(encoding=ENCODING) if dependency_file is not None else result.stdout
+        )
 
     logger.debug("Preprocessor result:\n%s", dependency_result)
 
@@ -264,18 +675,148 @@ def find_dependencies(arguments: Arguments) -> Set[str]:
             for dependency in dependency_line.rstrip("\\").split()  # remove line break char "\"
         ]
 
-    # extract dependencies from the preprocessor result and filter for sendability
-    return {
-        dependency
-        for line in dependency_result.splitlines()
-        for dependency in extract_dependencies(line)
-        if not dependency.startswith(EXCLUDED_DEPENDENCY_PREFIXES)  # check sendability
+    dependencies: Set[str] = {
+        dependency for line in dependency_result.splitlines() for dependency in extract_dependencies(line)
     }
 
+    if manifest_key is not None and cached_dependency_result is None:
+        _put_dependency_manifest(manifest_key, dependency_result, arguments, dependencies)
+
+    return filter_sendable_dependencies(dependencies)
+
+
+def filter_sendable_dependencies(dependencies: Set[str]) -> Set[str]:
+    """filter dependencies for sendability"""
+    return {dependency for dependency in dependencies if not dependency.startswith(EXCLUDED_DEPENDENCY_PREFIXES)}
+
+
+def get_dependency_manifest_key(arguments: Arguments) -> Optional[str]:
+    """
+    key of the dependency manifest for the given dependency finding arguments, which covers everything besides the
+    content of the file system that may influence the result, None if the compiler can not be found
+    """
+    from homcc.client.cache import compiler_fingerprint
+    from homcc.client.include_scanner import INCLUDE_PATH_ENV_VARS
+    from homcc.common.hashing import hash_file_with_bytes
+
+    if (compiler := compiler_fingerprint(arguments.compiler)) is None:
+        return None
+
+    key: Dict[str, Any] = {
+        "version": __version__,
+        "compiler": compiler,
+        "arguments": list(arguments),
+        "cwd": os.getcwd(),
+        "environment": {variable: os.getenv(variable) for variable in INCLUDE_PATH_ENV_VARS},
+    }
+
+    return hash_file_with_bytes(json.dumps(key).encode())
+
+
+def _get_host_states(hosts: List[Host], config: ClientConfig) -> Tuple[Dict[str, HostStatistics], Set[str]]:
+    """get the statistics of recent requests to the hosts and the hosts which are unavailable due to recent failures"""
+    import sqlite3
+
+    from homcc.client.cache import ClientCache
+    from homcc.client.client import host_statistics_key
+
+    keys: List[str] = [host_statistics_key(host) for host in hosts]
+
+    try:
+        with ClientCache() as cache:
+            # a half-open host is probed by a single request which may take up to the connection timeout to fail
+            return cache.get_host_statistics(keys), cache.get_unavailable_hosts(
+                keys, config.establish_connection_timeout
+            )
+    except (OSError, sqlite3.Error) as error:
+        logger.debug("Could not open the client cache, selecting hosts by their limits only: %s", error)
+
+    return {}, set()
+
+
+def _record_host_request(host: Host, measurement: RemoteRequestMeasurement):
+    import sqlite3
+
+    from homcc.client.cache import ClientCache
+    from homcc.client.client import host_statistics_key
+
+    # requests that were cancelled in favor of a hedged duplicate before their result arrived tell nothing
+    if measurement.superseded and measurement.turnaround is None:
+        return
+
+    try:
+        with ClientCache() as cache:
+            cache.record_host_request(
+                host_statistics_key(host),
+                refused=measurement.turnaround is None,
+                connect_time=measurement.connect_time,
+                turnaround=measurement.turnaround,
+                cache_hit_ratio=measurement.cache_hit_ratio,
+            )
+            cache.record_host_breaker(host_statistics_key(host), failed=measurement.turnaround is None)
+    except (OSError, sqlite3.Error) as error:
+        logger.debug("Could not open the client cache to record the request to host '%s': %s", host, error)
+
+
+def _record_local_compilation(localhost: Host, duration: float):
+    import sqlite3
+
+    from homcc.client.cache import ClientCache
+    from homcc.client.client import host_statistics_key
+
+    try:
+        with ClientCache() as cache:
+            cache.record_host_request(host_statistics_key(localhost), refused=False, turnaround=duration)
+    except (OSError, sqlite3.Error) as error:
+        logger.debug("Could not open the client cache to record the local compilation: %s", error)
+
+
+def _get_dependency_manifest(manifest_key: str) -> Optional[str]:
+    import sqlite3
+
+    from homcc.client.cache import ClientCache
+
+    try:
+        with ClientCache() as cache:
+            return cache.get_dependency_manifest(manifest_key)
+    except (OSError, sqlite3.Error) as error:
+        logger.debug("Could not open the client cache, finding dependencies via the preprocessor: %s", error)
+
+    return None
+
+
+def _put_dependency_manifest(manifest_key: str, dependency_result: str, arguments: Arguments, dependencies: Set[str]):
+    import sqlite3
+
+    from homcc.client.cache import ClientCache
+
+    # besides the dependencies themselves, the result changes whenever files are added to or removed from directories
+    # that are searched for includes, e.g. when a new header shadows a previously found one
+    paths: Set[str] = dependencies.copy()
+    paths.update(str(Path(dependency).parent) for dependency in dependencies)
+    paths.update(str(Path(include_directory).resolve()) for include_directory in arguments.include_directories)
+
+    try:
+        with ClientCache() as cache:
+            cache.put_dependency_manifest(manifest_key, dependency_result, paths)
+    except (OSError, sqlite3.Error) as error:
+        logger.debug("Could not open the client cache to store the dependency manifest: %s", error)
+
 
 def calculate_dependency_dict(dependencies: Set[str]) -> Dict[str, str]:
     """calculate dependency file hashes mapped to their corresponding absolute filenames"""
-    return {dependency: hash_file_with_path(dependency) for dependency in dependencies}
+    import sqlite3
+
+    from homcc.client.cache import ClientCache
+    from homcc.common.hashing import hash_files_with_paths
+
+    try:
+        with ClientCache() as cache:
+            return cache.hash_files(dependencies)
+    except (OSError, sqlite3.Error) as error:
+        logger.debug("Could not open the client cache, hashing all dependencies: %s", error)
+
+    return hash_files_with_paths(dependencies)
 
 
 def link_object_files(arguments: Arguments, object_files: List[File]) -> int:
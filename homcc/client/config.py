@@ -38,6 +38,9 @@ class ClientEnvironmentVariables:
     HOMCC_LOG_LEVEL_ENV_VAR: ClassVar[str] = "HOMCC_LOG_LEVEL"
     HOMCC_VERBOSE_ENV_VAR: ClassVar[str] = "HOMCC_VERBOSE"
     HOMCC_NO_LOCAL_COMPILATION_ENV_VAR: ClassVar[str] = "HOMCC_NO_LOCAL_COMPILATION"
+    HOMCC_INCLUDE_SCANNER_ENV_VAR: ClassVar[str] = "HOMCC_INCLUDE_SCANNER"
+    HOMCC_HEDGING_ENV_VAR: ClassVar[str] = "HOMCC_HEDGING"
+    HOMCC_WAIT_FOR_REMOTE_SLOTS_ENV_VAR: ClassVar[str] = "HOMCC_WAIT_FOR_REMOTE_SLOTS"
 
     @classmethod
     def __iter__(cls) -> Iterator[str]:
@@ -51,6 +54,9 @@ class ClientEnvironmentVariables:
             cls.HOMCC_LOG_LEVEL_ENV_VAR,
             cls.HOMCC_VERBOSE_ENV_VAR,
             cls.HOMCC_NO_LOCAL_COMPILATION_ENV_VAR,
+            cls.HOMCC_INCLUDE_SCANNER_ENV_VAR,
+            cls.HOMCC_HEDGING_ENV_VAR,
+            cls.HOMCC_WAIT_FOR_REMOTE_SLOTS_ENV_VAR,
         )
 
     @staticmethod
@@ -104,6 +110,24 @@ class ClientEnvironmentVariables:
             return cls.parse_bool_str(no_local_compilation)
         return None
 
+    @classmethod
+    def get_include_scanner(cls) -> Optional[bool]:
+        if (include_scanner := os.getenv(cls.HOMCC_INCLUDE_SCANNER_ENV_VAR)) is not None:
+            return cls.parse_bool_str(include_scanner)
+        return None
+
+    @classmethod
+    def get_hedging(cls) -> Optional[bool]:
+        if (hedging := os.getenv(cls.HOMCC_HEDGING_ENV_VAR)) is not None:
+            return cls.parse_bool_str(hedging)
+        return None
+
+    @classmethod
+    def get_wait_for_remote_slots(cls) -> Optional[bool]:
+        if (wait_for_remote_slots := os.getenv(cls.HOMCC_WAIT_FOR_REMOTE_SLOTS_ENV_VAR)) is not None:
+            return cls.parse_bool_str(wait_for_remote_slots)
+        return None
+
 
 @dataclass
 class ClientConfig:
@@ -119,6 +143,9 @@ class ClientConfig:
     log_level: Optional[LogLevel]
     verbose: bool
     local_compilation_enabled: bool
+    include_scanner: bool
+    hedging: bool
+    wait_for_remote_slots: bool
 
     def __init__(
         self,
@@ -133,6 +160,9 @@ class ClientConfig:
         log_level: Optional[str] = None,
         verbose: Optional[bool] = None,
         no_local_compilation: Optional[bool] = None,
+        include_scanner: Optional[bool] = None,
+        hedging: Optional[bool] = None,
+        wait_for_remote_slots: Optional[bool] = None,
     ):
         self.files = files
 
@@ -164,6 +194,15 @@ class ClientConfig:
             ClientEnvironmentVariables.get_no_local_compilation() or no_local_compilation
         )
 
+        include_scanner = ClientEnvironmentVariables.get_include_scanner() or include_scanner
+        self.include_scanner = include_scanner is not None and include_scanner
+
+        hedging = ClientEnvironmentVariables.get_hedging() or hedging
+        self.hedging = hedging is not None and hedging
+
+        wait_for_remote_slots = ClientEnvironmentVariables.get_wait_for_remote_slots() or wait_for_remote_slots
+        self.wait_for_remote_slots = wait_for_remote_slots is not None and wait_for_remote_slots
+
     @classmethod
     def empty(cls):
         return cls(files=[])
@@ -179,6 +218,9 @@ class ClientConfig:
         log_level: Optional[str] = homcc_config.get("log_level")
         verbose: Optional[bool] = homcc_config.getboolean("verbose")
         no_local_compilation: Optional[bool] = homcc_config.getboolean("no_local_compilation")
+        include_scanner: Optional[bool] = homcc_config.getboolean("include_scanner")
+        hedging: Optional[bool] = homcc_config.getboolean("hedging")
+        wait_for_remote_slots: Optional[bool] = homcc_config.getboolean("wait_for_remote_slots")
 
         return ClientConfig(
             files=files,
@@ -191,6 +233,9 @@ class ClientConfig:
             log_level=log_level,
             verbose=verbose,
             no_local_compilation=no_local_compilation,
+            include_scanner=include_scanner,
+            hedging=hedging,
+            wait_for_remote_slots=wait_for_remote_slots,
         )
 
     def __str__(self):
@@ -205,6 +250,9 @@ class ClientConfig:
             f"\tlog_level:\t\t\t{self.log_level}\n"
             f"\tverbose:\t\t\t{self.verbose}\n"
             f"\tlocal_compilation_enabled:\t{self.local_compilation_enabled}\n"
+            f"\tinclude_scanner:\t\t{self.include_scanner}\n"
+            f"\thedging:\t\t\t{self.hedging}\n"
+            f"\twait_for_remote_slots:\t\t{self.wait_for_remote_slots}\n"
         )
 
     def set_verbose(self):
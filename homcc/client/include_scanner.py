@@ -0,0 +1,382 @@
+# Copyright (c) 2023 Celonis SE
+# Covered under the included MIT License:
+#   https://github.com/celonis/homcc/blob/main/LICENSE
+
+"""
+Built-in include scanner of the homcc client, a fast alternative to finding dependencies via the preprocessor.
+
+Similar to the distcc pump mode, the scanner resolves #include directives against the include search paths itself
+without evaluating any conditionals. It therefore finds a superset of the dependencies that the preprocessor would
+report, which is sufficient for remote compilation. Whenever the scanner meets something it can not resolve without
+evaluating macros, e.g. computed includes, it gives up so that the preprocessor is used instead.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from homcc.client import __version__
+from homcc.client.cache import ClientCache, compiler_fingerprint, stat_fingerprint
+from homcc.common.arguments import Arguments
+from homcc.common.errors import UnsupportedIncludeError
+from homcc.common.hashing import hash_file_with_bytes
+from homcc.common.shell_environment import HostShellEnvironment
+
+logger = logging.getLogger(__name__)
+
+INCLUDE_PATH_ENV_VARS: List[str] = ["CPATH", "C_INCLUDE_PATH", "CPLUS_INCLUDE_PATH", "OBJC_INCLUDE_PATH"]
+"""Environment variables that influence the include search paths of the preprocessor."""
+
+UNSUPPORTED_ARG_PREFIXES: Tuple[str, ...] = ("-include", "-imacros", "-iprefix", "-iwithprefix", "-I-", "--include")
+"""Args that implicitly include files or alter include resolution in ways that are not supported by the scanner."""
+
+SEARCH_PATH_ARG_PREFIXES: Tuple[str, ...] = (
+    "-I",
+    "-i",
+    "-nostdinc",
+    "-nostdlibinc",
+    "--sysroot",
+    "-stdlib",
+    "-target",
+    "--target",
+    "-B",
+    "--gcc-toolchain",
+    "-m",
+)
+"""Args that may influence the include search paths of the preprocessor."""
+
+SEPARATE_VALUE_SEARCH_PATH_ARGS: List[str] = ["-I", "-iquote", "-isystem", "-idirafter", "-isysroot", "-target", "-B"]
+"""Search path args which may be followed by their value as separate arg."""
+
+INCLUDE_DIRECTIVE_REGEX = re.compile(
+    rb'^[ \t]*#[ \t]*(include_next|include|import)[ \t]*(?:"([^"\n]*)"|<([^>\n]*)>|([^\n]*))', re.MULTILINE
+)
+"""Regex matching include directives with either a quoted, an angled or a computed (macro) header name."""
+
+COMMENT_OR_LITERAL_REGEX = re.compile(rb'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'', re.DOTALL)
+"""Regex matching comments as well as string and character literals, which may contain comment delimiters."""
+
+LANGUAGES_BY_SUFFIX: Dict[str, str] = {".c": "c", ".m": "objective-c", ".mm": "objective-c++"}
+"""Languages of source files that are not C++ by their suffix."""
+
+
+class Include(NamedTuple):
+    """Include directive of a source file or header."""
+
+    name: Optional[str]
+    """Header name, None for computed includes whose header name is a macro."""
+    quoted: bool
+    """Whether the header name is quoted, i.e. "foo.h", instead of angled, i.e. <foo.h>."""
+    next: bool
+    """Whether the directive is #include_next."""
+
+
+def strip_comments(content: bytes) -> bytes:
+    """replace all comments by a single space, analogously to the preprocessor"""
+
+    def replace(match: re.Match) -> bytes:
+        return b" " if match.group().startswith(b"/") else match.group()
+
+    return COMMENT_OR_LITERAL_REGEX.sub(replace, content) if b"/" in content else content
+
+
+def parse_includes(content: bytes) -> List[Include]:
+    """parse all include directives regardless of any surrounding conditionals"""
+    includes: List[Include] = []
+
+    for match in INCLUDE_DIRECTIVE_REGEX.finditer(strip_comments(content)):
+        directive, quoted_name, angled_name, computed_name = match.groups()
+        name: Optional[bytes] = quoted_name if quoted_name is not None else angled_name
+
+        if name is None and not computed_name.strip():
+            continue  # ignore malformed directives without any header name
+
+        includes.append(
+            Include(
+                name=None if name is None else name.decode(errors="surrogateescape"),
+                quoted=quoted_name is not None,
+                next=directive == b"include_next",
+            )
+        )
+
+    return includes
+
+
+@dataclass
+class SearchPaths:
+    """Include search paths of the preprocessor, as reported via "-v"."""
+
+    quoted: List[str]
+    """Directories which are only searched for quoted includes, e.g. via -iquote."""
+    angled: List[str]
+    """Directories which are searched for all includes, e.g. via -I, -isystem and the default system directories."""
+
+    @classmethod
+    def from_verbose_output(cls, output: str) -> SearchPaths:
+        quoted: List[str] = []
+        angled: List[str] = []
+        search_paths: Optional[List[str]] = None
+
+        for line in output.splitlines():
+            if line.startswith('#include "..." search starts here:'):
+                search_paths = quoted
+            elif line.startswith("#include <...> search starts here:"):
+                search_paths = angled
+            elif line.startswith("End of search list."):
+                break
+            elif search_paths is not None and line.startswith(" "):
+                if line.endswith("(framework directory)"):
+                    raise UnsupportedIncludeError(f"Framework directory '{line.strip()}' is not supported.")
+
+                search_paths.append(os.path.normpath(line.strip()))
+
+        return cls(quoted, angled)
+
+    def directories(self) -> List[str]:
+        """all directories in search order, directories of angled includes start at index len(quoted)"""
+        return self.quoted + self.angled
+
+
+class IncludeScanner:
+    """
+    Include scanner that memoises include resolution per directory and per header. Parsed include directives of
+    headers and the include search paths of the compiler are additionally persisted in the client cache, so that they
+    are shared across translation units and homcc processes.
+    """
+
+    def __init__(self, cache: Optional[ClientCache] = None):
+        self.cache: Optional[ClientCache] = cache
+        self._directory_entries: Dict[str, Optional[Set[str]]] = {}
+        self._real_directories: Dict[str, str] = {}
+        self._resolved_includes: Dict[Tuple[Optional[str], str, bool, int], Optional[Tuple[str, Optional[int]]]] = {}
+
+    @staticmethod
+    def language(arguments: Arguments) -> str:
+        """language of all source files, C++ if not specified otherwise"""
+        if (specified_language := arguments.specified_language) is not None:
+            return specified_language
+
+        languages: Set[str] = {
+            LANGUAGES_BY_SUFFIX.get(Path(source_file).suffix, "c++") for source_file in arguments.source_files
+        }
+
+        if len(languages) != 1:
+            raise UnsupportedIncludeError(f"Can not determine a single language for {arguments}.")
+
+        return languages.pop()
+
+    @staticmethod
+    def search_path_args(arguments: Arguments) -> List[str]:
+        """all args that may influence the include search paths"""
+        args: List[str] = []
+
+        it: Iterator[str] = iter(arguments.args)
+        for arg in it:
+            if arg.startswith(UNSUPPORTED_ARG_PREFIXES):
+                raise UnsupportedIncludeError(f"Arg '{arg}' is not supported.")
+
+            if arg.startswith(SEARCH_PATH_ARG_PREFIXES):
+                args.append(arg)
+
+                if arg in SEPARATE_VALUE_SEARCH_PATH_ARGS:
+                    args.append(next(it))
+
+        return args
+
+    def search_paths(self, arguments: Arguments, language: str) -> SearchPaths:
+        """
+        query the include search paths from the compiler, memoised per invoked compiler, executable and search path
+        args, as e.g. clang derives the target and thereby the search paths from the name it was invoked with
+        """
+        args: List[str] = self.search_path_args(arguments)
+        compiler: Optional[Tuple[str, int, int]] = compiler_fingerprint(arguments.compiler)
+
+        if compiler is None:
+            raise UnsupportedIncludeError(f"Compiler '{arguments.compiler}' can not be found.")
+
+        key: str = hash_file_with_bytes(
+            json.dumps(
+                {
+                    "version": __version__,
+                    "compiler": compiler,
+                    "invocation": str(arguments.compiler),
+                    "args": args,
+                    "language": language,
+                    "cwd": os.getcwd(),
+                    "environment": {variable: os.getenv(variable) for variable in INCLUDE_PATH_ENV_VARS},
+                }
+            ).encode()
+        )
+        memo_key: str = f"search_paths_{key}"
+
+        if self.cache is not None and (memo := self.cache.get_memo(memo_key)) is not None:
+            return SearchPaths(**json.loads(memo))
+
+        # e.g.: "g++ -Iinclude -xc++ -E -v /dev/null"
+        try:
+            result = Arguments(arguments.compiler, [*args, "-x", language, "-E", "-v", os.devnull]).execute(
+                check=True, shell_env=HostShellEnvironment()
+            )
+        except (OSError, subprocess.CalledProcessError) as error:
+            raise UnsupportedIncludeError(f"Could not query the include search paths: {error}") from error
+
+        search_paths: SearchPaths = SearchPaths.from_verbose_output(result.stderr)
+
+        if not search_paths.angled:
+            raise UnsupportedIncludeError(f"Could not parse the include search paths:\n{result.stderr}")
+
+        if self.cache is not None:
+            self.cache.put_memo(memo_key, json.dumps(search_paths.__dict__))
+
+        return search_paths
+
+    def _has_entry(self, directory: str, name: str) -> bool:
+        """check whether the directory contains the first path component of name, memoised per directory"""
+        if directory not in self._directory_entries:
+            try:
+                self._directory_entries[directory] = set(os.listdir(directory))
+            except OSError:
+                self._directory_entries[directory] = None
+
+        entries: Optional[Set[str]] = self._directory_entries[directory]
+        first_component: str = name.split("/", 1)[0]
+        return entries is not None and (first_component in entries or first_component in (os.curdir, os.pardir))
+
+    def _real_path(self, path: str) -> str:
+        """resolve symlinks and normalize the path analogously to Path.resolve, memoised per directory"""
+        directory, name = os.path.split(os.path.abspath(path))
+
+        if (real_directory := self._real_directories.get(directory)) is None:
+            real_directory = self._real_directories[directory] = os.path.realpath(directory)
+
+        real_path: str = os.path.join(real_directory, name)
+        return os.path.realpath(real_path) if os.path.islink(real_path) else real_path
+
+    def _find(self, directory: str, name: str) -> Optional[str]:
+        if not self._has_entry(directory, name):
+            return None
+
+        path: str = os.path.join(directory, name)
+        return path if os.path.isfile(path) else None
+
+    def resolve(
+        self, include: Include, includer: str, includer_index: Optional[int], search_paths: SearchPaths
+    ) -> Optional[Tuple[str, Optional[int]]]:
+        """
+        resolve the include of the includer that was found at the given search path index (None if it was not found
+        via the search paths) and return the path of the header together with its own search path index
+        """
+        assert include.name is not None
+
+        if os.path.isabs(include.name):
+            return (include.name, None) if os.path.isfile(include.name) else None
+
+        # quoted includes are searched relative to the includer first, unless they are #include_next directives
+        includer_directory: Optional[str] = None
+        start_index: int = 0 if include.quoted else len(search_paths.quoted)
+
+        if include.next and includer_index is not None:
+            start_index = includer_index + 1
+        elif include.quoted:
+            includer_directory = os.path.dirname(includer)
+
+        key = (includer_directory, include.name, include.quoted, start_index)
+
+        if key not in self._resolved_includes:
+            resolved: Optional[Tuple[str, Optional[int]]] = None
+
+            if includer_directory is not None and (path := self._find(includer_directory, include.name)) is not None:
+                resolved = path, None
+            else:
+                directories: List[str] = search_paths.directories()
+
+                for index in range(start_index, len(directories)):
+                    if (path := self._find(directories[index], include.name)) is not None:
+                        resolved = path, index
+                        break
+
+            self._resolved_includes[key] = resolved
+
+        return self._resolved_includes[key]
+
+    def _includes(self, paths: Set[str]) -> Dict[str, List[Include]]:
+        """parse the include directives of all given files, memoised per header via the client cache"""
+        fingerprints: Dict[str, Tuple[int, int, int]] = {path: stat_fingerprint(os.stat(path)) for path in paths}
+        includes: Dict[str, List[Include]] = {}
+
+        if self.cache is not None:
+            for path, serialized_includes in self.cache.get_header_includes(fingerprints).items():
+                includes[path] = [Include(*include) for include in json.loads(serialized_includes)]
+
+        new_includes: Dict[str, List[Include]] = {
+            path: parse_includes(Path(path).read_bytes()) for path in paths if path not in includes
+        }
+
+        if self.cache is not None and new_includes:
+            self.cache.put_header_includes(
+                fingerprints, {path: json.dumps(path_includes) for path, path_includes in new_includes.items()}
+            )
+
+        includes.update(new_includes)
+        return includes
+
+    def scan(self, arguments: Arguments) -> Set[str]:
+        """find all dependencies of the source files, including the source files themselves"""
+        if not arguments.source_files:
+            raise UnsupportedIncludeError(f"No source files to scan in {arguments}.")
+
+        search_paths: SearchPaths = self.search_paths(arguments, self.language(arguments))
+
+        visited: Set[Tuple[str, Optional[int]]] = {
+            (os.path.abspath(source_file), None) for source_file in arguments.source_files
+        }
+        frontier: Set[Tuple[str, Optional[int]]] = visited.copy()
+
+        # breadth-first traversal, so that headers can be looked up in the cache level by level
+        while frontier:
+            includes: Dict[str, List[Include]] = self._includes({path for path, _ in frontier})
+            next_frontier: Set[Tuple[str, Optional[int]]] = set()
+
+            for path, index in frontier:
+                for include in includes[path]:
+                    if include.name is None:
+                        raise UnsupportedIncludeError(f"Computed include in '{path}' is not supported.")
+
+                    # unresolvable includes are assumed to be excluded by conditionals, e.g. platform specific headers
+                    if (resolved := self.resolve(include, path, index, search_paths)) is not None:
+                        if resolved not in visited:
+                            visited.add(resolved)
+                            next_frontier.add(resolved)
+
+            frontier = next_frontier
+
+        return {self._real_path(path) for path, _ in visited}
+
+
+def scan_dependencies(arguments: Arguments) -> Optional[Set[str]]:
+    """
+    find all dependencies via the include scanner and return them in the same normalized form as the preprocessor
+    based dependency finding, return None if the preprocessor has to be used instead
+    """
+    cache: Optional[ClientCache] = None
+
+    try:
+        cache = ClientCache()
+    except (OSError, sqlite3.Error) as error:
+        logger.debug("Could not open the client cache for the include scanner: %s", error)
+
+    try:
+        return IncludeScanner(cache).scan(arguments)
+    except (OSError, UnsupportedIncludeError) as error:
+        logger.debug("Include scanner falls back to the preprocessor: %s", error)
+        return None
+    finally:
+        if cache is not None:
+            cache.close()
@@ -23,26 +23,13 @@
 """
 homcc client
 """
-import asyncio
 import logging
 import os
-import subprocess
 import sys
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
 
-from homcc.client.compilation import (  # pylint: disable=wrong-import-position
-    RECURSIVE_ERROR_MESSAGE,
-    check_recursive_call,
-    compile_locally,
-    compile_remotely,
-    execute_linking,
-)
-from homcc.client.parsing import setup_client  # pylint: disable=wrong-import-position
-from homcc.common.errors import (  # pylint: disable=wrong-import-position
-    RecoverableClientError,
-    RemoteCompilationError,
-)
+from homcc.client.agent import forward_to_agent  # pylint: disable=wrong-import-position
 
 logger: logging.Logger = logging.getLogger(__name__)
 
@@ -56,7 +43,22 @@ def is_recursively_invoked() -> bool:
     return is_safeguard_active
 
 
-def main():
+def run():
+    """Run the homcc client for the current invocation, i.e. sys.argv, in this process."""
+    # pylint: disable=import-outside-toplevel
+    # the client modules are only imported here as forwarded invocations do not need them
+    import subprocess
+
+    from homcc.client.compilation import (
+        RECURSIVE_ERROR_MESSAGE,
+        check_recursive_call,
+        compile_locally,
+        compile_remotely,
+        execute_linking,
+    )
+    from homcc.client.parsing import setup_client
+    from homcc.common.errors import RecoverableClientError, RemoteCompilationError
+
     # cancel execution if recursive call is detected
     if is_recursively_invoked():
         sys.exit(RECURSIVE_ERROR_MESSAGE)
@@ -72,7 +74,9 @@ def main():
         if not compiler_arguments.is_sendable():
             sys.exit(compile_locally(compiler_arguments, localhost))
 
-        # try to compile remotely
+        # try to compile remotely, asyncio is only needed and therefore imported for remote compilations
+        import asyncio
+
         sys.exit(asyncio.run(compile_remotely(compiler_arguments, remote_hosts, localhost, homcc_config)))
 
     # unrecoverable error during local execution of compiler arguments
@@ -103,7 +107,15 @@ def main():
 
     # fall back to local compilation
     logger.warning("Compiling locally instead!")
-    sys.exit(compile_locally(compiler_arguments, localhost))
+    sys.exit(compile_locally(compiler_arguments, localhost, record_statistics=True))
+
+
+def main():
+    # forward the invocation to a running homcc agent to avoid setting up the client again
+    if (exit_code := forward_to_agent(sys.argv)) is not None:
+        sys.exit(exit_code)
+
+    run()
 
 
 if __name__ == "__main__":
@@ -296,7 +296,7 @@ def setup_client(cli_args: List[str]) -> Tuple[ClientConfig, Arguments, Host, Li
 
     # SCAN-INCLUDES; and exit
     if homcc_args_dict.pop("scan_includes", False):
-        for include in scan_includes(compiler_arguments):
+        for include in scan_includes(compiler_arguments, homcc_config.include_scanner):
             sys.stdout.write(f"{include}\n")
 
         sys.exit(os.EX_OK)
@@ -0,0 +1,405 @@
+# Copyright (c) 2023 Celonis SE
+# Covered under the included MIT License:
+#   https://github.com/celonis/homcc/blob/main/LICENSE
+
+"""
+Semaphores to limit the amount of concurrent jobs of all homcc client processes per host
+"""
+from __future__ import annotations
+
+import errno
+import fcntl
+import logging
+import mmap
+import os
+import select
+import signal
+import struct
+import sys
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import ClassVar, Iterator, List, Optional
+
+from homcc.common.errors import SlotsExhaustedError
+from homcc.common.host import Host
+from homcc.common.parsing import HOMCC_DIR_ENV_VAR
+
+logger = logging.getLogger(__name__)
+
+SLOT_TABLES_DIRNAME: str = "slots"
+SLOT_QUEUES_DIRNAME: str = "queues"
+
+
+def default_slots_path() -> Path:
+    """Path of the directory of the host slot tables, e.g. ~/.homcc/slots"""
+    if homcc_dir_env_var := os.getenv(HOMCC_DIR_ENV_VAR):
+        return Path(homcc_dir_env_var) / SLOT_TABLES_DIRNAME
+
+    return Path.home() / ".homcc" / SLOT_TABLES_DIRNAME
+
+
+def default_queue_path() -> Path:
+    """Path of the directory of the local slot queues, e.g. ~/.homcc/queues"""
+    if homcc_dir_env_var := os.getenv(HOMCC_DIR_ENV_VAR):
+        return Path(homcc_dir_env_var) / SLOT_QUEUES_DIRNAME
+
+    return Path.home() / ".homcc" / SLOT_QUEUES_DIRNAME
+
+
+class SlotTable:
+    """
+    Table of the slots of a host, shared between all client processes via a memory mapped file.
+
+    Each slot records the PID of the process occupying it or 0 if it is free. Slots of processes that are not alive any
+    more, e.g. because make or an IDE killed them via SIGKILL, are reclaimed by the next process looking for a free
+    slot, so that the usable capacity does not shrink over time. Modifications of the table are serialized via a file
+    lock and processes waiting for a slot are woken up via a named pipe whenever a slot is released.
+    """
+
+    PID_FORMAT: ClassVar[str] = "=i"
+    """Format of the PID of a single slot, i.e. a pid_t."""
+    RECLAIM_INTERVAL: ClassVar[float] = 1.0
+    """Interval in seconds in which waiting processes check for slots of terminated processes."""
+
+    path: Path
+    """Memory mapped file of the table, named after the collision-free host ID."""
+    limit: int
+    """Amount of slots."""
+
+    def __init__(self, host: Host, slots_dir: Path):
+        slots_dir.mkdir(parents=True, exist_ok=True)
+        self.path = slots_dir / host.id()
+        self.limit = host.limit
+        self._doorbell_path: Path = slots_dir / f"{host.id()}.fifo"
+
+        size: int = max(self.limit, 1) * struct.calcsize(self.PID_FORMAT)
+        self._fd: int = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        # the size of a table never changes as the limit is part of the host ID
+        with self._locked():
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+
+        self._table: mmap.mmap = mmap.mmap(self._fd, size)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _owner(self, slot: int) -> int:
+        return struct.unpack_from(self.PID_FORMAT, self._table, slot * struct.calcsize(self.PID_FORMAT))[0]
+
+    def _set_owner(self, slot: int, pid: int):
+        struct.pack_into(self.PID_FORMAT, self._table, slot * struct.calcsize(self.PID_FORMAT), pid)
+
+    @staticmethod
+    def _is_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass  # the process exists but belongs to another user
+
+        return True
+
+    def claim(self) -> Optional[int]:
+        """Occupy a free slot or a slot of a terminated process without waiting, return None if all are occupied"""
+        with self._locked():
+            for slot in range(self.limit):
+                owner: int = self._owner(slot)
+
+                if owner and not self._is_alive(owner):
+                    logger.debug("Reclaiming slot %i of '%s' from terminated process %i.", slot, self.path.name, owner)
+                    owner = 0
+
+                if not owner:
+                    self._set_owner(slot, os.getpid())
+                    return slot
+
+        return None
+
+    def acquire(self) -> int:
+        """Occupy a slot and wait until one is released if all are occupied, return the slot"""
+        try:
+            os.mkfifo(self._doorbell_path, 0o600)
+        except FileExistsError:
+            pass
+
+        # opening the pipe for writing as well prevents end of file notifications once other processes closed it, it is
+        # opened before checking the table so that no release in between is missed
+        doorbell: int = os.open(self._doorbell_path, os.O_RDWR | os.O_NONBLOCK)
+        poll = select.poll()
+        poll.register(doorbell, select.POLLIN)
+
+        try:
+            while (slot := self.claim()) is None:
+                poll.poll(self.RECLAIM_INTERVAL * 1000)
+
+                try:
+                    while os.read(doorbell, select.PIPE_BUF):
+                        pass
+                except BlockingIOError:
+                    pass
+
+            return slot
+        finally:
+            os.close(doorbell)
+
+    def release(self, slot: int):
+        """Free the slot if it is still occupied by this process and wake up a waiting process"""
+        with self._locked():
+            if self._owner(slot) == os.getpid():
+                self._set_owner(slot, 0)
+
+        try:
+            doorbell: int = os.open(self._doorbell_path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as error:
+            if error.errno in (errno.ENOENT, errno.ENXIO):
+                return  # no process is waiting
+
+            raise
+
+        try:
+            os.write(doorbell, b"\0")
+        except BlockingIOError:
+            pass  # the waiting process has not been woken up yet
+        finally:
+            os.close(doorbell)
+
+    def occupied_slots(self) -> int:
+        """Return the amount of slots that are occupied by living processes"""
+        with self._locked():
+            return sum(1 for slot in range(self.limit) if (owner := self._owner(slot)) and self._is_alive(owner))
+
+    def close(self):
+        if not self._table.closed:
+            self._table.close()
+            os.close(self._fd)
+
+
+class HostSemaphore(ABC):
+    """
+    Abstract bass class to create and exit from semaphore contexts.
+
+    Inheriting classes only have to implement the context manager enter method.
+    """
+
+    _host: Host
+    """Selected host."""
+    _table: SlotTable
+    """Slot table of the host shared between client processes."""
+    _slot: Optional[int]
+    """Slot occupied by this semaphore, None while no slot is occupied."""
+
+    def __init__(self, host: Host):
+        # signal handling to properly release the slot
+        signal.signal(signal.SIGINT, self._handle_interrupt)
+        signal.signal(signal.SIGTERM, self._handle_termination)
+
+        self._host = host
+        self._table = SlotTable(host, default_slots_path())
+        self._slot = None
+
+    def _handle_interrupt(self, _, frame):
+        self.__exit__()
+        logger.debug("SIGINT:\n%s", repr(frame))
+        sys.exit("Stopped by SIGINT signal")
+
+    def _handle_termination(self, _, frame):
+        self.__exit__()
+        logger.debug("SIGTERM:\n%s", repr(frame))
+        sys.exit("Stopped by SIGTERM signal")
+
+    def _claim(self, message: str):
+        """Occupy a slot without waiting, clean up and raise SlotsExhaustedError with the message on failure"""
+        self._slot = self._table.claim()
+
+        if self._slot is None:
+            self._clean_up()
+            raise SlotsExhaustedError(message)
+
+    def _clean_up(self):
+        # prevent double release while receiving signal during normal context manager exit
+        if self._slot is not None:
+            logger.debug("Releasing slot %i of '%s'", self._slot, self._host)
+            self._table.release(self._slot)
+            self._slot = None
+
+        self._table.close()
+
+    @abstractmethod
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *_):
+        self._clean_up()
+
+
+class RemoteHostSemaphore(HostSemaphore):
+    """
+    Class to track remote compilation jobs via a shared slot table.
+
+    Each slot table for a host is uniquely identified by host_id which includes the host name itself and ConnectionType
+    specific information like the port for TCP and the user for SSH connections. A slot will be occupied without
+    waiting and might therefore throw an exception on failure. This indicates that the current machine already exhausts
+    all slots of the specified host.
+    """
+
+    def __init__(self, host: Host):
+        if host.is_local():
+            raise ValueError(f"Invalid remote host: '{host}'")
+
+        super().__init__(host)
+
+    def __enter__(self) -> RemoteHostSemaphore:
+        logger.debug("Entering semaphore of '%s'", self._host)
+        self._claim(f"All compilation slots for host {self._host} are occupied.")
+        return self
+
+
+class LocalHostSemaphore(HostSemaphore):
+    """
+    Class to track local jobs via a shared slot table.
+
+    Waiting processes are served in first-come-first-served order as it is desired by build systems: each process draws
+    a ticket from a file based queue and waits on the lock files of its predecessors. Only the first process in line
+    waits for a slot of the table itself, so it is woken up as soon as a slot is released, then it dequeues and thereby
+    wakes up its successor. File locks are released by the kernel even if a waiting process gets killed, so a
+    terminated process never stalls the queue, its successor then keeps waiting on the next live predecessor.
+    Multiple slot tables may be created in a time period with multiple homcc calls if localhost is specified with
+    different limits. Adding multiple different or changing localhost hosts during builds with homcc will currently
+    lead to non-deterministic behaviour regarding the total amount of concurrent local compilation jobs.
+    """
+
+    TAIL_FILENAME: ClassVar[str] = "tail"
+    """Name of the file storing the last drawn ticket of a queue."""
+
+    _queue_dir: Path
+    """Directory of the lock files of all waiting processes."""
+    _ticket_fd: Optional[int]
+    """Locked file descriptor of the ticket of this process while it is queued."""
+    _ticket_path: Optional[Path]
+    """Lock file of the ticket of this process while it is queued."""
+
+    def __init__(self, host: Host):
+        if not host.is_local():
+            raise ValueError(f"Invalid localhost: '{host}'")
+
+        self._ticket_fd = None
+        self._ticket_path = None
+        super().__init__(host)
+        self._queue_dir = default_queue_path() / host.id()
+
+    def _enqueue(self) -> int:
+        """Draw the next ticket and lock its file, return the ticket"""
+        self._queue_dir.mkdir(parents=True, exist_ok=True)
+        tail_fd: int = os.open(self._queue_dir / self.TAIL_FILENAME, os.O_RDWR | os.O_CREAT, 0o600)
+
+        try:
+            fcntl.flock(tail_fd, fcntl.LOCK_EX)
+            ticket: int = int(os.pread(tail_fd, 32, 0) or 0) + 1
+
+            # the ticket file is locked before it is published, successors can therefore not overtake this process
+            self._ticket_path = self._queue_dir / f"{ticket}.lock"
+            self._ticket_fd = os.open(self._ticket_path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(self._ticket_fd, fcntl.LOCK_EX)
+
+            os.ftruncate(tail_fd, 0)
+            os.pwrite(tail_fd, str(ticket).encode(), 0)
+        finally:
+            os.close(tail_fd)  # also releases the lock
+
+        return ticket
+
+    def _wait_for_predecessor(self, ticket: int):
+        """Block until the processes holding all earlier tickets dequeued or terminated"""
+        predecessors: List[int] = sorted(
+            (
+                int(path.stem)
+                for path in self._queue_dir.glob("*.lock")
+                if path.stem.isdigit() and int(path.stem) < ticket
+            ),
+            reverse=True,
+        )
+
+        # a dequeued predecessor has waited for all of its own predecessors before, so only the closest live predecessor
+        # actually blocks, but a terminated one has not and must not let its successor overtake the rest of the queue
+        for predecessor in predecessors:
+            predecessor_path: Path = self._queue_dir / f"{predecessor}.lock"
+
+            try:
+                predecessor_fd: int = os.open(predecessor_path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue  # the predecessor already dequeued
+
+            try:
+                fcntl.flock(predecessor_fd, fcntl.LOCK_EX)
+                terminated: bool = os.fstat(predecessor_fd).st_nlink > 0
+            finally:
+                os.close(predecessor_fd)
+
+            # remove the lock file of a predecessor that has been terminated while waiting
+            if terminated:
+                predecessor_path.unlink(missing_ok=True)
+
+    def _dequeue(self):
+        """Remove and unlock the ticket file to wake up the successor"""
+        if self._ticket_fd is not None:
+            if self._ticket_path is not None:
+                self._ticket_path.unlink(missing_ok=True)
+
+            os.close(self._ticket_fd)
+            self._ticket_fd = None
+            self._ticket_path = None
+
+    def _clean_up(self):
+        self._dequeue()
+        super()._clean_up()
+
+    def __enter__(self) -> LocalHostSemaphore:
+        ticket: int = self._enqueue()
+        logger.debug("Entering local semaphore of '%s' with ticket '%i'", self._host, ticket)
+
+        self._wait_for_predecessor(ticket)
+        self._slot = self._table.acquire()  # blocking acquisition, woken up as soon as a slot is released
+        self._dequeue()
+        return self
+
+
+class LocalHostCompilationSemaphore(LocalHostSemaphore):
+    """
+    Tracks that we issue a certain maximum amount of concurrent compilation jobs on the local machine.
+    """
+
+    DEFAULT_EXPECTED_COMPILATION_TIME: ClassVar[float] = 10.0
+    """Default average expected compilation time. [s]"""
+
+
+class LocalHostPreprocessingSemaphore(LocalHostSemaphore):
+    """
+    Tracks that we issue a certain maximum amount of concurrent preprocessing jobs on the local machine.
+    """
+
+    DEFAULT_EXPECTED_PREPROCESSING_TIME: ClassVar[float] = 2.0
+    """Default average expected preprocessing time. [s]"""
+
+
+class LocalHostHedgingSemaphore(LocalHostCompilationSemaphore):
+    """
+    Tracks hedged compilation jobs via the local compilation semaphore.
+
+    Hedging a straggling remote compilation request locally is only worthwhile if a local compilation slot is free right
+    away, a slot will therefore be occupied without waiting and might throw an exception on failure.
+    """
+
+    def __enter__(self) -> LocalHostHedgingSemaphore:
+        logger.debug("Entering local semaphore of '%s' without waiting", self._host)
+        self._claim("All local compilation slots are occupied.")
+        return self
@@ -61,6 +61,7 @@ class Arguments:
     SPECIFY_LANGUAGE_ARG: str = "-x"
 
     INCLUDE_ARGS: List[str] = ["-I", "-isysroot", "-isystem"]
+    INCLUDE_DIRECTORY_ARGS: List[str] = ["-I", "-iquote", "-isystem", "-idirafter"]
 
     FISSION_ARG: str = "-gsplit-dwarf"
     DEBUG_SYMBOLS_ARG: str = "-g"
@@ -348,6 +349,21 @@ class Arguments:
 
         return source_files
 
+    @cached_property
+    def include_directories(self) -> List[str]:
+        """extract and return all explicitly specified include directories"""
+        include_directories: List[str] = []
+
+        it: Iterator[str] = iter(self.args)
+        for arg in it:
+            for include_directory_arg in self.INCLUDE_DIRECTORY_ARGS:
+                if arg == include_directory_arg:  # include argument with directory following: e.g.: -I include
+                    include_directories.append(next(it))
+                elif arg.startswith(include_directory_arg):  # compact include argument: e.g.: -Iinclude
+                    include_directories.append(arg[len(include_directory_arg) :])
+
+        return include_directories
+
     @cached_property
     def object_files(self) -> List[str]:
         """extract and return all object files that will be linked"""
@@ -573,7 +589,7 @@ class Arguments:
     def _execute_args(
         args: List[str],
         check: bool = False,
-        cwd: Path = Path.cwd(),
+        cwd: Optional[Path] = None,
         output: bool = False,
         event_socket_fd: Optional[int] = None,
         timeout: Optional[float] = None,
@@ -601,7 +617,7 @@ class Arguments:
     def _execute_args_sync(
         args: List[str],
         check: bool,
-        cwd: Path,
+        cwd: Optional[Path],
         output: bool,
         timeout: Optional[float],
     ):
@@ -658,7 +674,7 @@ class Arguments:
     def _execute_async(
         args: List[str],
         event_socket_fd: int,
-        cwd: Path,
+        cwd: Optional[Path],
         timeout: Optional[float],
     ) -> ArgumentsExecutionResult:
         with subprocess.Popen(args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as process:
@@ -6,12 +6,9 @@
 from __future__ import annotations
 
 import logging
-import lzma
 from abc import ABC, abstractmethod
 from typing import List, Optional, Type
 
-import lzo
-
 logger = logging.getLogger(__name__)
 
 
@@ -137,11 +134,16 @@ class LZO(Compression):
     """Lempel-Ziv-Oberhumer compression algorithm"""
 
     def compress(self, data: bytearray) -> bytearray:
+        # compression modules are only imported on use to keep the startup of homcc fast
+        import lzo  # pylint: disable=import-outside-toplevel
+
         compressed_data = bytearray(lzo.compress(bytes(data)))
         logger.debug("LZO: Compressed #%i bytes to #%i bytes.", len(data), len(compressed_data))
         return compressed_data
 
     def decompress(self, data: bytearray) -> bytearray:
+        import lzo  # pylint: disable=import-outside-toplevel
+
         decompressed_data = bytearray(lzo.decompress(bytes(data)))
         logger.debug("LZO: Decompressed #%i bytes to #%i bytes.", len(data), len(decompressed_data))
         return decompressed_data
@@ -155,11 +157,15 @@ class LZMA(Compression):
     """Lempel-Ziv-Markov chain algorithm"""
 
     def compress(self, data: bytearray) -> bytearray:
+        import lzma  # pylint: disable=import-outside-toplevel
+
         compressed_data = bytearray(lzma.compress(data))
         logger.debug("LZMA: Compressed #%i bytes to #%i bytes.", len(data), len(compressed_data))
         return compressed_data
 
     def decompress(self, data: bytearray) -> bytearray:
+        import lzma  # pylint: disable=import-outside-toplevel
+
         decompressed_data = bytearray(lzma.decompress(data))
         logger.debug("LZMA: Decompressed #%i bytes to #%i bytes.", len(data), len(decompressed_data))
         return decompressed_data
@@ -20,7 +20,8 @@ class RemoteCompilationTimeoutError(RecoverableClientError):
 
 
 class RetryableRemoteCompilationError(RecoverableClientError):
-    """Error class to indicate that the compilation should be retried locally even though it failed remotely"""
+    """Error class to indicate that a compilation which failed remotely should be retried elsewhere, i.e. at another
+    host or locally"""
 
 
 class ClientParsingError(RecoverableClientError):
@@ -78,3 +79,11 @@ class UnsupportedCompilerError(Exception):
 
 class ClientDisconnectedError(Exception):
     """The client unexpectedly disconnected."""
+
+
+class UnsupportedIncludeError(Exception):
+    """The include scanner can not determine the dependencies and the preprocessor has to be used instead."""
+
+
+class DependencyTransferError(Exception):
+    """The dependencies of a compilation could not be transferred to the server in time or intact."""
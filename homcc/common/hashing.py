@@ -4,7 +4,16 @@
 
 """shared common functionality regarding hashes"""
 import hashlib
-from pathlib import Path
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List
+
+HASHING_CHUNK_SIZE: int = 1 << 20
+"""Files larger than this are hashed chunk-wise so that they are never fully read into memory."""
+MAX_HASHING_WORKERS: int = min(8, os.cpu_count() or 1)
+"""Upper bound of threads that concurrently hash files."""
+MIN_FILES_PER_HASHING_WORKER: int = 64
+"""Lower bound of files per hashing thread, so that small dependency sets are not slowed down by thread overhead."""
 
 
 def hash_file_with_bytes(content: bytes) -> str:
@@ -14,4 +23,40 @@ def hash_file_with_bytes(content: bytes) -> str:
 
 def hash_file_with_path(path: str) -> str:
     """Generates a hash from the file at the given path."""
-    return hash_file_with_bytes(Path(path).read_bytes())
+    with open(path, "rb", buffering=0) as file:
+        if os.fstat(file.fileno()).st_size <= HASHING_CHUNK_SIZE:
+            return hash_file_with_bytes(file.readall())
+
+        sha1 = hashlib.sha1()
+        chunk = bytearray(HASHING_CHUNK_SIZE)
+        chunk_view = memoryview(chunk)
+
+        while chunk_size := file.readinto(chunk):
+            sha1.update(chunk_view[:chunk_size])
+
+        return sha1.hexdigest()
+
+
+def hash_files_with_paths(paths: Iterable[str], max_workers: int = MAX_HASHING_WORKERS) -> Dict[str, str]:
+    """
+    Generates hashes from all files at the given paths. The files are hashed concurrently by a bounded amount of
+    threads, which is effective as hashlib and file reads release the GIL.
+    """
+    paths = list(paths)
+    workers: int = min(max_workers, len(paths) // MIN_FILES_PER_HASHING_WORKER)
+
+    if workers <= 1:
+        return {path: hash_file_with_path(path) for path in paths}
+
+    def hash_batch(batch: List[str]) -> List[str]:
+        return [hash_file_with_path(path) for path in batch]
+
+    # split the paths into one batch per worker to avoid the scheduling overhead of one task per file
+    batches: List[List[str]] = [paths[index::workers] for index in range(workers)]
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="homcc_hashing") as executor:
+        return {
+            path: sha1sum
+            for batch, sha1sums in zip(batches, executor.map(hash_batch, batches))
+            for path, sha1sum in zip(batch, sha1sums)
+        }
@@ -83,16 +83,10 @@ class Host:
 
         return Host.localhost_with_limit(default_localhost_limit)
 
-    def __int__(self) -> int:
-        return self.id()
-
-    def id(self) -> int:
-        """Generates an ID for a certain host by hashing a string representation and
-        cutting it to 4 digits. We can use max. 4 digits because we can not exceed
-        the SHRT_MAX constant (see https://semanchuk.com/philip/sysv_ipc).
-        This may lead to collisions, but we usually do not have many hosts,
-        so the probability of collisions should be acceptable."""
-        return int(hashlib.sha1(str(self).encode(ENCODING)).hexdigest(), 16) % 10**4
+    def id(self) -> str:
+        """Generates an ID for a certain host by hashing a string representation. The full SHA-256 digest is used, so
+        that different hosts do not collide, and it is safe to use as a filename."""
+        return hashlib.sha256(str(self).encode(ENCODING)).hexdigest()
 
     @classmethod
     def from_str(cls, host_str: str) -> Host:
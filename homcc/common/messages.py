@@ -6,6 +6,7 @@
 from __future__ import annotations
 
 import json
+import socket
 from abc import ABC
 from dataclasses import dataclass
 from enum import Enum, auto
@@ -13,7 +14,7 @@ from typing import Dict, List, Optional, Tuple
 
 from homcc.common.arguments import ArgumentsExecutionResult
 from homcc.common.compression import CompressedBytes, Compression, NoCompression
-from homcc.common.constants import DWARF_FILE_SUFFIX, ENCODING
+from homcc.common.constants import DWARF_FILE_SUFFIX, ENCODING, TCP_BUFFER_SIZE
 
 
 class MessageType(Enum):
@@ -26,6 +27,8 @@ class MessageType(Enum):
     DependencyReplyMessage = auto()
     CompilationResultMessage = auto()
     ConnectionRefusedMessage = auto()
+    DependencyBatchRequestMessage = auto()
+    QueuedMessage = auto()
 
     def __str__(self):
         return str(self.name)
@@ -60,19 +63,23 @@ class Message(ABC):
         """To be overwritten by subclasses that have extra payload."""
         pass
 
-    def get_further_payload(self) -> bytearray:
-        """To be overwritten by subclasses to append something after the message's JSON object."""
-        return bytearray()
+    def get_further_payload_buffers(self) -> List[bytearray]:
+        """To be overwritten by subclasses to append buffers after the message's JSON object."""
+        return []
 
-    def to_bytes(self) -> bytearray:
-        """Serializes the message as a bytearray."""
+    def to_buffers(self) -> List[bytearray]:
+        """Serializes the message as a list of buffers, so that large payloads can be sent without concatenating them
+        beforehand, e.g. via socket.sendmsg."""
         json_bytes: bytearray = bytearray(self.get_json_str(), ENCODING)
 
         json_size: int = len(json_bytes)
         json_size_bytes: bytearray = bytearray(json_size.to_bytes(length=8, byteorder="little", signed=False))
 
-        payload: bytearray = json_size_bytes + json_bytes + self.get_further_payload()
-        return payload
+        return [json_size_bytes + json_bytes, *self.get_further_payload_buffers()]
+
+    def to_bytes(self) -> bytearray:
+        """Serializes the message as a bytearray."""
+        return bytearray().join(self.to_buffers())
 
     def _get_json_dict(self) -> Dict:
         """Gets the JSON dict of this object. Should be overwritten by subclasses to
@@ -109,6 +116,10 @@ class Message(ABC):
             return CompilationResultMessage.from_dict(json_dict)
         elif message_type == MessageType.ConnectionRefusedMessage:
             return ConnectionRefusedMessage.from_dict(json_dict)
+        elif message_type == MessageType.DependencyBatchRequestMessage:
+            return DependencyBatchRequestMessage.from_dict(json_dict)
+        elif message_type == MessageType.QueuedMessage:
+            return QueuedMessage.from_dict(json_dict)
         else:
             raise ValueError(f"{message_type} is not a valid message type. Can not parse message.")
 
@@ -295,6 +306,37 @@ class DependencyRequestMessage(Message):
         return DependencyRequestMessage(json_dict["sha1sum"])
 
 
+class DependencyBatchRequestMessage(Message):
+    """Message that lets the server request multiple dependencies from the client at once. The client replies with one
+    DependencyReplyMessage per dependency in the requested order."""
+
+    def __init__(self, sha1sums: List[str]):
+        self.sha1sums = sha1sums
+
+        super().__init__(MessageType.DependencyBatchRequestMessage)
+
+    def _get_json_dict(self) -> Dict:
+        """Gets the JSON dict of this object."""
+        json_dict: Dict = super()._get_json_dict()
+
+        json_dict["sha1sums"] = self.sha1sums
+
+        return json_dict
+
+    def get_sha1sums(self) -> List[str]:
+        """Returns the SHA1SUMs of the dependencies."""
+        return self.sha1sums
+
+    def __eq__(self, other):
+        if isinstance(other, DependencyBatchRequestMessage):
+            return self.get_sha1sums() == other.get_sha1sums()
+        return False
+
+    @staticmethod
+    def from_dict(json_dict: dict) -> DependencyBatchRequestMessage:
+        return DependencyBatchRequestMessage(json_dict["sha1sums"])
+
+
 class DependencyReplyMessage(Message):
     """Message that contains exactly one previously requested file."""
 
@@ -325,9 +367,9 @@ class DependencyReplyMessage(Message):
     def get_content(self) -> bytearray:
         return self.content.get_data()
 
-    def get_further_payload(self) -> bytearray:
+    def get_further_payload_buffers(self) -> List[bytearray]:
         """Overwritten so that the dependency's content is appended to the message."""
-        return self.content.to_wire()
+        return [self.content.to_wire()]
 
     def set_further_payload(self, further_payload: bytearray):
         """Overwritten so that the dependency's content can be set."""
@@ -485,14 +527,9 @@ class CompilationResultMessage(Message):
     def get_compilation_result(self) -> ArgumentsExecutionResult:
         return ArgumentsExecutionResult(self.return_code, self.stdout, self.stderr)
 
-    def get_further_payload(self) -> bytearray:
+    def get_further_payload_buffers(self) -> List[bytearray]:
         """Overwritten so that the object files content and the dwarf files content can be appended to the message."""
-        further_payload = bytearray()
-
-        for file in self.get_files():
-            further_payload += file.to_wire()
-
-        return further_payload
+        return [file.to_wire() for file in self.get_files()]
 
     def set_further_payload(self, further_payload: bytearray):
         """Overwritten so that the object files content and the dwarf files content can be set."""
@@ -578,3 +615,166 @@ class ConnectionRefusedMessage(Message):
     @staticmethod
     def from_dict(json_dict: dict) -> ConnectionRefusedMessage:
         return ConnectionRefusedMessage(json_dict["info"])
+
+
+class QueuedMessage(Message):
+    """Message that informs the client that its compilation is queued until one of the server's compilation slots is
+    free. Dependencies are still requested and uploaded while the compilation is queued."""
+
+    def __init__(self, position: int, estimated_wait: Optional[float]):
+        self.position: int = position
+        self.estimated_wait: Optional[float] = estimated_wait
+
+        super().__init__(MessageType.QueuedMessage)
+
+    def _get_json_dict(self) -> Dict:
+        """Gets the JSON dict of this object."""
+        json_dict: Dict = super()._get_json_dict()
+
+        json_dict["position"] = self.position
+        json_dict["estimated_wait"] = self.estimated_wait
+
+        return json_dict
+
+    def get_position(self) -> int:
+        """Returns the 1-based position of the compilation in the server's queue."""
+        return self.position
+
+    def get_estimated_wait(self) -> Optional[float]:
+        """Returns the estimated time in seconds until the compilation starts, None if it can not be estimated yet."""
+        return self.estimated_wait
+
+    def __eq__(self, other):
+        if isinstance(other, QueuedMessage):
+            return (
+                self.get_position() == other.get_position() and self.get_estimated_wait() == other.get_estimated_wait()
+            )
+        return False
+
+    @staticmethod
+    def from_dict(json_dict: dict) -> QueuedMessage:
+        return QueuedMessage(json_dict["position"], json_dict["estimated_wait"])
+
+
+class MessageDecoder:
+    """
+    Stateful decoder that incrementally reassembles messages from a stream of received bytes.
+
+    The JSON size field and the JSON object of each message are parsed exactly once and the further payload of a message
+    is collected in a buffer that is preallocated to its final size, so that received data is neither re-parsed nor
+    re-concatenated. Data can either be fed to the decoder or be received directly into the decoder's buffers.
+    """
+
+    header: bytearray
+    """Buffer for the JSON size field and the JSON object of the current message."""
+    json_size: Optional[int]
+    """Size of the JSON object of the current message, None if the JSON size field is not received yet."""
+    message: Optional[Message]
+    """Current message that still lacks its further payload."""
+    payload: bytearray
+    """Preallocated buffer for the further payload of the current message."""
+    payload_received: int
+    """Amount of bytes of the further payload that were received yet."""
+
+    def __init__(self):
+        self.header = bytearray()
+        self.json_size = None
+        self.message = None
+        self.payload = bytearray()
+        self.payload_received = 0
+
+    def bytes_needed(self) -> int:
+        """Returns the amount of bytes that are needed to complete the next part of the current message, i.e. its JSON
+        size field, its JSON object or its further payload."""
+        if self.message is not None:
+            return len(self.payload) - self.payload_received
+
+        if self.json_size is None:
+            return Message.MINIMUM_SIZE_BYTES - len(self.header)
+
+        return Message.MINIMUM_SIZE_BYTES + self.json_size - len(self.header)
+
+    def has_partial_message(self) -> bool:
+        """Returns True if a message was received partially."""
+        return len(self.header) > 0 or self.message is not None
+
+    def _header_received(self) -> Optional[Message]:
+        if self.bytes_needed() > 0:
+            return None
+
+        if self.json_size is None:
+            self.json_size = int.from_bytes(self.header, byteorder="little", signed=False)
+
+            if self.bytes_needed() > 0:
+                return None
+
+        json_dict: dict = json.loads(self.header[Message.JSON_OFFSET :].decode(encoding=ENCODING))
+        message: Message = Message._parse_message_json(json_dict)  # pylint: disable=protected-access
+
+        self.header = bytearray()
+        self.json_size = None
+
+        if (further_payload_size := message.get_further_payload_size()) == 0:
+            return message
+
+        self.message = message
+        self.payload = bytearray(further_payload_size)
+        self.payload_received = 0
+        return None
+
+    def _payload_received(self, size: int) -> Optional[Message]:
+        self.payload_received += size
+
+        if self.message is None or self.bytes_needed() > 0:
+            return None
+
+        message: Message = self.message
+        message.set_further_payload(self.payload)
+
+        self.message = None
+        self.payload = bytearray()
+        self.payload_received = 0
+        return message
+
+    def feed(self, data: bytes) -> List[Message]:
+        """Feeds received data to the decoder and returns all messages that were completed by it."""
+        messages: List[Message] = []
+
+        with memoryview(data) as data_view:
+            offset: int = 0
+
+            while offset < len(data_view):
+                size: int = min(len(data_view) - offset, self.bytes_needed())
+                message: Optional[Message]
+
+                if self.message is not None:
+                    self.payload[self.payload_received : self.payload_received + size] = data_view[
+                        offset : offset + size
+                    ]
+                    message = self._payload_received(size)
+                else:
+                    self.header += data_view[offset : offset + size]
+                    message = self._header_received()
+
+                if message is not None:
+                    messages.append(message)
+
+                offset += size
+
+        return messages
+
+    def receive_from(self, sock: socket.socket) -> Optional[List[Message]]:
+        """Receives data from the socket and returns all messages that were completed by it. Pending further payloads
+        are received directly into their preallocated buffer. Returns None if the connection has been closed."""
+        if self.message is None:
+            data: bytes = sock.recv(TCP_BUFFER_SIZE)
+            return self.feed(data) if data else None
+
+        with memoryview(self.payload) as payload_view:
+            size: int = sock.recv_into(payload_view[self.payload_received :])
+
+        if size == 0:
+            return None
+
+        message: Optional[Message] = self._payload_received(size)
+        return [message] if message is not None else []
@@ -0,0 +1,116 @@
+# Copyright (c) 2023 Celonis SE
+# Covered under the included MIT License:
+#   https://github.com/celonis/homcc/blob/main/LICENSE
+
+"""Admission of compilation requests to the limited slots of the homcc server"""
+import threading
+import time
+from collections import deque
+from typing import Deque, Optional
+
+
+class AdmissionTicket:
+    """Place of a single request in the admission queue."""
+
+    enqueue_time: float
+    """Monotonic time at which the request was enqueued."""
+
+    def __init__(self):
+        self.enqueue_time = time.monotonic()
+
+
+class AdmissionQueue:
+    """
+    Admits requests to a limited amount of slots in first-in-first-out order.
+
+    Requests that find all slots occupied wait in a bounded queue until a slot is released or their deadline expires,
+    so that short peaks of requests are served as soon as capacity exists instead of being refused right away.
+    """
+
+    HOLD_TIME_SMOOTHING: float = 0.2
+    """Weight of the latest hold time in the moving average of how long slots are occupied."""
+
+    limit: int
+    """Amount of slots."""
+    queue_limit: int
+    """Maximum amount of queued requests."""
+    occupied_slots: int
+    """Amount of currently occupied slots."""
+    average_hold_time: Optional[float]
+    """Moving average of how long slots are occupied in seconds, None if no slot has been released yet."""
+
+    def __init__(self, limit: int, queue_limit: int):
+        self.limit = limit
+        self.queue_limit = queue_limit
+        self.occupied_slots = 0
+        self.average_hold_time = None
+
+        self._queue: Deque[AdmissionTicket] = deque()
+        self._condition: threading.Condition = threading.Condition()
+
+    def __len__(self) -> int:
+        """Returns the amount of queued requests."""
+        with self._condition:
+            return len(self._queue)
+
+    def try_acquire(self) -> bool:
+        """Acquires a free slot without waiting, fails if all slots are occupied or other requests are queued."""
+        with self._condition:
+            if self._queue or self.occupied_slots >= self.limit:
+                return False
+
+            self.occupied_slots += 1
+            return True
+
+    def enqueue(self) -> Optional[AdmissionTicket]:
+        """Enqueues a request, returns None if the queue is full."""
+        with self._condition:
+            if len(self._queue) >= self.queue_limit:
+                return None
+
+            ticket: AdmissionTicket = AdmissionTicket()
+            self._queue.append(ticket)
+            return ticket
+
+    def position(self, ticket: AdmissionTicket) -> int:
+        """Returns the 1-based position of the queued request."""
+        with self._condition:
+            return self._queue.index(ticket) + 1
+
+    def estimated_wait(self, position: int) -> Optional[float]:
+        """Estimates the time in seconds until the request at the given position acquires a slot, assuming that each
+        slot is occupied for the average hold time, returns None if no slot has been released yet."""
+        if self.average_hold_time is None:
+            return None
+
+        return position * self.average_hold_time / self.limit
+
+    def acquire(self, ticket: AdmissionTicket, deadline: float) -> bool:
+        """Waits until the queued request is first in line and a slot is free or until the monotonic deadline expires,
+        returns whether the slot was acquired. The request is dequeued in both cases."""
+        with self._condition:
+            acquired: bool = self._condition.wait_for(
+                lambda: self._queue[0] is ticket and self.occupied_slots < self.limit,
+                timeout=max(deadline - time.monotonic(), 0),
+            )
+
+            self._queue.remove(ticket)
+
+            if acquired:
+                self.occupied_slots += 1
+
+            # the next request may be first in line now
+            self._condition.notify_all()
+            return acquired
+
+    def release(self, hold_time: float):
+        """Releases an occupied slot that was held for the given time in seconds."""
+        with self._condition:
+            self.occupied_slots -= 1
+
+            if self.average_hold_time is None:
+                self.average_hold_time = hold_time
+            else:
+                self.average_hold_time += self.HOLD_TIME_SMOOTHING * (hold_time - self.average_hold_time)
+
+            self._condition.notify_all()
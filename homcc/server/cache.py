@@ -3,51 +3,339 @@
 #   https://github.com/celonis/homcc/blob/main/LICENSE
 
 """Caching module of the homcc server."""
+import errno
 import logging
+import os
+import shutil
+import time
 from pathlib import Path
-from threading import Lock
-from typing import Dict
+from tempfile import NamedTemporaryFile
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, TypeVar
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 
 class Cache:
-    """Represents the homcc server cache that is used to cache dependencies."""
+    """
+    Represents the homcc server cache that is used to cache dependencies.
+
+    The cache can optionally be bounded by a maximum amount of bytes and entries. If a bound is exceeded, the least
+    recently used entries are evicted. Entries that are still hard-linked into an instance folder, i.e. that an ongoing
+    compilation depends on, are never evicted.
+    """
+
+    FOLDER_NAME: str = "cache"
+    """Name of the folder inside the root folder in which entries are cached."""
+    TEMPORARY_FILE_PREFIX: str = ".tmp_"
+    """Prefix of files that are currently being written to the cache folder."""
+    CACHED_FILE_MODE: int = 0o644
+    """Permissions of cached files, so that they are readable from within sandboxed compilations."""
 
     cache: Dict[str, str]
-    """'Hash' -> 'File path' on server map for holding paths to cached files"""
+    """'Hash' -> 'File path' on server map for holding paths to cached files, ordered from least to most recently
+    used"""
     cache_mutex: Lock
     """Mutex for locking the cache."""
     cache_folder: Path
     """Path to the cache on the file system."""
+    max_bytes: Optional[int]
+    """Maximum amount of bytes of all cached files, unbounded if None."""
+    max_entries: Optional[int]
+    """Maximum amount of cached files, unbounded if None."""
+    sizes: Dict[str, int]
+    """'Hash' -> 'File size' map of all cached files."""
+    resident_bytes: int
+    """Amount of bytes that are currently cached."""
+    evictions: int
+    """Amount of entries that were evicted from the cache."""
+    uploads: Dict[str, Event]
+    """'Hash' -> 'Event' map of dependencies that are currently being uploaded, the event is set once the upload has
+    finished or was abandoned."""
+    pins: Dict[str, int]
+    """'Hash' -> 'Amount' map of ongoing compilations that linked the cached file, pinned entries are not evicted. Pins
+    are only kept in memory, so that files still linked by compilations of a killed server never pin their entries."""
 
-    def __init__(self, root_folder: Path):
+    def __init__(self, root_folder: Path, max_bytes: Optional[int] = None, max_entries: Optional[int] = None):
         self.cache_folder = self._create_cache_folder(root_folder)
         self.cache: Dict[str, str] = {}
         self.cache_mutex: Lock = Lock()
 
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.sizes = {}
+        self.resident_bytes = 0
+        self.evictions = 0
+        self.uploads = {}
+        self.pins = {}
+
+        self._load_cache_folder()
+
     def __contains__(self, key):
         with self.cache_mutex:
             return key in self.cache
 
-    @staticmethod
-    def _create_cache_folder(root_temp_folder: Path) -> Path:
+    def __len__(self) -> int:
+        with self.cache_mutex:
+            return len(self.cache)
+
+    @classmethod
+    def _create_cache_folder(cls, root_temp_folder: Path) -> Path:
         """Creates the cache folder inside the root folder."""
-        cache_folder = root_temp_folder / Path("cache")
+        cache_folder = root_temp_folder / Path(cls.FOLDER_NAME)
         cache_folder.mkdir(parents=True, exist_ok=True)
 
         logger.info("Created cache folder in '%s'.", cache_folder.absolute())
         return cache_folder
 
+    def _load_cache_folder(self):
+        """Rebuilds the cache index from the files that are already present in the cache folder, e.g. when the cache
+        folder is persisted across server restarts. Leftovers of interrupted writes are removed."""
+        entries: List[os.DirEntry] = []
+
+        with os.scandir(self.cache_folder) as iterator:
+            for entry in iterator:
+                if entry.name.startswith(self.TEMPORARY_FILE_PREFIX):
+                    logger.debug("Removing incompletely cached file '%s'.", entry.path)
+                    os.unlink(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    entries.append(entry)
+
+        # approximate the previous usage order by the modification time of the cached files
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime_ns):
+            self.cache[entry.name] = entry.path
+            self.sizes[entry.name] = entry.stat().st_size
+            self.resident_bytes += self.sizes[entry.name]
+
+        if self.cache:
+            logger.info(
+                "Loaded #%i cached dependencies (#%i bytes) from '%s'.",
+                len(self.cache),
+                self.resident_bytes,
+                self.cache_folder.absolute(),
+            )
+
+        with self.cache_mutex:
+            self._evict()
+
+    def _is_exceeded(self) -> bool:
+        return (self.max_bytes is not None and self.resident_bytes > self.max_bytes) or (
+            self.max_entries is not None and len(self.cache) > self.max_entries
+        )
+
+    def _evict(self, keep: Optional[str] = None):
+        """Evicts least recently used entries until the cache is within its bounds again. Pinned entries and the entry
+        with the hash value keep are not evicted. Must be called with the cache mutex held."""
+        if not self._is_exceeded():
+            return
+
+        evicted_entries: int = 0
+        evicted_bytes: int = 0
+
+        for hash_value, cached_file in list(self.cache.items()):
+            if not self._is_exceeded():
+                break
+
+            if hash_value == keep or hash_value in self.pins:
+                continue  # still in use by an ongoing compilation
+
+            try:
+                os.unlink(cached_file)
+            except FileNotFoundError:
+                pass
+
+            del self.cache[hash_value]
+            size: int = self.sizes.pop(hash_value, 0)
+            self.resident_bytes -= size
+
+            evicted_entries += 1
+            evicted_bytes += size
+
+        self.evictions += evicted_entries
+
+        logger.info(
+            "Evicted #%i cached dependencies (#%i bytes), #%i dependencies (#%i bytes) remain cached, #%i evictions in "
+            "total.",
+            evicted_entries,
+            evicted_bytes,
+            len(self.cache),
+            self.resident_bytes,
+            self.evictions,
+        )
+
+        if self._is_exceeded():
+            logger.warning("Cache bounds are exceeded as the remaining cached dependencies are currently in use.")
+
     def get(self, hash_value: str) -> str:
         """Gets an entry (path) from the cache given a hash."""
         with self.cache_mutex:
-            return self.cache[hash_value]
+            cached_file: str = self.cache.pop(hash_value)
+            self.cache[hash_value] = cached_file  # mark as most recently used
+            return cached_file
+
+    def link(self, hash_value: str, target: str) -> bool:
+        """Links the cached entry with the given hash to the target path and pins it until it is unpinned again once
+        the target was removed. Linking and eviction are mutually exclusive. Returns False if the entry with the given
+        hash is not cached."""
+        with self.cache_mutex:
+            if (cached_file := self.cache.pop(hash_value, None)) is None:
+                return False
+
+            self.cache[hash_value] = cached_file  # mark as most recently used
+
+            try:
+                os.link(cached_file, target)
+                logger.debug("Linked '%s' to '%s'.", target, cached_file)
+            except OSError as error:
+                if error.errno != errno.EXDEV:
+                    raise error
+
+                # a persistent cache folder may reside on a different file system than the instance folders
+                shutil.copyfile(cached_file, target)
+                logger.debug("Copied '%s' to '%s'.", cached_file, target)
+
+            self.pins[hash_value] = self.pins.get(hash_value, 0) + 1
+
+        return True
+
+    def unpin(self, hash_value: str):
+        """Unpins the entry with the given hash that was linked before, so that it can be evicted again."""
+        with self.cache_mutex:
+            if (pins := self.pins.pop(hash_value, 0)) > 1:
+                self.pins[hash_value] = pins - 1
+
+            self._evict()
+
+    def begin_upload(self, hash_value: str) -> bool:
+        """Marks the dependency with the given hash as being uploaded. Returns False if the dependency is already cached
+        or currently uploaded via a different connection, in which case it should not be requested again."""
+        with self.cache_mutex:
+            if hash_value in self.cache or hash_value in self.uploads:
+                return False
+
+            self.uploads[hash_value] = Event()
+            return True
+
+    def end_upload(self, hash_value: str):
+        """Marks the upload of the dependency with the given hash as finished or abandoned and wakes up all requests
+        that are waiting for it."""
+        with self.cache_mutex:
+            if (upload := self.uploads.pop(hash_value, None)) is not None:
+                upload.set()
+
+    def wait_for_upload(self, hash_value: str, timeout: float) -> bool:
+        """Waits until the upload of the dependency with the given hash has finished or was abandoned. Returns False if
+        the timeout expired beforehand."""
+        with self.cache_mutex:
+            upload: Optional[Event] = self.uploads.get(hash_value)
+
+        return upload is None or upload.wait(timeout)
 
     def put(self, hash_value: str, content: bytearray):
         """Stores a dependency in the cache."""
         cached_file_path = self.cache_folder / hash_value
-        Path.write_bytes(cached_file_path, content)
+
+        # write to a temporary file first and atomically move it afterwards, so that neither concurrent readers nor a
+        # restarted server that loads the persisted cache folder can ever observe partially written dependencies
+        with NamedTemporaryFile(dir=self.cache_folder, prefix=self.TEMPORARY_FILE_PREFIX, delete=False) as file:
+            file.write(content)
+            os.fchmod(file.fileno(), self.CACHED_FILE_MODE)
+
+        os.replace(file.name, cached_file_path)
 
         with self.cache_mutex:
+            self.cache.pop(hash_value, None)
             self.cache[hash_value] = str(cached_file_path)
+
+            self.resident_bytes += len(content) - self.sizes.get(hash_value, 0)
+            self.sizes[hash_value] = len(content)
+
+            self._evict(keep=hash_value)
+
+
+class ResultCache(Cache):
+    """
+    Represents the homcc server cache that is used to cache serialized compilation results.
+
+    Results are keyed by everything the compilation depends on, so that identical compilation requests, e.g. of
+    different clients, can be answered without invoking the compiler again.
+    """
+
+    FOLDER_NAME: str = "results"
+
+    def read(self, hash_value: str) -> Optional[bytes]:
+        """Reads the cached entry with the given hash. Returns None if the entry is not cached."""
+        with self.cache_mutex:
+            if (cached_file := self.cache.pop(hash_value, None)) is None:
+                return None
+
+            self.cache[hash_value] = cached_file  # mark as most recently used
+
+        # read the file without holding the mutex, an entry that was evicted in the meantime is treated as not cached
+        try:
+            with open(cached_file, "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            logger.debug("Cached result '%s' was evicted while being read.", hash_value)
+            return None
+
+
+class ProbeCache:
+    """
+    Represents the homcc server cache that is used to memoize probes of the compilation environment.
+
+    Probes, e.g. whether a compiler exists, which target it produces or whether a docker container is running, spawn
+    processes and would otherwise be repeated for every single compilation request. Their results are only memoized for
+    a limited time, so that changes inside of sandboxes are noticed eventually. Results can additionally be bound to a
+    cheaply determinable fingerprint, e.g. of the compiler binary, which invalidates them as soon as it changes.
+    Negative results, i.e. False or None, are not memoized, so that e.g. installing a missing compiler or starting a
+    docker container takes effect immediately.
+    """
+
+    MAX_ENTRIES: int = 1024
+    """Maximum amount of memoized probe results, the oldest ones are dropped once exceeded."""
+
+    ttl: float
+    """Time in seconds after which memoized probe results expire."""
+    probes: Dict[Hashable, Tuple[float, Any, Any]]
+    """'Key' -> ('Expiration time', 'Fingerprint', 'Result') map of memoized probe results, ordered from the earliest
+    to the latest expiration time."""
+    probes_mutex: Lock
+    """Mutex for locking the memoized probe results."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.probes = {}
+        self.probes_mutex = Lock()
+
+    def __len__(self) -> int:
+        with self.probes_mutex:
+            return len(self.probes)
+
+    def get(self, key: Hashable, probe: Callable[[], T], fingerprint: Any = None) -> T:
+        """Returns the memoized result of the probe with the given key if it did not expire and was memoized with the
+        same fingerprint. Otherwise, executes the probe and memoizes its result. Exceptions and negative results are
+        not memoized."""
+        with self.probes_mutex:
+            if (memoized_probe := self.probes.get(key)) is not None:
+                expiration_time, memoized_fingerprint, result = memoized_probe
+
+                if time.monotonic() < expiration_time and memoized_fingerprint == fingerprint:
+                    return result
+
+        # probes may take a while, so they are executed without holding the mutex
+        result = probe()
+
+        with self.probes_mutex:
+            # reinsert the key, so that the memoized results remain ordered by their expiration time
+            self.probes.pop(key, None)
+
+            if result is not None and result is not False:
+                self.probes[key] = (time.monotonic() + self.ttl, fingerprint, result)
+
+            while len(self.probes) > self.MAX_ENTRIES:
+                del self.probes[next(iter(self.probes))]
+
+        return result
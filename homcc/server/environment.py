@@ -5,22 +5,26 @@
 """Module containing methods to manage the server environment, mostly file and path manipulation."""
 import logging
 import os
+import shutil
+import subprocess
 import uuid
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
 
 from homcc.common.arguments import Arguments, ArgumentsExecutionResult
 from homcc.common.compression import Compression
 from homcc.common.constants import DWARF_FILE_SUFFIX
 from homcc.common.messages import CompilationResultMessage, File
 from homcc.common.shell_environment import HostShellEnvironment, ShellEnvironment
-from homcc.server.cache import Cache
+from homcc.server.cache import Cache, ProbeCache
 from homcc.server.docker import DockerShellEnvironment
 from homcc.server.schroot import SchrootShellEnvironment
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 COMPILATION_TIMEOUT: float = 240
 OBJECT_FILE_SUFFIX = ".o"
 
@@ -38,6 +42,13 @@ class Environment:
     """Compression used for data transfer."""
     sock_fd: int
     """File descriptor of the socket that is used to communicate."""
+    sandbox: Tuple[Optional[str], Optional[str]]
+    """Schroot profile and docker container in which compilations are executed."""
+    probe_cache: Optional[ProbeCache]
+    """Cache for memoizing probes of the compiler, probes are executed for each request if None."""
+    linked_dependencies: List[Tuple[Cache, str]]
+    """Caches and hashes of all cached dependencies that were linked into the instance folder, which are pinned in their
+    cache until the instance folder is removed."""
 
     def __init__(
         self,
@@ -47,6 +58,7 @@ class Environment:
         docker_container: Optional[str],
         compression: Compression,
         sock_fd: int,
+        probe_cache: Optional[ProbeCache] = None,
     ):
         def get_shell_env():
             # TODO(o.layer): upgrade to match once we use Python 3.10
@@ -62,6 +74,9 @@ class Environment:
         self.shell_env: ShellEnvironment = get_shell_env()
         self.compression: Compression = compression
         self.sock_fd: int = sock_fd
+        self.sandbox = (schroot_profile, docker_container)
+        self.probe_cache = probe_cache
+        self.linked_dependencies = []
 
     def __del__(self):
         def remove_path(path: Path):
@@ -72,19 +87,26 @@ class Environment:
                 remove_path(iter_path)
             path.rmdir()
 
-        remove_path(Path(self.instance_folder))
-        logger.info("Deleted instance folder '%s'.", self.instance_folder)
+        try:
+            remove_path(Path(self.instance_folder))
+            logger.info("Deleted instance folder '%s'.", self.instance_folder)
+        finally:
+            for cache, dependency_hash in self.linked_dependencies:
+                cache.unpin(dependency_hash)
 
-    @staticmethod
-    def link_dependency_to_cache(dependency_file: str, dependency_hash: str, cache: Cache):
-        """Links the dependency to a cached dependency with the same hash."""
+    def link_dependency_to_cache(self, dependency_file: str, dependency_hash: str, cache: Cache) -> bool:
+        """Links the dependency to a cached dependency with the same hash. Returns False if the dependency is not
+        cached (any more)."""
         # first create the folder structure (if needed), else linking won't work
         dependency_folder = os.path.dirname(dependency_file)
         Path(dependency_folder).mkdir(parents=True, exist_ok=True)
 
         # then do the actual linking
-        os.link(cache.get(dependency_hash), dependency_file)
-        logger.debug("Linked '%s' to '%s'.", dependency_file, cache.get(dependency_hash))
+        if not cache.link(dependency_hash, dependency_file):
+            return False
+
+        self.linked_dependencies.append((cache, dependency_hash))
+        return True
 
     def get_needed_dependencies(self, dependencies: Dict[str, str], cache: Cache) -> Dict[str, str]:
         """Get the dependencies that are not cached and are therefore required to be sent by the client.
@@ -92,9 +114,7 @@ class Environment:
         needed_dependencies: Dict[str, str] = {}
 
         for dependency_file, dependency_hash in dependencies.items():
-            if dependency_hash in cache:
-                self.link_dependency_to_cache(dependency_file, dependency_hash, cache)
-            else:
+            if not self.link_dependency_to_cache(dependency_file, dependency_hash, cache):
                 needed_dependencies[dependency_file] = dependency_hash
 
         return needed_dependencies
@@ -151,13 +171,73 @@ class Environment:
     def map_source_file_to_dwarf_file(self, source_file: str, arguments: Arguments) -> Path:
         return self.map_source_file_to_object_file(source_file, arguments).with_suffix(DWARF_FILE_SUFFIX)
 
+    def _probe_compiler(self, probe_name: str, arguments: Arguments, probe: Callable[[], T], *probe_args: Any) -> T:
+        """Executes the probe of the compiler specified in the arguments or returns its memoized result. Results are
+        memoized per compiler and sandbox, results of compilers on the host are additionally invalidated as soon as the
+        compiler binary changes."""
+        if self.probe_cache is None:
+            return probe()
+
+        fingerprint: Optional[str] = None
+
+        if isinstance(self.shell_env, HostShellEnvironment):
+            fingerprint = self._get_host_compiler_fingerprint(arguments)
+
+        key = (probe_name, str(arguments.compiler), *probe_args, self.sandbox)
+        return self.probe_cache.get(key, probe, fingerprint)
+
     def compiler_exists(self, arguments: Arguments) -> bool:
         """Returns true if the compiler specified in the arguments exists on the system, else false."""
-        return Arguments.is_executable_arg(str(arguments.compiler), shell_env=self.shell_env)
+        return self._probe_compiler(
+            "exists", arguments, lambda: Arguments.is_executable_arg(str(arguments.compiler), shell_env=self.shell_env)
+        )
 
     def compiler_supports_target(self, arguments: Arguments, target: str) -> bool:
         """Returns true if the compiler supports cross-compiling for the given target."""
-        return arguments.compiler.supports_target(target, self.shell_env)
+        return self._probe_compiler(
+            "supports_target",
+            arguments,
+            lambda: arguments.compiler.supports_target(target, self.shell_env),
+            target,
+        )
+
+    def get_compiler_target_triple(self, arguments: Arguments) -> str:
+        """Returns the target triple that the compiler specified in the arguments produces."""
+        return self._probe_compiler(
+            "target_triple", arguments, lambda: arguments.get_compiler_target_triple(self.shell_env)
+        )
+
+    @staticmethod
+    def _get_host_compiler_fingerprint(arguments: Arguments) -> Optional[str]:
+        """Returns the resolved path, size and modification time of the compiler on the host or None if it does not
+        exist."""
+        if (compiler_path := shutil.which(str(arguments.compiler))) is None:
+            return None
+
+        try:
+            compiler_stat = os.stat(compiler_path)
+        except OSError:
+            return None
+
+        return f"{os.path.realpath(compiler_path)}:{compiler_stat.st_size}:{compiler_stat.st_mtime_ns}"
+
+    def get_compiler_fingerprint(self, arguments: Arguments) -> Optional[str]:
+        """Returns a fingerprint that identifies the compiler binary or None if it can not be determined. On the host,
+        the resolved path, size and modification time of the compiler suffice, inside of sandboxes the version output
+        of the compiler is used instead."""
+        if isinstance(self.shell_env, HostShellEnvironment):
+            return self._get_host_compiler_fingerprint(arguments)
+
+        def get_compiler_version() -> Optional[str]:
+            try:
+                result = Arguments(arguments.compiler, ["--version"]).execute(shell_env=self.shell_env, check=True)
+            except (OSError, subprocess.CalledProcessError) as error:
+                logger.warning("Could not determine fingerprint of compiler '%s': %s", arguments.compiler, error)
+                return None
+
+            return result.stdout
+
+        return self._probe_compiler("fingerprint", arguments, get_compiler_version)
 
     def do_compilation(self, arguments: Arguments) -> CompilationResultMessage:
         """Does the compilation and returns the filled result message."""
@@ -92,6 +92,18 @@ def main():
     if (limit := homccd_args_dict["jobs"]) is not None:
         homccd_config.limit = limit
 
+    # CONNECTIONS_LIMIT
+    if (connections_limit := homccd_args_dict["connections_limit"]) is not None:
+        homccd_config.connections_limit = connections_limit
+
+    # QUEUE_LIMIT
+    if (queue_limit := homccd_args_dict["queue_limit"]) is not None:
+        homccd_config.queue_limit = queue_limit
+
+    # QUEUE_TIMEOUT
+    if (queue_timeout := homccd_args_dict["queue_timeout"]) is not None:
+        homccd_config.queue_timeout = queue_timeout
+
     # PORT
     if (port := homccd_args_dict["port"]) is not None:
         homccd_config.port = port
@@ -100,6 +112,30 @@ def main():
     if (address := homccd_args_dict["listen"]) is not None:
         homccd_config.address = address
 
+    # EVENT_LOOP
+    if homccd_args_dict["event_loop"]:
+        homccd_config.event_loop = True
+
+    # CACHE_FOLDER
+    if (cache_folder := homccd_args_dict["cache_folder"]) is not None:
+        homccd_config.cache_folder = cache_folder
+
+    # CACHE_SIZE_LIMIT
+    if (cache_size_limit := homccd_args_dict["cache_size_limit"]) is not None:
+        homccd_config.cache_size_limit = cache_size_limit
+
+    # CACHE_ENTRIES_LIMIT
+    if (cache_entries_limit := homccd_args_dict["cache_entries_limit"]) is not None:
+        homccd_config.cache_entries_limit = cache_entries_limit
+
+    # RESULT_CACHE_SIZE_LIMIT
+    if (result_cache_size_limit := homccd_args_dict["result_cache_size_limit"]) is not None:
+        homccd_config.result_cache_size_limit = result_cache_size_limit
+
+    # PROBE_CACHE_TTL
+    if (probe_cache_ttl := homccd_args_dict["probe_cache_ttl"]) is not None:
+        homccd_config.probe_cache_ttl = probe_cache_ttl
+
     # provide additional DEBUG information
     logger.debug(
         "%s - %s\n" "Caller:\t%s\n" "%s",  # homccd location and version; homccd caller; config info
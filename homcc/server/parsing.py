@@ -31,6 +31,9 @@ DEFAULT_LIMIT: int = (
     or os.cpu_count()  # total number of physical CPUs on the machine
     or -1  # fallback error value
 )
+DEFAULT_CONNECTIONS_LIMIT_FACTOR: int = 4
+DEFAULT_PROBE_CACHE_TTL: int = 60
+DEFAULT_QUEUE_TIMEOUT: float = 10
 
 
 class ShowVersion(Action):
@@ -74,6 +77,15 @@ class ServerConfig:
         HOMCCD_ADDRESS_ENV_VAR: ClassVar[str] = "HOMCCD_ADDRESS"
         HOMCCD_LOG_LEVEL_ENV_VAR: ClassVar[str] = "HOMCCD_LOG_LEVEL"
         HOMCCD_VERBOSE_ENV_VAR: ClassVar[str] = "HOMCCD_VERBOSE"
+        HOMCCD_CACHE_FOLDER_ENV_VAR: ClassVar[str] = "HOMCCD_CACHE_FOLDER"
+        HOMCCD_CACHE_SIZE_LIMIT_ENV_VAR: ClassVar[str] = "HOMCCD_CACHE_SIZE_LIMIT"
+        HOMCCD_CACHE_ENTRIES_LIMIT_ENV_VAR: ClassVar[str] = "HOMCCD_CACHE_ENTRIES_LIMIT"
+        HOMCCD_RESULT_CACHE_SIZE_LIMIT_ENV_VAR: ClassVar[str] = "HOMCCD_RESULT_CACHE_SIZE_LIMIT"
+        HOMCCD_PROBE_CACHE_TTL_ENV_VAR: ClassVar[str] = "HOMCCD_PROBE_CACHE_TTL"
+        HOMCCD_EVENT_LOOP_ENV_VAR: ClassVar[str] = "HOMCCD_EVENT_LOOP"
+        HOMCCD_CONNECTIONS_LIMIT_ENV_VAR: ClassVar[str] = "HOMCCD_CONNECTIONS_LIMIT"
+        HOMCCD_QUEUE_LIMIT_ENV_VAR: ClassVar[str] = "HOMCCD_QUEUE_LIMIT"
+        HOMCCD_QUEUE_TIMEOUT_ENV_VAR: ClassVar[str] = "HOMCCD_QUEUE_TIMEOUT"
 
         @classmethod
         def __iter__(cls) -> Iterator[str]:
@@ -83,6 +95,15 @@ class ServerConfig:
                 cls.HOMCCD_ADDRESS_ENV_VAR,
                 cls.HOMCCD_LOG_LEVEL_ENV_VAR,
                 cls.HOMCCD_VERBOSE_ENV_VAR,
+                cls.HOMCCD_CACHE_FOLDER_ENV_VAR,
+                cls.HOMCCD_CACHE_SIZE_LIMIT_ENV_VAR,
+                cls.HOMCCD_CACHE_ENTRIES_LIMIT_ENV_VAR,
+                cls.HOMCCD_RESULT_CACHE_SIZE_LIMIT_ENV_VAR,
+                cls.HOMCCD_PROBE_CACHE_TTL_ENV_VAR,
+                cls.HOMCCD_EVENT_LOOP_ENV_VAR,
+                cls.HOMCCD_CONNECTIONS_LIMIT_ENV_VAR,
+                cls.HOMCCD_QUEUE_LIMIT_ENV_VAR,
+                cls.HOMCCD_QUEUE_TIMEOUT_ENV_VAR,
             )
 
         @classmethod
@@ -112,12 +133,74 @@ class ServerConfig:
                 return re.match(r"^(1)|(yes)|(true)|(on)$", verbose, re.IGNORECASE) is not None
             return None
 
+        @classmethod
+        def get_cache_folder(cls) -> Optional[str]:
+            return os.getenv(cls.HOMCCD_CACHE_FOLDER_ENV_VAR)
+
+        @classmethod
+        def get_cache_size_limit(cls) -> Optional[int]:
+            if cache_size_limit := os.getenv(cls.HOMCCD_CACHE_SIZE_LIMIT_ENV_VAR):
+                return int(cache_size_limit)
+            return None
+
+        @classmethod
+        def get_cache_entries_limit(cls) -> Optional[int]:
+            if cache_entries_limit := os.getenv(cls.HOMCCD_CACHE_ENTRIES_LIMIT_ENV_VAR):
+                return int(cache_entries_limit)
+            return None
+
+        @classmethod
+        def get_result_cache_size_limit(cls) -> Optional[int]:
+            if result_cache_size_limit := os.getenv(cls.HOMCCD_RESULT_CACHE_SIZE_LIMIT_ENV_VAR):
+                return int(result_cache_size_limit)
+            return None
+
+        @classmethod
+        def get_probe_cache_ttl(cls) -> Optional[int]:
+            if probe_cache_ttl := os.getenv(cls.HOMCCD_PROBE_CACHE_TTL_ENV_VAR):
+                return int(probe_cache_ttl)
+            return None
+
+        @classmethod
+        def get_event_loop(cls) -> Optional[bool]:
+            if (event_loop := os.getenv(cls.HOMCCD_EVENT_LOOP_ENV_VAR)) is not None:
+                # parse analogously to configparser.getboolean
+                return re.match(r"^(1)|(yes)|(true)|(on)$", event_loop, re.IGNORECASE) is not None
+            return None
+
+        @classmethod
+        def get_connections_limit(cls) -> Optional[int]:
+            if connections_limit := os.getenv(cls.HOMCCD_CONNECTIONS_LIMIT_ENV_VAR):
+                return int(connections_limit)
+            return None
+
+        @classmethod
+        def get_queue_limit(cls) -> Optional[int]:
+            if queue_limit := os.getenv(cls.HOMCCD_QUEUE_LIMIT_ENV_VAR):
+                return int(queue_limit)
+            return None
+
+        @classmethod
+        def get_queue_timeout(cls) -> Optional[float]:
+            if queue_timeout := os.getenv(cls.HOMCCD_QUEUE_TIMEOUT_ENV_VAR):
+                return float(queue_timeout)
+            return None
+
     files: List[str]
     address: Optional[str]
     port: Optional[int]
     limit: Optional[int]
     log_level: Optional[LogLevel]
     verbose: bool
+    cache_folder: Optional[str]
+    cache_size_limit: Optional[int]
+    cache_entries_limit: Optional[int]
+    result_cache_size_limit: Optional[int]
+    probe_cache_ttl: Optional[int]
+    event_loop: bool
+    connections_limit: Optional[int]
+    queue_limit: Optional[int]
+    queue_timeout: Optional[float]
 
     def __init__(
         self,
@@ -128,6 +211,15 @@ class ServerConfig:
         address: Optional[str] = None,
         log_level: Optional[str] = None,
         verbose: Optional[bool] = None,
+        cache_folder: Optional[str] = None,
+        cache_size_limit: Optional[int] = None,
+        cache_entries_limit: Optional[int] = None,
+        result_cache_size_limit: Optional[int] = None,
+        probe_cache_ttl: Optional[int] = None,
+        event_loop: Optional[bool] = None,
+        connections_limit: Optional[int] = None,
+        queue_limit: Optional[int] = None,
+        queue_timeout: Optional[float] = None,
     ):
         self.files = files
 
@@ -140,6 +232,27 @@ class ServerConfig:
         verbose = self.EnvironmentVariables.get_verbose() or verbose
         self.verbose = verbose is not None and verbose
 
+        self.cache_folder = self.EnvironmentVariables.get_cache_folder() or cache_folder
+        self.cache_size_limit = self.EnvironmentVariables.get_cache_size_limit() or cache_size_limit
+        self.cache_entries_limit = self.EnvironmentVariables.get_cache_entries_limit() or cache_entries_limit
+        self.result_cache_size_limit = (
+            self.EnvironmentVariables.get_result_cache_size_limit() or result_cache_size_limit
+        )
+
+        # a TTL of 0 disables the probe cache and must therefore not be overridden
+        probe_cache_ttl_env_var: Optional[int] = self.EnvironmentVariables.get_probe_cache_ttl()
+        self.probe_cache_ttl = probe_cache_ttl if probe_cache_ttl_env_var is None else probe_cache_ttl_env_var
+
+        event_loop = self.EnvironmentVariables.get_event_loop() or event_loop
+        self.event_loop = event_loop is not None and event_loop
+
+        self.connections_limit = self.EnvironmentVariables.get_connections_limit() or connections_limit
+
+        # a queue limit of 0 disables queueing and must therefore not be overridden
+        queue_limit_env_var: Optional[int] = self.EnvironmentVariables.get_queue_limit()
+        self.queue_limit = queue_limit if queue_limit_env_var is None else queue_limit_env_var
+        self.queue_timeout = self.EnvironmentVariables.get_queue_timeout() or queue_timeout
+
     @classmethod
     def empty(cls):
         return cls(files=[])
@@ -151,8 +264,33 @@ class ServerConfig:
         address: Optional[str] = homccd_config.get("address")
         log_level: Optional[str] = homccd_config.get("log_level")
         verbose: Optional[bool] = homccd_config.getboolean("verbose")
-
-        return ServerConfig(files=files, limit=limit, port=port, address=address, log_level=log_level, verbose=verbose)
+        cache_folder: Optional[str] = homccd_config.get("cache_folder")
+        cache_size_limit: Optional[int] = homccd_config.getint("cache_size_limit")
+        cache_entries_limit: Optional[int] = homccd_config.getint("cache_entries_limit")
+        result_cache_size_limit: Optional[int] = homccd_config.getint("result_cache_size_limit")
+        probe_cache_ttl: Optional[int] = homccd_config.getint("probe_cache_ttl")
+        event_loop: Optional[bool] = homccd_config.getboolean("event_loop")
+        connections_limit: Optional[int] = homccd_config.getint("connections_limit")
+        queue_limit: Optional[int] = homccd_config.getint("queue_limit")
+        queue_timeout: Optional[float] = homccd_config.getfloat("queue_timeout")
+
+        return ServerConfig(
+            files=files,
+            limit=limit,
+            port=port,
+            address=address,
+            log_level=log_level,
+            verbose=verbose,
+            cache_folder=cache_folder,
+            cache_size_limit=cache_size_limit,
+            cache_entries_limit=cache_entries_limit,
+            result_cache_size_limit=result_cache_size_limit,
+            probe_cache_ttl=probe_cache_ttl,
+            event_loop=event_loop,
+            connections_limit=connections_limit,
+            queue_limit=queue_limit,
+            queue_timeout=queue_timeout,
+        )
 
     def __str__(self):
         return (
@@ -162,6 +300,15 @@ class ServerConfig:
             f"\taddress:\t{self.address}\n"
             f"\tlog_level:\t{self.log_level}\n"
             f"\tverbose:\t{self.verbose}\n"
+            f"\tcache_folder:\t{self.cache_folder}\n"
+            f"\tcache_size_limit:\t{self.cache_size_limit}\n"
+            f"\tcache_entries_limit:\t{self.cache_entries_limit}\n"
+            f"\tresult_cache_size_limit:\t{self.result_cache_size_limit}\n"
+            f"\tprobe_cache_ttl:\t{self.probe_cache_ttl}\n"
+            f"\tevent_loop:\t{self.event_loop}\n"
+            f"\tconnections_limit:\t{self.connections_limit}\n"
+            f"\tqueue_limit:\t{self.queue_limit}\n"
+            f"\tqueue_timeout:\t{self.queue_timeout}\n"
         )
 
 
@@ -181,8 +328,15 @@ def parse_cli_args(args: List[str]) -> Dict[str, Any]:
 
         raise ArgumentTypeError(f"LIMIT must be more than {minimum}")
 
+    def positive_int(value: str) -> int:
+        if (integer := int(value)) > 0:
+            return integer
+
+        raise ArgumentTypeError(f"{value} is not a positive integer")
+
     general_options_group = parser.add_argument_group("Options")
     networking_group = parser.add_argument_group(" Networking")
+    caching_group = parser.add_argument_group(" Caching")
     debug_group = parser.add_argument_group(" Debug")
 
     # show and exit
@@ -198,9 +352,34 @@ def parse_cli_args(args: List[str]) -> Dict[str, Any]:
         required=False,
         metavar="LIMIT",
         type=min_job_limit,
-        help=f"maximum LIMIT of concurrent compilation jobs, might default to {DEFAULT_LIMIT + 2} as "
+        help=f"maximum LIMIT of concurrently running compiler processes, might default to {DEFAULT_LIMIT} as "
         "determined via the CPU count",
     )
+    general_options_group.add_argument(
+        "--connections-limit",
+        required=False,
+        metavar="AMOUNT",
+        type=min_job_limit,
+        help="maximum AMOUNT of concurrent connections, which mostly wait for dependencies to be transferred and only "
+        f"occupy one of the LIMIT compilation slots while compiling, defaults to {DEFAULT_CONNECTIONS_LIMIT_FACTOR} "
+        "times the LIMIT",
+    )
+    general_options_group.add_argument(
+        "--queue-limit",
+        required=False,
+        metavar="AMOUNT",
+        type=int,
+        help="maximum AMOUNT of compilations that are queued until one of the LIMIT compilation slots is free instead "
+        "of being declined, 0 disables queueing, defaults to the connections limit",
+    )
+    general_options_group.add_argument(
+        "--queue-timeout",
+        required=False,
+        metavar="SECONDS",
+        type=float,
+        help="maximum SECONDS that queued compilations wait for a compilation slot before the client is told to "
+        f"compile elsewhere, defaults to {DEFAULT_QUEUE_TIMEOUT}",
+    )
     general_options_group.add_argument(
         "--no-config",
         action="store_true",
@@ -223,6 +402,56 @@ def parse_cli_args(args: List[str]) -> Dict[str, Any]:
         help=f"IP ADDRESS to listen on, defaults to {DEFAULT_ADDRESS}",
     )
 
+    networking_group.add_argument(
+        "--event-loop",
+        required=False,
+        action="store_true",
+        help="accept and reject connections on an asyncio event loop and handle accepted connections on a bounded "
+        "pool of reused threads, each of which is occupied until its connection is closed",
+    )
+
+    # caching
+    caching_group.add_argument(
+        "--cache-folder",
+        required=False,
+        metavar="FOLDER",
+        type=str,
+        help="persistent FOLDER in which dependencies are cached across server restarts, dependencies are only "
+        "cached temporarily in the server's temporary folder on default",
+    )
+    caching_group.add_argument(
+        "--cache-size-limit",
+        required=False,
+        metavar="MEBIBYTES",
+        type=positive_int,
+        help="maximum amount of MEBIBYTES of all cached dependencies before the least recently used ones are evicted, "
+        "unlimited on default",
+    )
+    caching_group.add_argument(
+        "--cache-entries-limit",
+        required=False,
+        metavar="AMOUNT",
+        type=positive_int,
+        help="maximum AMOUNT of cached dependencies before the least recently used ones are evicted, unlimited on "
+        "default",
+    )
+    caching_group.add_argument(
+        "--result-cache-size-limit",
+        required=False,
+        metavar="MEBIBYTES",
+        type=positive_int,
+        help="enable caching of compilation results, so that identical compilation requests are answered without "
+        "invoking the compiler again, up to MEBIBYTES of results are cached, disabled on default",
+    )
+    caching_group.add_argument(
+        "--probe-cache-ttl",
+        required=False,
+        metavar="SECONDS",
+        type=int,
+        help="memoize probes of compilers and sandboxes, e.g. whether a compiler exists or which target it produces, "
+        f"for SECONDS across requests, 0 disables memoization, defaults to {DEFAULT_PROBE_CACHE_TTL}",
+    )
+
     # debug
     debug_group.add_argument(
         "--log-level",
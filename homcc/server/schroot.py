@@ -7,13 +7,17 @@ import logging
 import re
 import shutil
 import subprocess
-from typing import List, Optional
+from pathlib import Path
+from typing import List, Optional, Tuple
 
 from homcc.common.constants import ENCODING
 from homcc.common.shell_environment import ShellEnvironment
 
 logger = logging.getLogger(__name__)
 
+SCHROOT_CONFIGURATION_PATHS: List[Path] = [Path("/etc/schroot/schroot.conf"), Path("/etc/schroot/chroot.d")]
+"""Configuration files and folders in which schroot profiles are defined."""
+
 
 def is_schroot_available() -> bool:
     """Returns True if schroot is installed on the server."""
@@ -39,6 +43,19 @@ def get_schroot_profiles() -> List[str]:
     return re.findall("(?<=chroot:).*?(?=\n)", result.stdout, re.IGNORECASE)
 
 
+def get_schroot_configuration_fingerprint() -> Tuple[Optional[int], ...]:
+    """Returns the modification times of the schroot configuration, which change whenever profiles are modified."""
+    modification_times: List[Optional[int]] = []
+
+    for path in SCHROOT_CONFIGURATION_PATHS:
+        try:
+            modification_times.append(path.stat().st_mtime_ns)
+        except OSError:
+            modification_times.append(None)
+
+    return tuple(modification_times)
+
+
 def is_valid_schroot_profile(schroot_profile: str) -> bool:
     """Returns True if the given schroot profile exists."""
     return schroot_profile in get_schroot_profiles()
@@ -3,22 +3,27 @@
 #   https://github.com/celonis/homcc/blob/main/LICENSE
 
 """Main logic for the homcc server."""
+import asyncio
+import json
 import logging
 import os
 import random
 import socketserver
 import threading
-from functools import singledispatchmethod
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, singledispatchmethod
 from pathlib import Path
-from socket import SHUT_RDWR
+from socket import SHUT_WR, socket
 from tempfile import TemporaryDirectory
 from threading import Lock
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 from homcc.common.arguments import Arguments, AsyncCompilationTimeoutError
 from homcc.common.constants import TCP_BUFFER_SIZE
 from homcc.common.errors import (
     ClientDisconnectedError,
+    DependencyTransferError,
     ServerInitializationError,
     UnsupportedCompilerError,
 )
@@ -27,11 +32,16 @@ from homcc.common.messages import (
     ArgumentMessage,
     CompilationResultMessage,
     ConnectionRefusedMessage,
+    DependencyBatchRequestMessage,
     DependencyReplyMessage,
     DependencyRequestMessage,
     Message,
+    MessageDecoder,
+    QueuedMessage,
 )
-from homcc.server.cache import Cache
+from homcc.server import __version__
+from homcc.server.admission import AdmissionQueue, AdmissionTicket
+from homcc.server.cache import Cache, ProbeCache, ResultCache
 from homcc.server.docker import is_docker_available, is_valid_docker_container
 from homcc.server.environment import (
     COMPILATION_TIMEOUT,
@@ -40,11 +50,15 @@ from homcc.server.environment import (
 )
 from homcc.server.parsing import (
     DEFAULT_ADDRESS,
+    DEFAULT_CONNECTIONS_LIMIT_FACTOR,
     DEFAULT_LIMIT,
     DEFAULT_PORT,
+    DEFAULT_PROBE_CACHE_TTL,
+    DEFAULT_QUEUE_TIMEOUT,
     ServerConfig,
 )
 from homcc.server.schroot import (
+    get_schroot_configuration_fingerprint,
     get_schroot_profiles,
     is_schroot_available,
     is_valid_schroot_profile,
@@ -52,38 +66,109 @@ from homcc.server.schroot import (
 
 logger = logging.getLogger(__name__)
 
+DEPENDENCY_UPLOAD_WAIT_TIMEOUT: float = 1
+"""Interval in seconds after which we recheck dependencies that are concurrently uploaded via other connections."""
+DEPENDENCY_MAX_RETRIES: int = 3
+"""Amount of times a dependency whose received content does not match its hash is requested again."""
+CONNECTION_REJECTION_TIMEOUT: float = 10
+"""Timeout in seconds to wait for clients to close rejected connections."""
+IOV_MAX: int = os.sysconf("SC_IOV_MAX") if "SC_IOV_MAX" in os.sysconf_names else 1024
+"""Maximum amount of buffers that can be sent via a single sendmsg call."""
+
+
+def sendmsg_all(sock: socket, buffers: List[bytearray]):
+    """Sends all buffers consecutively via vectored I/O, analogously to sendall but without concatenating them."""
+    views: List[memoryview] = [memoryview(buffer) for buffer in buffers if len(buffer) > 0]
+    index: int = 0
+
+    while index < len(views):
+        sent_bytes: int = sock.sendmsg(views[index : index + IOV_MAX])
+
+        # skip all completely sent buffers and continue with the remainder of a partially sent one
+        while index < len(views) and sent_bytes >= len(views[index]):
+            sent_bytes -= len(views[index])
+            index += 1
+
+        if sent_bytes > 0:
+            views[index] = views[index][sent_bytes:]
+
 
 class TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
     """TCP Server instance, holding data relevant across compilations."""
 
-    def __init__(self, address: Optional[str], port: Optional[int], limit: Optional[int]):
+    def __init__(
+        self,
+        address: Optional[str],
+        port: Optional[int],
+        limit: Optional[int],
+        *,
+        cache_folder: Optional[str] = None,
+        cache_size_limit: Optional[int] = None,
+        cache_entries_limit: Optional[int] = None,
+        result_cache_size_limit: Optional[int] = None,
+        probe_cache_ttl: Optional[int] = None,
+        connections_limit: Optional[int] = None,
+        queue_limit: Optional[int] = None,
+        queue_timeout: Optional[float] = None,
+    ):
         address = address or DEFAULT_ADDRESS
         port = port or DEFAULT_PORT
 
         super().__init__((address, port), TCPRequestHandler)
 
-        # default 1 job per (available) CPU, +2 to enable more concurrency while waiting for disk or network IO
-        self.connections_limit: int = limit or (DEFAULT_LIMIT + 2)
+        # default 1 concurrently running compiler process per (available) CPU
+        self.compilations_limit: int = limit or DEFAULT_LIMIT
 
         if DEFAULT_LIMIT == -1:
             logger.error(
                 "A meaningful CPU count could not be determined and the maximum job limit is set to %i.\n"
                 "Please provide the job limit explicitly either via the CLI or the configuration file!",
-                self.connections_limit,
+                self.compilations_limit,
             )
 
+        # connections mostly wait for disk or network IO while transferring dependencies, so that many more of them
+        # than compiler processes can be handled concurrently
+        self.connections_limit: int = connections_limit or self.compilations_limit * DEFAULT_CONNECTIONS_LIMIT_FACTOR
+
         self.root_temp_folder: TemporaryDirectory = create_root_temp_folder()
 
         self.current_amount_connections: int = 0  # indicates the amount of clients that are currently connected
         self.current_amount_connections_mutex: Lock = Lock()
 
-        self.cache = Cache(Path(self.root_temp_folder.name))
+        # compilations exceeding the limit are queued until a slot is free instead of being declined
+        self.admission_queue = AdmissionQueue(
+            self.compilations_limit, self.connections_limit if queue_limit is None else queue_limit
+        )
+        self.queue_timeout: float = DEFAULT_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+
+        # dependencies are either cached persistently in the configured folder or temporarily in the root temp folder
+        self.cache = Cache(
+            Path(cache_folder) if cache_folder is not None else Path(self.root_temp_folder.name),
+            max_bytes=cache_size_limit * 1024**2 if cache_size_limit is not None else None,
+            max_entries=cache_entries_limit,
+        )
+
+        # compilation results are only cached if explicitly enabled
+        self.result_cache: Optional[ResultCache] = None
+
+        if result_cache_size_limit is not None:
+            self.result_cache = ResultCache(
+                Path(cache_folder) if cache_folder is not None else Path(self.root_temp_folder.name),
+                max_bytes=result_cache_size_limit * 1024**2,
+            )
+
+        # probes of compilers and sandboxes are memoized across requests unless explicitly disabled
+        if probe_cache_ttl is None:
+            probe_cache_ttl = DEFAULT_PROBE_CACHE_TTL
+
+        self.probe_cache: Optional[ProbeCache] = ProbeCache(probe_cache_ttl) if probe_cache_ttl > 0 else None
 
     @staticmethod
     def send_message(request, message: Message):
-        """Sends a response to the request."""
+        """Sends a response to the request. Payloads are sent directly from their buffers without copying them into
+        a single serialized message beforehand."""
         try:
-            request.sendall(message.to_bytes())
+            sendmsg_all(request, message.to_buffers())
         except ConnectionError as err:
             logger.error("Connection error while trying to send '%s' message. %s", message.message_type, err)
             logger.debug(
@@ -95,23 +180,24 @@ class TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
         """Close a connection for a certain request."""
         conn_refused_message = ConnectionRefusedMessage(info)
         TCPServer.send_message(request, conn_refused_message)
+        TCPServer.drain_and_close(request)
 
-        request.shutdown(SHUT_RDWR)
-
-        def is_ready_to_close() -> bool:
-            try:
-                read_data = request.recv(TCP_BUFFER_SIZE)
-                return len(read_data) == 0
-            except ConnectionError as error:
-                logger.debug("Exception while waiting for zero-len TCP packet: %s", error)
-                return True
-
-        # Wait until we receive an error or zero-sized package to finally close the socket.
+    @staticmethod
+    def drain_and_close(request):
+        """Close a connection after the client closed it as well, so that no message that was sent is discarded."""
+        # Only shut down our side and block until we receive an error or zero-sized package, i.e. the client closed the
+        # connection as well, to finally close the socket without discarding the message.
         # See https://stackoverflow.com/questions/4160347/close-vs-shutdown-socket/23483487#23483487
-        while not is_ready_to_close():
-            pass
+        try:
+            request.shutdown(SHUT_WR)
+            request.settimeout(CONNECTION_REJECTION_TIMEOUT)
 
-        request.close()
+            while request.recv(TCP_BUFFER_SIZE):
+                pass
+        except OSError as error:
+            logger.debug("Exception while waiting for zero-len TCP packet: %s", error)
+        finally:
+            request.close()
 
     def verify_request(self, request, _) -> bool:
         with self.current_amount_connections_mutex:
@@ -123,7 +209,11 @@ class TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
                 self.connections_limit,
             )
 
-            self.close_connection_for_request(request, f"Limit {self.connections_limit} reached")
+            self.send_message(request, ConnectionRefusedMessage(f"Limit {self.connections_limit} reached"))
+
+            # the client closing the rejected connection is awaited on a separate thread, so that accepting further
+            # connections is not blocked meanwhile, the duplicated socket outlives closing the request afterwards
+            threading.Thread(target=self.drain_and_close, args=(request.dup(),), daemon=True).start()
 
         return accept_connection
 
@@ -137,6 +227,116 @@ class TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
         root_temp_folder.cleanup()
 
 
+class AsyncTCPServer(TCPServer):
+    """
+    TCP Server instance that accepts and rejects connections on an asyncio event loop.
+
+    Accepted connections are handled by the regular TCPRequestHandler on a bounded pool of reused threads, connections
+    exceeding the limit are rejected without occupying a thread. Each accepted connection still occupies a pool thread
+    until it is closed, including while its compiler runs, so that only the creation of threads is saved. The protocol
+    is deliberately not handled natively on the event loop: the request handler, the compilation in its Environment and
+    waiting for dependencies uploaded via other connections are blocking and shared with the threaded server.
+    """
+
+    executor: ThreadPoolExecutor
+    """Thread pool on which accepted connections are handled."""
+    handled_connections: Set[asyncio.Future]
+    """Futures of all connections that are currently handled."""
+    rejected_connections: Set[asyncio.Task]
+    """Tasks of all connections that are currently being rejected."""
+    shutdown_requested: threading.Event
+    """Event that is set to stop serving."""
+    serving_stopped: threading.Event
+    """Event that is set once serving has stopped."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.executor = ThreadPoolExecutor(max_workers=self.connections_limit, thread_name_prefix="homccd")
+        self.handled_connections = set()
+        self.rejected_connections = set()
+        self.shutdown_requested = threading.Event()
+        self.serving_stopped = threading.Event()
+
+    def serve_forever(self, poll_interval: float = 0.5):
+        """Accepts connections until shutdown is requested."""
+        self.serving_stopped.clear()
+
+        try:
+            asyncio.run(self._serve(poll_interval))
+        finally:
+            self.shutdown_requested.clear()
+            self.serving_stopped.set()
+
+    def shutdown(self):
+        """Stops serving and waits until serve_forever has returned."""
+        self.shutdown_requested.set()
+        self.serving_stopped.wait()
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+    async def _serve(self, poll_interval: float):
+        self.socket.setblocking(False)
+        accept_task: asyncio.Task = asyncio.create_task(self._accept_connections())
+
+        while not self.shutdown_requested.is_set():
+            await asyncio.sleep(poll_interval)
+
+        accept_task.cancel()
+
+    async def _accept_connections(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            try:
+                request, client_address = await loop.sock_accept(self.socket)
+            except OSError as error:
+                logger.error("Could not accept connection: %s", error)
+                await asyncio.sleep(1)  # back off, e.g. when running out of file descriptors
+                continue
+
+            if len(self.handled_connections) >= self.connections_limit:
+                logger.info(
+                    "Not accepting new connection, as max limit of #%i connections is already reached.",
+                    self.connections_limit,
+                )
+
+                rejected_connection = asyncio.create_task(
+                    self._reject_connection(request, f"Limit {self.connections_limit} reached")
+                )
+                self.rejected_connections.add(rejected_connection)
+                rejected_connection.add_done_callback(self.rejected_connections.discard)
+                continue
+
+            # the request handler operates on blocking sockets
+            request.setblocking(True)
+
+            handled_connection = loop.run_in_executor(
+                self.executor, self.process_request_thread, request, client_address
+            )
+            self.handled_connections.add(handled_connection)
+            handled_connection.add_done_callback(self.handled_connections.discard)
+
+    @staticmethod
+    async def _reject_connection(request: socket, info: str):
+        """Rejects a connection analogously to close_connection_for_request, but without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+
+        try:
+            await loop.sock_sendall(request, ConnectionRefusedMessage(info).to_bytes())
+            request.shutdown(SHUT_WR)
+
+            # wait until we receive an error or zero-sized package to finally close the socket
+            while await asyncio.wait_for(loop.sock_recv(request, TCP_BUFFER_SIZE), CONNECTION_REJECTION_TIMEOUT):
+                pass
+        except (OSError, asyncio.TimeoutError) as error:
+            logger.debug("Exception while rejecting connection: %s", error)
+        finally:
+            request.close()
+
+
 class TCPRequestHandler(socketserver.BaseRequestHandler):
     """Handles all requests received from the client."""
 
@@ -146,6 +346,18 @@ class TCPRequestHandler(socketserver.BaseRequestHandler):
     """Further dependencies needed from the client."""
     needed_dependency_keys: List[str]
     """Shuffled list of keys for the needed dependencies dict."""
+    requested_dependencies: List[str]
+    """Paths of the dependencies that were requested from the client, in the order of their expected replies."""
+    uploading_hashes: Set[str]
+    """Hashes of dependencies that are currently uploaded via this connection."""
+    dependencies_deadline: float
+    """Monotonic time until which all needed dependencies have to be transferred."""
+    dependency_retries: Dict[str, int]
+    """'Path' -> 'Amount' map of received dependencies whose content did not match their hash."""
+    dependency_error: Optional[DependencyTransferError]
+    """Error that occurred while transferring the dependencies, reported once all requested dependencies arrived."""
+    result_cache_key: Optional[str]
+    """Key of the result of the current compilation in the result cache, None if results are not cached."""
     compiler_arguments: Arguments
     """List of compiler arguments."""
     instance_path: str
@@ -184,6 +396,7 @@ class TCPRequestHandler(socketserver.BaseRequestHandler):
             docker_container=docker_container,
             compression=compression,
             sock_fd=self.request.fileno(),
+            probe_cache=self.server.probe_cache,
         )
 
         if not self.check_client_request_satisfiability(
@@ -191,13 +404,20 @@ class TCPRequestHandler(socketserver.BaseRequestHandler):
         ):
             return
 
-        if (
-            target is not None
-            and self.compiler_arguments.get_compiler_target_triple(self.environment.shell_env) != target
-        ):
+        if target is not None and self.environment.get_compiler_target_triple(self.compiler_arguments) != target:
             self.compiler_arguments = self.compiler_arguments.add_target(target)
             logger.info("Using explicit target '%s' for compilation.", target)
 
+        if self.server.result_cache is not None:
+            self.result_cache_key = self._get_result_cache_key(message)
+
+            if self.result_cache_key is not None and (
+                cached_result := self.server.result_cache.read(self.result_cache_key)
+            ):
+                logger.info("Sending cached compilation result '%s'.", self.result_cache_key)
+                self.send_bytes(cached_result)
+                return
+
         self.compiler_arguments = self.environment.map_args(self.compiler_arguments)
         logger.debug("Mapped compiler args: %s", str(self.compiler_arguments))
 
@@ -212,6 +432,10 @@ class TCPRequestHandler(socketserver.BaseRequestHandler):
         self.needed_dependency_keys = list(self.needed_dependencies.keys())
         random.shuffle(self.needed_dependency_keys)
 
+        self.dependencies_deadline = time.monotonic() + COMPILATION_TIMEOUT
+        self.dependency_retries = {}
+        self.dependency_error = None
+
         logger.info(
             "#%i cached dependencies, #%i missing dependencies.",
             len(self.mapped_dependencies) - len(self.needed_dependencies),
@@ -220,17 +444,47 @@ class TCPRequestHandler(socketserver.BaseRequestHandler):
 
         self.check_dependencies_exist()
 
+    def _get_result_cache_key(self, message: ArgumentMessage) -> Optional[str]:
+        """Returns the key of the requested compilation in the result cache or None if the compilation should not be
+        cached. The mapped arguments contain the random instance folder, so the unmapped arguments and the cwd are
+        used instead."""
+        if (compiler_fingerprint := self.environment.get_compiler_fingerprint(self.compiler_arguments)) is None:
+            return None
+
+        key: Dict[str, Any] = {
+            "version": __version__,
+            "args": message.get_args(),
+            "cwd": message.get_cwd(),
+            "dependencies": sorted(message.get_dependencies().items()),
+            "target": message.target,
+            "schroot_profile": message.schroot_profile,
+            "docker_container": message.docker_container,
+            "compression": str(self.environment.compression),
+            "compiler": str(self.compiler_arguments.compiler),
+            "compiler_fingerprint": compiler_fingerprint,
+        }
+
+        return hash_file_with_bytes(json.dumps(key).encode())
+
     @_handle_message.register
     def _handle_dependency_request_message(self, _: DependencyRequestMessage):
         logger.warning("Received DependencyRequestMessage, but this message is only sent by the server!")
 
+    @_handle_message.register
+    def _handle_dependency_batch_request_message(self, _: DependencyBatchRequestMessage):
+        logger.warning("Received DependencyBatchRequestMessage, but this message is only sent by the server!")
+
     @_handle_message.register
     def _handle_dependency_reply_message(self, message: DependencyReplyMessage):
         logger.debug("Handling DependencyReplyMessage...")
         logger.debug("Len of dependency reply payload is %i", message.get_further_payload_size())
 
+        if not self.requested_dependencies:
+            logger.warning("Received DependencyReplyMessage, but no dependency was requested!")
+            return
+
+        dependency_path: str = self.requested_dependencies.pop(0)
         dependency_content = message.get_content()
-        dependency_path = next(iter(self.needed_dependency_keys))
         dependency_hash = self.needed_dependencies[dependency_path]
 
         retrieved_dependency_hash = hash_file_with_bytes(dependency_content)
@@ -242,13 +496,35 @@ class TCPRequestHandler(socketserver.BaseRequestHandler):
                 This should not happen.""",
                 dependency_path,
             )
+
+            # the dependency is requested again, unless it keeps mismatching, e.g. as it changes on the client
+            self.dependency_retries[dependency_path] = self.dependency_retries.get(dependency_path, 0) + 1
+
+            if self.dependency_retries[dependency_path] > DEPENDENCY_MAX_RETRIES:
+                self.dependency_error = DependencyTransferError(
+                    f"Dependency '{self.environment.unmap_path(dependency_path)}' did not match its hash after "
+                    f"{DEPENDENCY_MAX_RETRIES} retries."
+                )
         else:
             del self.needed_dependencies[dependency_path]
-            self.needed_dependency_keys.pop(0)
+            self.needed_dependency_keys.remove(dependency_path)
 
             self.server.cache.put(dependency_hash, dependency_content)
 
-            self.environment.link_dependency_to_cache(dependency_path, dependency_hash, self.server.cache)
+            if not self.environment.link_dependency_to_cache(dependency_path, dependency_hash, self.server.cache):
+                # the dependency has already been evicted again by a concurrent request
+                Path(dependency_path).write_bytes(dependency_content)
+
+        # wake up concurrent requests waiting for this dependency, on mismatches they may request it themselves
+        self._end_upload(dependency_hash)
+
+        if self.requested_dependencies:
+            logger.debug("Waiting for #%i further requested dependencies.", len(self.requested_dependencies))
+            return
+
+        if self.dependency_error is not None:
+            self._decline_dependencies(self.dependency_error)
+            return
 
         self.check_dependencies_exist()
 
@@ -256,38 +532,99 @@ class TCPRequestHandler(socketserver.BaseRequestHandler):
     def _handle_compilation_result_message(self, _: CompilationResultMessage):
         logger.warning("Received CompilationResultMessage, but this message is only sent by the server!")
 
-    def _request_next_dependency(self) -> bool:
-        """Requests a dependency with the given sha1sum from the client.
-        Returns False if there was nothing to request any more."""
+    def _end_upload(self, dependency_hash: str):
+        self.uploading_hashes.discard(dependency_hash)
+        self.server.cache.end_upload(dependency_hash)
 
-        while len(self.needed_dependencies) > 0:
-            next_needed_file: str = next(iter(self.needed_dependency_keys))
-            next_needed_hash: str = self.needed_dependencies[next_needed_file]
+    def _request_next_dependencies(self) -> bool:
+        """Requests all needed dependencies at once from the client, which then sends them back to back. Dependencies
+        that are concurrently uploaded via other connections are not requested again, instead we wait for them to
+        arrive in the cache until the dependencies deadline. Returns False if there was nothing to request any more.
+        Raises DependencyTransferError if the deadline passed."""
 
+        while len(self.needed_dependencies) > 0:
             logger.debug("#%i needed dependencies left.", len(self.needed_dependencies))
 
-            if next_needed_hash in self.server.cache:
-                logger.debug("Dependency with hash '%s' is in cache.", next_needed_hash)
-                self.environment.link_dependency_to_cache(next_needed_file, next_needed_hash, self.server.cache)
+            for next_needed_file in list(self.needed_dependency_keys):
+                next_needed_hash: str = self.needed_dependencies[next_needed_file]
 
-                del self.needed_dependencies[next_needed_file]
-                self.needed_dependency_keys.pop(0)
-            else:
-                request_message = DependencyRequestMessage(next_needed_hash)
+                if self.environment.link_dependency_to_cache(next_needed_file, next_needed_hash, self.server.cache):
+                    logger.debug("Dependency with hash '%s' is in cache.", next_needed_hash)
 
-                logger.debug("Sending request for dependency with hash '%s'.", str(request_message.get_sha1sum()))
+                    del self.needed_dependencies[next_needed_file]
+                    self.needed_dependency_keys.remove(next_needed_file)
+                elif self.server.cache.begin_upload(next_needed_hash):
+                    self.uploading_hashes.add(next_needed_hash)
+                    self.requested_dependencies.append(next_needed_file)
+
+            if self.requested_dependencies:
+                request_message = DependencyBatchRequestMessage(
+                    [self.needed_dependencies[dependency] for dependency in self.requested_dependencies]
+                )
+
+                logger.debug("Sending request for #%i dependencies.", len(request_message.get_sha1sums()))
                 self.send_message(request_message)
-                return len(self.needed_dependencies) > 0
+                return True
+
+            if len(self.needed_dependencies) > 0:
+                # all remaining dependencies are currently uploaded via other connections
+                next_needed_hash = self.needed_dependencies[self.needed_dependency_keys[0]]
+
+                if (remaining_time := self.dependencies_deadline - time.monotonic()) <= 0:
+                    raise DependencyTransferError(
+                        f"Dependency '{self.environment.unmap_path(self.needed_dependency_keys[0])}' was not uploaded "
+                        f"via another connection within {COMPILATION_TIMEOUT}s."
+                    )
+
+                logger.debug("Waiting for dependency with hash '%s' to be uploaded concurrently.", next_needed_hash)
+                self.server.cache.wait_for_upload(next_needed_hash, min(DEPENDENCY_UPLOAD_WAIT_TIMEOUT, remaining_time))
 
         return False
 
+    def _decline_dependencies(self, error: DependencyTransferError):
+        """Declines the compilation as its dependencies could not be transferred, so that the client compiles
+        elsewhere, and closes the connection."""
+        logger.warning("Declining compilation: %s", error)
+        self.send_message(
+            CompilationResultMessage(
+                object_files=[],
+                stdout="",
+                stderr=f"Dependencies could not be transferred to the remote compilation host: {error}",
+                return_code=os.EX_TEMPFAIL,
+                compression=self.environment.compression,
+                dwarf_files=[],
+            )
+        )
+        self.terminate = True
+
     def check_dependencies_exist(self):
         """Checks if all dependencies exist. If yes, starts compiling. If no, requests missing dependencies."""
-        if self._request_next_dependency():
-            logger.debug("Waiting for a dependency to be sent by the client.")
+        try:
+            if self._request_next_dependencies():
+                logger.debug("Waiting for dependencies to be sent by the client.")
+                return
+        except DependencyTransferError as error:
+            self._decline_dependencies(error)
             return
 
-        # no further dependencies needed, compile now
+        # no further dependencies needed, compile as soon as a compilation slot is free
+        if not self._acquire_compilation_slot():
+            logger.info("No compilation slot became free within %ss, declining compilation.", self.server.queue_timeout)
+            self.send_message(
+                CompilationResultMessage(
+                    object_files=[],
+                    stdout="",
+                    stderr=f"All {self.server.compilations_limit} compilation slots of the remote compilation host "
+                    f"were occupied for longer than {self.server.queue_timeout}s.",
+                    return_code=os.EX_TEMPFAIL,
+                    compression=self.environment.compression,
+                    dwarf_files=[],
+                )
+            )
+            return
+
+        compilation_start: float = time.monotonic()
+
         try:
             result_message = self.environment.do_compilation(self.compiler_arguments)
         except ClientDisconnectedError:
@@ -314,22 +651,51 @@ class TCPRequestHandler(socketserver.BaseRequestHandler):
                 compression=self.environment.compression,
                 dwarf_files=[],
             )
+        finally:
+            self.server.admission_queue.release(time.monotonic() - compilation_start)
+
+        if (
+            self.server.result_cache is not None
+            and self.result_cache_key is not None
+            and result_message.get_return_code() == os.EX_OK
+        ):
+            self.server.result_cache.put(self.result_cache_key, result_message.to_bytes())
 
         self.send_message(result_message)
 
-    def _try_parse_message(self, message_bytes: bytearray) -> int:
-        bytes_needed, parsed_message = Message.from_bytes(message_bytes)
+    def _acquire_compilation_slot(self) -> bool:
+        """Acquires one of the server's compilation slots. If all of them are occupied, the compilation is queued and
+        the client is informed about its position. Returns False if no slot became free in time or the queue is full."""
+        admission_queue: AdmissionQueue = self.server.admission_queue
 
-        if bytes_needed < 0:
-            logger.debug("Received message, but having #%i bytes too much supplied.", abs(bytes_needed))
-        elif bytes_needed > 0:
-            logger.debug("Supplied buffer does not suffice to parse the message, need further #%i bytes!", bytes_needed)
+        if admission_queue.try_acquire():
+            return True
+
+        ticket: Optional[AdmissionTicket] = admission_queue.enqueue()
+
+        if ticket is None:
+            return False
+
+        position: int = admission_queue.position(ticket)
+        logger.info(
+            "All %i compilation slots are occupied, queueing compilation at position %i.",
+            self.server.compilations_limit,
+            position,
+        )
+        self.send_message(QueuedMessage(position, admission_queue.estimated_wait(position)))
+
+        if not admission_queue.acquire(ticket, ticket.enqueue_time + self.server.queue_timeout):
+            return False
+
+        logger.debug("Acquired compilation slot after being queued for %.3fs.", time.monotonic() - ticket.enqueue_time)
+        return True
 
-        if parsed_message is not None:
-            logger.debug("Received message of type %s!", parsed_message.message_type)
-            self._handle_message(parsed_message)
+    def _probe(self, key: Tuple[str, str], probe: Callable[[], bool], fingerprint: Any = None) -> bool:
+        """Executes the probe of the requested sandbox or returns its result memoized in the server's probe cache."""
+        if self.server.probe_cache is None:
+            return probe()
 
-        return bytes_needed
+        return self.server.probe_cache.get(key, probe, fingerprint)
 
     def check_client_request_satisfiability(
         self,
@@ -409,7 +775,11 @@ class TCPRequestHandler(socketserver.BaseRequestHandler):
             )
             return False
 
-        if not is_valid_schroot_profile(schroot_profile):
+        if not self._probe(
+            ("schroot_profile", schroot_profile),
+            partial(is_valid_schroot_profile, schroot_profile),
+            get_schroot_configuration_fingerprint(),
+        ):
             logger.info("Refusing client because 'schroot' environment '%s' is not provided.", schroot_profile)
             self.close_connection(
                 f"Profile {schroot_profile} could not be used as it is not a provided profile "
@@ -435,7 +805,9 @@ class TCPRequestHandler(socketserver.BaseRequestHandler):
             )
             return False
 
-        if not is_valid_docker_container(docker_container):
+        if not self._probe(
+            ("docker_container", docker_container), partial(is_valid_docker_container, docker_container)
+        ):
             logger.info(
                 "Refusing client because docker container '%s' is not a valid or running container on the server.",
                 docker_container,
@@ -453,27 +825,34 @@ class TCPRequestHandler(socketserver.BaseRequestHandler):
         """Sends a message using the associated TCP socket."""
         self.server.send_message(self.request, message)
 
+    def send_bytes(self, message_bytes: bytes):
+        """Sends an already serialized message to the client."""
+        try:
+            self.request.sendall(message_bytes)
+        except ConnectionError as err:
+            logger.error("Connection error while trying to send serialized message. %s", err)
+
     def close_connection(self, info: str):
         """Closes the connection for this particular request."""
         self.server.close_connection_for_request(self.request, info)
         self.terminate = True
 
-    def recv(self) -> bytearray:
-        """Function that receives from the connection and returns an empty
-        bytearray when the connection has been closed."""
-        try:
-            return self.request.recv(TCP_BUFFER_SIZE)
-        except ConnectionError:
-            return bytearray()
-
     def recv_loop(self):
         """Indefinitely tries to receive data and parse messages until the connection has been closed."""
         self.terminate = False
+        decoder: MessageDecoder = MessageDecoder()
 
         while not self.terminate:
-            recv_bytes: bytearray = self.recv()
+            try:
+                messages: Optional[List[Message]] = decoder.receive_from(self.request)
+            except ConnectionError:
+                messages = None
+
+            if messages is None:
+                if decoder.has_partial_message():
+                    logger.error("Connection closed while only partly received a message. Ungraceful disconnect.")
+                    return
 
-            if len(recv_bytes) == 0:
                 try:
                     logger.info("Connection '%s' closed.", self.environment.instance_folder)
                 except AttributeError:
@@ -481,28 +860,17 @@ class TCPRequestHandler(socketserver.BaseRequestHandler):
 
                 return
 
-            bytes_needed: int = Message.MINIMUM_SIZE_BYTES
-            while bytes_needed != 0 and len(recv_bytes) > 0:
-                bytes_needed = self._try_parse_message(recv_bytes)
-
-                if bytes_needed < 0:
-                    # Parsed a message, we still have further messages in the buffer.
-                    # Remove parsed bytes form the buffer.
-                    recv_bytes = recv_bytes[len(recv_bytes) - abs(bytes_needed) :]
-                elif bytes_needed > 0:
-                    # A message is only partly contained in the current buffer and we need more data
-                    further_recv_bytes = self.recv()
-
-                    if len(further_recv_bytes) == 0:
-                        logger.error("Connection closed while only partly received a message. Ungraceful disconnect.")
-                        return
-
-                    recv_bytes += further_recv_bytes
+            for message in messages:
+                logger.debug("Received message of type %s!", message.message_type)
+                self._handle_message(message)
 
     def handle(self):
         """Handles incoming requests. Returning from this function means
         that the connection will be closed from the server side."""
         self.request.settimeout(COMPILATION_TIMEOUT)
+        self.requested_dependencies = []
+        self.uploading_hashes = set()
+        self.result_cache_key = None
 
         with self.server.current_amount_connections_mutex:
             self.server.current_amount_connections += 1
@@ -512,13 +880,31 @@ class TCPRequestHandler(socketserver.BaseRequestHandler):
         except Exception as ex:  # pylint: disable=broad-except
             logger.exception("Error when handling client: %s", ex)
         finally:
+            # abandon unfinished uploads, so that concurrent requests waiting for them may request them themselves
+            for dependency_hash in list(self.uploading_hashes):
+                self._end_upload(dependency_hash)
+
             with self.server.current_amount_connections_mutex:
                 self.server.current_amount_connections -= 1
 
 
 def start_server(config: ServerConfig) -> Tuple[TCPServer, threading.Thread]:
+    server_type = AsyncTCPServer if config.event_loop else TCPServer
+
     try:
-        server: TCPServer = TCPServer(config.address, config.port, config.limit)
+        server: TCPServer = server_type(
+            config.address,
+            config.port,
+            config.limit,
+            cache_folder=config.cache_folder,
+            cache_size_limit=config.cache_size_limit,
+            cache_entries_limit=config.cache_entries_limit,
+            result_cache_size_limit=config.result_cache_size_limit,
+            probe_cache_ttl=config.probe_cache_ttl,
+            connections_limit=config.connections_limit,
+            queue_limit=config.queue_limit,
+            queue_timeout=config.queue_timeout,
+        )
     except OSError as err:
         logger.error("Could not start TCP server: %s", err)
         raise ServerInitializationError from err
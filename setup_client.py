@@ -35,5 +35,6 @@ if __name__ == "__main__":
         entry_points="""
             [console_scripts]
             homcc=homcc.client.main:main
+            homcc-agent=homcc.client.agent:main
         """,
     )
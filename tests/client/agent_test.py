@@ -0,0 +1,101 @@
+# Copyright (c) 2023 Celonis SE
+# Covered under the included MIT License:
+#   https://github.com/celonis/homcc/blob/main/LICENSE
+
+"""Tests for client/agent.py"""
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+
+import pytest
+
+from homcc.client import __version__, agent
+from homcc.client.agent import default_agent_socket_path, forward_to_agent
+from homcc.common.parsing import HOMCC_DIR_ENV_VAR
+
+
+class TestAgent:
+    """Tests for the homcc client agent and forwarding invocations to it."""
+
+    STARTUP_TIMEOUT: float = 10
+
+    @pytest.fixture(autouse=True)
+    def homcc_dir(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setenv(HOMCC_DIR_ENV_VAR, str(tmp_path / "homcc"))
+
+    @pytest.fixture
+    def socket_path(self) -> Iterator[Path]:
+        socket_path: Path = default_agent_socket_path()
+
+        with subprocess.Popen([sys.executable, agent.__file__]) as agent_process:
+            deadline: float = time.monotonic() + self.STARTUP_TIMEOUT
+
+            while not socket_path.exists():
+                assert agent_process.poll() is None and time.monotonic() < deadline
+                time.sleep(0.05)
+
+            yield socket_path
+
+            agent_process.terminate()
+            assert agent_process.wait() == 0
+
+        assert not socket_path.exists()
+
+    def test_forward_without_agent(self, tmp_path: Path):
+        socket_path: Path = tmp_path / "agent.sock"
+        assert forward_to_agent(["homcc", "--version"], socket_path) is None
+
+        # socket of an agent which is not running anymore
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale_socket:
+            stale_socket.bind(str(socket_path))
+
+        assert forward_to_agent(["homcc", "--version"], socket_path) is None
+
+    def test_preload_modules(self):
+        # a fresh interpreter is required, as the modules are already imported by the tests
+        preloaded_modules: str = subprocess.check_output(
+            [
+                sys.executable,
+                "-c",
+                "import sys; from homcc.client import agent; agent._preload_modules(); "
+                "print(' '.join(module for module in agent.PRELOADED_MODULES if module in sys.modules))",
+            ],
+            encoding="utf-8",
+        )
+
+        # everything the remote compilation path imports lazily is ready before the first invocation is forked
+        for module in [
+            "asyncio",
+            "sqlite3",
+            "lzma",
+            "lzo",
+            "homcc.common.messages",
+            "homcc.client.cache",
+            "homcc.client.client",
+            "homcc.client.include_scanner",
+        ]:
+            assert module in preloaded_modules.split()
+
+    def test_forward_version(self, socket_path: Path, capfd: pytest.CaptureFixture):
+        assert forward_to_agent(["homcc", "--version"], socket_path) == 0
+        assert capfd.readouterr().out == f"homcc {__version__}\n"
+
+    @pytest.mark.gplusplus
+    def test_forward_compilation(
+        self, socket_path: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capfd: pytest.CaptureFixture
+    ):
+        (tmp_path / "main.cpp").write_text("int main() {}\n")
+        (tmp_path / "error.cpp").write_text("int main() { return missing; }\n")
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setenv("HOMCC_HOSTS", "localhost/1")
+
+        # relative paths are resolved against the working directory of the forwarding process
+        assert forward_to_agent(["homcc", "g++", "-c", "main.cpp", "-o", "main.o"], socket_path) == 0
+        assert (tmp_path / "main.o").exists()
+
+        exit_code: Optional[int] = forward_to_agent(["homcc", "g++", "-c", "error.cpp", "-o", "error.o"], socket_path)
+        assert exit_code is not None and exit_code != 0
+        assert "missing" in capfd.readouterr().err
@@ -0,0 +1,178 @@
+# Copyright (c) 2023 Celonis SE
+# Covered under the included MIT License:
+#   https://github.com/celonis/homcc/blob/main/LICENSE
+
+"""Tests the persistent client cache."""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+from pytest_mock import MockerFixture
+
+from homcc.client.cache import ClientCache, HostStatistics
+from homcc.common.hashing import hash_file_with_path
+
+
+def _hash_files(cache_path: Path, paths: List[str]) -> Dict[str, str]:
+    with ClientCache(cache_path) as cache:
+        return cache.hash_files(paths)
+
+
+class TestClientCache:
+    """Tests the client file hash cache."""
+
+    @staticmethod
+    def _write_old_file(path: Path, content: bytes):
+        path.write_bytes(content)
+        old_time_ns: int = time.time_ns() - 2 * ClientCache.RACY_MTIME_NS
+        os.utime(path, ns=(old_time_ns, old_time_ns))
+
+    def test_hash_files(self, tmp_path: Path):
+        cache_path: Path = tmp_path / ClientCache.FILENAME
+        dependency: Path = tmp_path / "foo.h"
+        self._write_old_file(dependency, b"#define FOO 1\n")
+
+        with ClientCache(cache_path) as cache:
+            assert cache.hash_files([str(dependency)]) == {str(dependency): hash_file_with_path(str(dependency))}
+
+        # hashes are persisted across cache instances, i.e. across homcc processes
+        with ClientCache(cache_path) as cache:
+            cache.connection.execute("UPDATE file_hashes SET sha1sum = 'cached'")
+            cache.connection.commit()
+            assert cache.hash_files([str(dependency)]) == {str(dependency): "cached"}
+
+        # modified files are hashed again
+        self._write_old_file(dependency, b"#define FOO 2\n")
+
+        with ClientCache(cache_path) as cache:
+            assert cache.hash_files([str(dependency)]) == {str(dependency): hash_file_with_path(str(dependency))}
+
+    def test_racy_files(self, tmp_path: Path):
+        dependency: Path = tmp_path / "foo.h"
+        dependency.write_bytes(b"#define FOO 1\n")
+
+        # recently modified files might still change within the same mtime and must therefore not be cached
+        with ClientCache(tmp_path / ClientCache.FILENAME) as cache:
+            cache.hash_files([str(dependency)])
+            assert cache.connection.execute("SELECT COUNT(*) FROM file_hashes").fetchone() == (0,)
+
+    def test_concurrent_processes(self, tmp_path: Path):
+        cache_path: Path = tmp_path / ClientCache.FILENAME
+        dependencies: List[str] = []
+
+        for index in range(100):
+            dependency: Path = tmp_path / f"dependency{index}.h"
+            self._write_old_file(dependency, f"#define DEPENDENCY {index}\n".encode())
+            dependencies.append(str(dependency))
+
+        expected_hashes: Dict[str, str] = {dependency: hash_file_with_path(dependency) for dependency in dependencies}
+
+        with ProcessPoolExecutor(8) as executor:
+            futures = [executor.submit(_hash_files, cache_path, dependencies) for _ in range(16)]
+            assert all(future.result() == expected_hashes for future in futures)
+
+        with ClientCache(cache_path) as cache:
+            assert cache.connection.execute("SELECT COUNT(*) FROM file_hashes").fetchone() == (100,)
+
+    def test_dependency_manifests(self, tmp_path: Path):
+        dependency: Path = tmp_path / "foo.h"
+        self._write_old_file(dependency, b"#define FOO 1\n")
+        missing_dependency: str = str(tmp_path / "bar.h")
+
+        with ClientCache(tmp_path / ClientCache.FILENAME) as cache:
+            assert cache.get_dependency_manifest("key") is None
+
+            cache.put_dependency_manifest("key", "foo.o: foo.h", [str(dependency), missing_dependency, str(tmp_path)])
+            assert cache.get_dependency_manifest("key") == "foo.o: foo.h"
+
+            # build outputs written next to the dependencies do not change their directory fingerprint
+            (tmp_path / "foo.o").write_bytes(b"")
+            (tmp_path / "foo.d").write_bytes(b"")
+            assert cache.get_dependency_manifest("key") == "foo.o: foo.h"
+
+            # paths that did not exist when the manifest was recorded must still not exist
+            self._write_old_file(Path(missing_dependency), b"#define BAR 1\n")
+            assert cache.get_dependency_manifest("key") is None
+
+            # manifests depending on recently modified files are not stored
+            dependency.write_bytes(b"#define FOO 2\n")
+            cache.put_dependency_manifest("other_key", "foo.o: foo.h", [str(dependency)])
+            assert cache.get_dependency_manifest("other_key") is None
+
+    def test_host_statistics(self, tmp_path: Path):
+        smoothing: float = ClientCache.HOST_STATISTICS_SMOOTHING
+
+        with ClientCache(tmp_path / ClientCache.FILENAME) as cache:
+            assert not cache.get_host_statistics(["remotehost:3126"])
+
+            cache.record_host_request("remotehost:3126", refused=False, connect_time=0.01, turnaround=2)
+            cache.record_host_request("remotehost:3126", refused=False, connect_time=0.03, turnaround=1)
+
+            # refused requests only affect the refusal rate, as nothing else was measured
+            cache.record_host_request("remotehost:3126", refused=True)
+
+            statistics: HostStatistics = cache.get_host_statistics(["remotehost:3126", "otherhost:3126"])[
+                "remotehost:3126"
+            ]
+
+        assert statistics.connect_time == pytest.approx(0.01 + smoothing * 0.02)
+        assert statistics.turnaround == pytest.approx(2 - smoothing)
+        assert statistics.cache_hit_ratio is None
+        assert statistics.refusal_rate == pytest.approx(smoothing)
+        assert time.time() - statistics.updated < 60
+        assert statistics.recent_turnarounds == [2, 1]
+
+    def test_host_turnarounds(self, tmp_path: Path, mocker: MockerFixture):
+        now = mocker.patch("homcc.client.cache.time.time", return_value=1000)
+        samples: int = ClientCache.HOST_TURNAROUND_SAMPLES
+
+        with ClientCache(tmp_path / ClientCache.FILENAME) as cache:
+            for turnaround in range(samples + 10):
+                now.return_value += 1
+                cache.record_host_request("remotehost:3126", refused=False, turnaround=turnaround)
+
+            cache.record_host_request("otherhost:3126", refused=False, turnaround=1)
+
+            statistics: Dict[str, HostStatistics] = cache.get_host_statistics(["remotehost:3126", "otherhost:3126"])
+
+        # only the most recent turnarounds of each host are kept
+        assert statistics["remotehost:3126"].recent_turnarounds == list(range(10, samples + 10))
+        assert statistics["otherhost:3126"].recent_turnarounds == [1]
+
+    def test_host_breakers(self, tmp_path: Path, mocker: MockerFixture):
+        now = mocker.patch("homcc.client.cache.time.time", return_value=1000)
+        cooldown: float = ClientCache.HOST_BREAKER_COOLDOWN
+
+        with ClientCache(tmp_path / ClientCache.FILENAME) as cache, ClientCache(
+            tmp_path / ClientCache.FILENAME
+        ) as other_cache:
+            assert not cache.get_unavailable_hosts(["remotehost:3126"], probe_timeout=10)
+
+            # the breaker opens after a failure, concurrent failures of requests started beforehand do not prolong it
+            cache.record_host_breaker("remotehost:3126", failed=True)
+            other_cache.record_host_breaker("remotehost:3126", failed=True)
+            assert cache.get_unavailable_hosts(["remotehost:3126", "otherhost:3126"], 10) == {"remotehost:3126"}
+
+            # once the cooldown expired, only a single process probes the half-open host
+            now.return_value += cooldown
+            assert not cache.get_unavailable_hosts(["remotehost:3126"], probe_timeout=10)
+            assert other_cache.get_unavailable_hosts(["remotehost:3126"], probe_timeout=10) == {"remotehost:3126"}
+
+            # a failed probe reopens the breaker for twice the cooldown
+            cache.record_host_breaker("remotehost:3126", failed=True)
+            now.return_value += 2 * cooldown - 0.1
+            assert cache.get_unavailable_hosts(["remotehost:3126"], probe_timeout=10) == {"remotehost:3126"}
+
+            # the probe claim times out, so that a killed prober does not block the host forever
+            now.return_value += 0.1
+            assert not cache.get_unavailable_hosts(["remotehost:3126"], probe_timeout=10)
+            now.return_value += 10
+            assert not other_cache.get_unavailable_hosts(["remotehost:3126"], probe_timeout=10)
+
+            # a successful probe closes the breaker
+            other_cache.record_host_breaker("remotehost:3126", failed=False)
+            assert not cache.get_unavailable_hosts(["remotehost:3126"], probe_timeout=10)
+            assert not other_cache.get_unavailable_hosts(["remotehost:3126"], probe_timeout=10)
@@ -4,22 +4,34 @@
 
 """ Tests for client/client.py"""
 
+import asyncio
+import multiprocessing
 import os
+import signal
 import threading
 import time
 from pathlib import Path
-from typing import Iterator, List
+from typing import Dict, Iterator, List, Set
 
 import pytest
-import sysv_ipc
 
+from homcc.client.cache import HostStatistics
 from homcc.client.client import (
-    LocalHostCompilationSemaphore,
+    HostConnector,
     RemoteHostSelector,
+    TCPClient,
+    host_statistics_key,
+)
+from homcc.client.semaphores import (
+    LocalHostCompilationSemaphore,
     RemoteHostSemaphore,
+    SlotTable,
+    default_queue_path,
+    default_slots_path,
 )
 from homcc.common.errors import RemoteHostsFailure, SlotsExhaustedError
 from homcc.common.host import ConnectionType, Host
+from homcc.common.parsing import HOMCC_DIR_ENV_VAR
 from homcc.common.statefile import StateFile
 
 
@@ -84,7 +96,198 @@ class TestRemoteHostSelector:
         with pytest.raises(StopIteration):
             assert next(host_iter)
 
+    def test_remotehost_selector_with_statistics(self):
+        # pylint: disable=protected-access,unbalanced-tuple-unpacking
+        hosts: List[Host] = [Host.from_str(host_str) for host_str in ["near/8", "far/8", "refusing/8", "new/8"]]
+        now: float = time.time()
+        statistics: Dict[str, HostStatistics] = {
+            host_statistics_key(hosts[0]): HostStatistics(0.003, 1, 0.5, 0, now),
+            host_statistics_key(hosts[1]): HostStatistics(0.08, 3, 0.5, 0, now),
+            host_statistics_key(hosts[2]): HostStatistics(0.003, 1, 0.5, 1, now),
+        }
+        near_weight, far_weight, refusing_weight, new_weight = RemoteHostSelector(hosts, statistics=statistics)._weights
+
+        assert near_weight == pytest.approx(far_weight * 3.08 / 1.003)
+        assert refusing_weight == pytest.approx(near_weight * RemoteHostSelector.MIN_AVAILABILITY)
+
+        # hosts without statistics are assumed to perform like the median host
+        assert new_weight == pytest.approx(near_weight)
+
+        # outdated statistics are ignored, so that all hosts are weighted by their limits again
+        outdated_statistics: Dict[str, HostStatistics] = {
+            key: HostStatistics(host_statistics.connect_time, host_statistics.turnaround, None, 0, 0)
+            for key, host_statistics in statistics.items()
+        }
+        assert RemoteHostSelector(hosts, statistics=outdated_statistics)._weights == [8, 8, 8, 8]
+
+    def test_remotehost_selector_with_unavailable_hosts(self):
+        host_selector: RemoteHostSelector = RemoteHostSelector(
+            self.HOSTS, unavailable_hosts={host_statistics_key(host) for host in self.HOSTS[2:]}
+        )
+
+        assert len(host_selector) == 1
+        assert next(host_selector) == self.HOSTS[1]
+
+        with pytest.raises(StopIteration):
+            next(host_selector)
+
+
+@pytest.fixture
+def homcc_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """keep the client cache, slot tables and queues of each test separate"""
+    monkeypatch.setenv(HOMCC_DIR_ENV_VAR, str(tmp_path))
+
+
+@pytest.mark.usefixtures("homcc_dir")
+class TestHostConnector:
+    """Tests for HostConnector"""
+
+    def test_host_connector(self, unused_tcp_port: int, monkeypatch: pytest.MonkeyPatch):
+        connect_times: Dict[str, float] = {"slow": 10, "fast": 0.01}
+        hosts: List[Host] = [
+            Host(type=ConnectionType.TCP, name=name, port=unused_tcp_port, limit=1) for name in connect_times
+        ]
+
+        async def connect(client: TCPClient):
+            await asyncio.sleep(connect_times[client.host])
+            client.connect_time = connect_times[client.host]
+
+        monkeypatch.setattr(TCPClient, "connect", connect)
+
+        async def connect_to_hosts() -> List[str]:
+            connected: List[str] = []
+
+            async with HostConnector(iter(hosts), timeout=10) as connector:
+                async for connection in connector:
+                    with connection:
+                        connected.append(connection.result().host)
+                        return connected
+
+            return connected
+
+        start: float = time.monotonic()
+
+        # the slow host is still connecting when the fast one is established after the stagger
+        assert asyncio.run(connect_to_hosts()) == ["fast"]
+        assert time.monotonic() - start < 1
+
+        # all slots were released
+        for host in hosts:
+            assert SlotTable(host, default_slots_path()).occupied_slots() == 0
+
+    def test_release_unchosen(self, unused_tcp_port: int, monkeypatch: pytest.MonkeyPatch):
+        connect_times: Dict[str, List[float]] = {"slow": [10, 0.01], "medium": [0.05], "fast": [0.01]}
+        hosts: List[Host] = [
+            Host(type=ConnectionType.TCP, name=name, port=unused_tcp_port, limit=1) for name in connect_times
+        ]
+
+        async def connect(client: TCPClient):
+            client.connect_time = connect_times[client.host].pop(0)
+            await asyncio.sleep(client.connect_time)
+
+        monkeypatch.setattr(TCPClient, "connect", connect)
+
+        async def connect_to_hosts() -> List[str]:
+            connected: List[str] = []
+
+            async with HostConnector(iter(hosts), timeout=10) as connector:
+                async for connection in connector:
+                    with connection:
+                        connected.append(connection.result().host)
+                        await connector.release_unchosen()
+
+                        # only the slot of the chosen host remains occupied
+                        for host in hosts:
+                            occupied_slots: int = SlotTable(host, default_slots_path()).occupied_slots()
+                            assert occupied_slots == (host.name == connection.host.name)
+
+                        if len(connected) == 2:
+                            return connected
+
+            return connected
+
+        # the released slow host is connected to again before further hosts once the medium one is not used
+        assert asyncio.run(connect_to_hosts()) == ["medium", "slow"]
+
+        for host in hosts:
+            assert SlotTable(host, default_slots_path()).occupied_slots() == 0
+
+    def test_wait_for_slot(self, unused_tcp_port: int, monkeypatch: pytest.MonkeyPatch):
+        hosts: List[Host] = [
+            Host(type=ConnectionType.TCP, name=name, port=unused_tcp_port, limit=1) for name in ["busy", "freed"]
+        ]
+        acquisitions: Dict[str, int] = {}
+
+        # the slots of both hosts are occupied, until the slot of the second host is freed after a few checks
+        def enter(semaphore: RemoteHostSemaphore) -> RemoteHostSemaphore:
+            key: str = semaphore._host.id()  # pylint: disable=protected-access
+            acquisitions[key] = acquisitions.get(key, 0) + 1
+
+            if key == hosts[0].id() or acquisitions[key] < 3:
+                raise SlotsExhaustedError("occupied")
+            return semaphore
+
+        async def connect(client: TCPClient):
+            client.connect_time = 0
+
+        monkeypatch.setattr(RemoteHostSemaphore, "__enter__", enter)
+        monkeypatch.setattr(TCPClient, "connect", connect)
+
+        async def connect_to_hosts(slot_wait: float) -> List[str]:
+            connected: List[str] = []
+
+            async with HostConnector(iter(hosts), timeout=10, slot_wait=slot_wait) as connector:
+                async for connection in connector:
+                    with connection:
+                        connected.append(connection.result().host)
 
+            return connected
+
+        # exhausted hosts are skipped right away without waiting for their slots
+        assert not asyncio.run(connect_to_hosts(0))
+
+        # the first slot that becomes free is used
+        acquisitions.clear()
+        assert asyncio.run(connect_to_hosts(0.5)) == ["freed"]
+
+
+@pytest.mark.usefixtures("homcc_dir")
+class TestSlotTable:
+    """Tests for SlotTable"""
+
+    def test_collision_free_keys(self):
+        hosts: List[Host] = [Host.from_str(f"remotehost:{port}/4") for port in range(3000, 4000)]
+        paths: Set[Path] = set()
+
+        for host in hosts:
+            table: SlotTable = SlotTable(host, default_slots_path())
+            paths.add(table.path)
+            table.close()
+
+        assert len(paths) == len(hosts)
+
+    def test_reclaim_slots_of_terminated_processes(self):
+        host: Host = Host.from_str("remotehost/2")
+        table: SlotTable = SlotTable(host, default_slots_path())
+
+        # the child process occupies a slot and gets killed without releasing it
+        child: int = os.fork()
+
+        if child == 0:
+            try:
+                SlotTable(host, default_slots_path()).claim()
+            finally:
+                os.kill(os.getpid(), signal.SIGKILL)
+
+        os.waitpid(child, 0)
+
+        assert table.claim() is not None  # the remaining free slot
+        assert table.claim() is not None  # the reclaimed slot of the child
+        assert table.claim() is None
+        assert table.occupied_slots() == 2
+
+
+@pytest.mark.usefixtures("homcc_dir")
 class TestRemoteHostSemaphore:
     """Tests for RemoteHostSemaphore"""
 
@@ -96,51 +299,33 @@ class TestRemoteHostSemaphore:
                 pass
 
     def test_remotehosts(self, unused_tcp_port: int):
-        name: str = self.test_remotehosts.__name__  # dedicated test semaphore
-        remotehost: Host = Host(type=ConnectionType.TCP, name=name, port=unused_tcp_port, limit=1)
-        host_id: int = remotehost.id()
+        remotehost: Host = Host(type=ConnectionType.TCP, name="remotehost", port=unused_tcp_port, limit=1)
+        table: SlotTable = SlotTable(remotehost, default_slots_path())
 
         with RemoteHostSemaphore(remotehost):  # successful first acquire
-            assert Path(f"/dev/shm/sem.{host_id}")
-            assert sysv_ipc.Semaphore(host_id).value == 0
+            assert table.occupied_slots() == 1
 
             with pytest.raises(SlotsExhaustedError):
                 with RemoteHostSemaphore(remotehost):  # failing second acquire
                     pass
 
-        with pytest.raises(sysv_ipc.ExistentialError):
-            # check if semaphore got cleaned up
-            sysv_ipc.Semaphore(host_id)
+        # check if the slot got released
+        assert table.occupied_slots() == 0
 
     def test_release(self, unused_tcp_port: int):
-        name: str = self.test_release.__name__  # dedicated test semaphore
-        remotehost: Host = Host(type=ConnectionType.TCP, name=name, port=unused_tcp_port, limit=1)
-        host_id: int = remotehost.id()
+        remotehost: Host = Host(type=ConnectionType.TCP, name="remotehost", port=unused_tcp_port, limit=1)
+        table: SlotTable = SlotTable(remotehost, default_slots_path())
 
         with pytest.raises(SystemExit):
             with RemoteHostSemaphore(remotehost):
-                assert Path(f"/dev/shm/sem.{host_id}")
-                assert sysv_ipc.Semaphore(host_id).value == 0
+                assert table.occupied_slots() == 1
                 raise SystemExit(os.EX_TEMPFAIL)
 
-        with pytest.raises(sysv_ipc.ExistentialError):
-            # check if semaphore got cleaned up
-            sysv_ipc.Semaphore(host_id)
-
-    def test_delete_acquire_race(self, unused_tcp_port: int):
-        host: Host = Host(
-            type=ConnectionType.TCP, name=self.test_delete_acquire_race.__name__, port=unused_tcp_port, limit=2
-        )
-        first_sem = RemoteHostSemaphore(host)
-        first_sem._acquire(1.0)  # pylint: disable=protected-access
-
-        second_sem = RemoteHostSemaphore(host)
-        first_sem._clean_up()  # pylint: disable=protected-access
-        second_sem._acquire(1.0)  # pylint: disable=protected-access
-
-        assert second_sem._semaphore.value == 1  # pylint: disable=protected-access
+        # check if the slot got released
+        assert table.occupied_slots() == 0
 
 
+@pytest.mark.usefixtures("homcc_dir")
 class TestLocalHostSemaphore:
     """Tests for LocalHostSemaphore"""
 
@@ -151,54 +336,112 @@ class TestLocalHostSemaphore:
             with LocalHostCompilationSemaphore(remotehost):
                 pass
 
-    # ignore signal handling in non-main threads warning
-    @pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
     @pytest.mark.timeout(5)
     def test_localhosts(self):
         localhost: Host = Host.localhost_with_limit(1)
-        localhost.name = self.test_localhosts.__name__  # overwrite name to create dedicated test semaphore
-        host_id: int = localhost.id()
-
-        def hold_semaphore(host: Host):
-            with LocalHostCompilationSemaphore(host, 2):  # successful acquire
-                assert sysv_ipc.Semaphore(host_id).value == 0
-                time.sleep(1)
-
-        # single hold: 1sec total
-        hold_semaphore(localhost)
-        with pytest.raises(sysv_ipc.ExistentialError):
-            # check if semaphore got cleaned up
-            sysv_ipc.Semaphore(host_id)
-
-        # concurrent holds: 2 or 3sec total
-        threads: List[threading.Thread] = [
-            threading.Thread(target=task, args=(localhost,)) for task in 2 * [hold_semaphore]
-        ]
+        table: SlotTable = SlotTable(localhost, default_slots_path())
+
+        def hold_semaphore():
+            with LocalHostCompilationSemaphore(localhost):  # successful acquire
+                assert table.occupied_slots() == 1
+                time.sleep(0.5)
+
+        # single hold: 0.5sec total
+        hold_semaphore()
+        assert table.occupied_slots() == 0
 
-        for thread in threads:
-            thread.start()
+        # concurrent holds of two processes: 1sec total
+        child: int = os.fork()
 
-        for thread in threads:
-            thread.join()
+        if child == 0:
+            try:
+                hold_semaphore()
+            finally:
+                os._exit(0)  # pylint: disable=protected-access
 
-        with pytest.raises(sysv_ipc.ExistentialError):
-            # check if semaphore got cleaned up
-            sysv_ipc.Semaphore(host_id)
+        hold_semaphore()
+        assert os.waitstatus_to_exitcode(os.waitpid(child, 0)[1]) == 0
+        assert table.occupied_slots() == 0
 
     def test_release(self):
         localhost: Host = Host.localhost_with_limit(1)
-        localhost.name = self.test_localhosts.__name__  # overwrite name to create dedicated test semaphore
-        host_id: int = localhost.id()
+        table: SlotTable = SlotTable(localhost, default_slots_path())
 
         with pytest.raises(SystemExit):
-            with LocalHostCompilationSemaphore(localhost, 2):
-                assert Path(f"/dev/shm/sem.{host_id}")
-                assert sysv_ipc.Semaphore(host_id).value == 0
+            with LocalHostCompilationSemaphore(localhost):
+                assert table.occupied_slots() == 1
                 raise SystemExit(os.EX_TEMPFAIL)
 
-        with pytest.raises(sysv_ipc.ExistentialError):
-            # check if semaphore got cleaned up
-            sysv_ipc.Semaphore(host_id)
+        # check if the slot got released
+        assert table.occupied_slots() == 0
+
+    @pytest.mark.timeout(10)
+    def test_fifo_order(self):
+        localhost: Host = Host.localhost_with_limit(1)
+        tail_path: Path = default_queue_path() / localhost.id() / LocalHostCompilationSemaphore.TAIL_FILENAME
+        context = multiprocessing.get_context("fork")
+        acquisitions = context.SimpleQueue()  # written synchronously, i.e. still while holding the slot
+
+        def acquire(waiter: int):
+            with LocalHostCompilationSemaphore(localhost):
+                acquisitions.put(waiter)
+
+        with LocalHostCompilationSemaphore(localhost):
+            waiters: List[multiprocessing.process.BaseProcess] = []
+
+            for waiter in range(5):
+                waiters.append(context.Process(target=acquire, args=(waiter,)))
+                waiters[-1].start()
+
+                # wait until the process drew its ticket before starting the next one
+                while tail_path.read_text() != str(waiter + 2):
+                    time.sleep(0.01)
+
+        assert [acquisitions.get() for _ in waiters] == list(range(5))
+
+        for waiter in waiters:
+            waiter.join()
+
+        assert not list(tail_path.parent.glob("*.lock"))
+
+    @pytest.mark.timeout(10)
+    def test_killed_waiter(self):
+        # pylint: disable=protected-access
+        localhost: Host = Host.localhost_with_limit(1)
+        tail_path: Path = default_queue_path() / localhost.id() / LocalHostCompilationSemaphore.TAIL_FILENAME
+        context = multiprocessing.get_context("fork")
+
+        def enqueue():
+            LocalHostCompilationSemaphore(localhost)._enqueue()
+            time.sleep(10)
+
+        first: LocalHostCompilationSemaphore = LocalHostCompilationSemaphore(localhost)
+        assert first._enqueue() == 1
+
+        # the middle waiter gets killed while it is queued
+        middle = context.Process(target=enqueue)
+        middle.start()
+
+        while tail_path.read_text() != "2":
+            time.sleep(0.01)
+
+        middle.kill()
+        middle.join()
+
+        last: LocalHostCompilationSemaphore = LocalHostCompilationSemaphore(localhost)
+        ticket: int = last._enqueue()
+        waiting = threading.Thread(target=last._wait_for_predecessor, args=(ticket,))
+        waiting.start()
+
+        # the last waiter must not overtake the first one which is still queued
+        waiting.join(0.5)
+        assert waiting.is_alive()
+
+        first._dequeue()
+        waiting.join()
+        last._dequeue()
+
+        assert not list(tail_path.parent.glob("*.lock"))
 
 
 class TestStateFile:
@@ -3,17 +3,45 @@
 #   https://github.com/celonis/homcc/blob/main/LICENSE
 
 """ Tests for client/compilation.py"""
+import asyncio
 import os
+import socket
 import subprocess
+import time
+from functools import partial
 from pathlib import Path
-from typing import List, Set
+from typing import Dict, List, Optional, Set
 
 import pytest
 
-from homcc.client.compilation import compile_locally, find_dependencies, scan_includes
+from homcc.client import compilation
+from homcc.client.cache import ClientCache, HostStatistics
+from homcc.client.client import TCPClient
+from homcc.client.compilation import (
+    HEDGING_MIN_DELAY,
+    HedgedCompilation,
+    compile_locally,
+    compile_remotely,
+    find_dependencies,
+    get_compiler_target_triple,
+    get_hedging_delay,
+    get_remote_slot_wait,
+    scan_includes,
+)
+from homcc.client.config import ClientConfig
 from homcc.client.parsing import Host
+from homcc.client.semaphores import LocalHostCompilationSemaphore
 from homcc.common.arguments import Arguments
+from homcc.common.compression import NoCompression
 from homcc.common.constants import ENCODING
+from homcc.common.errors import RemoteCompilationTimeoutError, RemoteHostsFailure
+from homcc.common.messages import (
+    CompilationResultMessage,
+    Message,
+    MessageDecoder,
+    QueuedMessage,
+)
+from homcc.common.parsing import HOMCC_DIR_ENV_VAR
 
 
 class TestCompilation:
@@ -97,6 +125,341 @@ class TestCompilation:
     def find_dependencies_with_class_impl_clangplusplus(self):
         self.find_dependencies_class_impl_with_compiler("clang++")
 
+    @pytest.mark.gplusplus
+    def test_find_dependencies_cached(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setenv(HOMCC_DIR_ENV_VAR, str(tmp_path / "homcc"))
+
+        source_dir: Path = tmp_path / "src"
+        include_dir: Path = tmp_path / "include"
+        source_dir.mkdir()
+        include_dir.mkdir()
+        (source_dir / "main.cpp").write_text('#include "foo.h"\nint main() {}\n')
+        (include_dir / "foo.h").write_text("#pragma once\n")
+
+        # files need to be unmodified for a while before their dependency manifests are cached
+        old_time_ns: int = time.time_ns() - 2 * ClientCache.RACY_MTIME_NS
+        for path in [source_dir / "main.cpp", include_dir / "foo.h"]:
+            os.utime(path, ns=(old_time_ns, old_time_ns))
+
+        executions: List[Arguments] = []
+        execute = Arguments.execute
+
+        def counting_execute(arguments: Arguments, *args, **kwargs):
+            executions.append(arguments)
+            return execute(arguments, *args, **kwargs)
+
+        monkeypatch.setattr(Arguments, "execute", counting_execute)
+
+        dependency_file: Path = tmp_path / "main.d"
+        arguments: Arguments = Arguments.from_vargs(
+            "g++", f"-I{include_dir}", "-MD", "-MF", str(dependency_file), str(source_dir / "main.cpp")
+        )
+        dependencies: Set[str] = {str(source_dir / "main.cpp"), str(include_dir / "foo.h")}
+
+        assert find_dependencies(arguments) == dependencies
+        assert len(executions) == 1
+
+        # the preprocessor is skipped for unchanged translation units, but its side effects are restored
+        dependency_file_content: str = dependency_file.read_text(encoding=ENCODING)
+        dependency_file.unlink()
+
+        assert find_dependencies(arguments) == dependencies
+        assert len(executions) == 1
+        assert dependency_file.read_text(encoding=ENCODING) == dependency_file_content
+
+        # object files written next to the sources do not invalidate the cached dependencies
+        (source_dir / "main.o").write_bytes(b"")
+
+        assert find_dependencies(arguments) == dependencies
+        assert len(executions) == 1
+
+        # headers that shadow previously found ones invalidate the cached dependencies
+        (source_dir / "foo.h").write_text("#pragma once\n")
+
+        assert find_dependencies(arguments) == {str(source_dir / "main.cpp"), str(source_dir / "foo.h")}
+        assert len(executions) == 2
+
+    @pytest.mark.gplusplus
+    def test_get_compiler_target_triple_cached(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setenv(HOMCC_DIR_ENV_VAR, str(tmp_path / "homcc"))
+
+        executions: List[Arguments] = []
+        execute = Arguments.execute
+
+        def counting_execute(arguments: Arguments, *args, **kwargs):
+            executions.append(arguments)
+            return execute(arguments, *args, **kwargs)
+
+        monkeypatch.setattr(Arguments, "execute", counting_execute)
+
+        target_triple: str = subprocess.check_output(["g++", "-dumpmachine"], encoding=ENCODING).strip()
+
+        # the compiler is only queried once, all further target triples are taken from the client cache
+        for _ in range(3):
+            assert (
+                get_compiler_target_triple(Arguments.from_vargs("g++", "-c", "example/src/main.cpp")) == target_triple
+            )
+
+        assert len(executions) == 1
+
+    def test_get_compiler_target_triple_per_invoked_compiler(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setenv(HOMCC_DIR_ENV_VAR, str(tmp_path / "homcc"))
+
+        compiler: Path = tmp_path / "clang"
+        compiler.write_text('#!/bin/sh\necho "Target: $(basename $0)"\n')
+        compiler.chmod(0o755)
+
+        # cross drivers resolve to the same executable, but derive their target from the name they are called by
+        cross_compiler: Path = tmp_path / "aarch64-linux-gnu-clang"
+        cross_compiler.symlink_to(compiler)
+
+        for _ in range(2):
+            assert get_compiler_target_triple(Arguments.from_vargs(str(compiler), "main.cpp")) == "clang"
+            assert get_compiler_target_triple(Arguments.from_vargs(str(cross_compiler), "main.cpp")) == (
+                "aarch64-linux-gnu-clang"
+            )
+
+    def test_compile_remotely_records_failures(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setenv(HOMCC_DIR_ENV_VAR, str(tmp_path / "homcc"))
+        monkeypatch.setattr(compilation, "_preprocess", lambda *_: {})
+
+        # reserve a port on which nothing listens, so that connections are refused
+        with socket.socket() as unused_socket:
+            unused_socket.bind(("127.0.0.1", 0))
+            port: int = unused_socket.getsockname()[1]
+
+        arguments: Arguments = Arguments.from_vargs("g++", "-c", "example/src/main.cpp")
+        host: Host = Host.from_str(f"127.0.0.1:{port}/1")
+
+        requests: List[str] = []
+        connect = TCPClient.connect
+
+        async def counting_connect(client: TCPClient):
+            requests.append(f"{client.host}:{client.port}")
+            return await connect(client)
+
+        monkeypatch.setattr(TCPClient, "connect", counting_connect)
+
+        with pytest.raises(RemoteHostsFailure):
+            asyncio.run(compile_remotely(arguments, [host], Host.default_localhost(), ClientConfig.empty()))
+
+        with ClientCache() as cache:
+            statistics = cache.get_host_statistics([f"127.0.0.1:{port}"])[f"127.0.0.1:{port}"]
+
+        assert statistics.refusal_rate == 1
+        assert statistics.connect_time is None and statistics.turnaround is None
+
+        # the circuit breaker of the failed host is open, so that further invocations do not try it again
+        with pytest.raises(RemoteHostsFailure):
+            asyncio.run(compile_remotely(arguments, [host], Host.default_localhost(), ClientConfig.empty()))
+
+        assert requests == [f"127.0.0.1:{port}"]
+
+    def test_compile_remotely_records_timeouts(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setenv(HOMCC_DIR_ENV_VAR, str(tmp_path / "homcc"))
+        monkeypatch.setattr(compilation, "_preprocess", lambda *_: {})
+
+        # connections to a socket which never accepts them are established, but their requests are never answered
+        with socket.socket() as unresponsive_socket:
+            unresponsive_socket.bind(("127.0.0.1", 0))
+            unresponsive_socket.listen()
+            port: int = unresponsive_socket.getsockname()[1]
+
+            arguments: Arguments = Arguments.from_vargs("g++", "-c", "example/src/main.cpp")
+            host: Host = Host.from_str(f"127.0.0.1:{port}/1")
+            config: ClientConfig = ClientConfig(files=[], compilation_request_timeout=0.5)
+
+            with pytest.raises(RemoteCompilationTimeoutError):
+                asyncio.run(compile_remotely(arguments, [host], Host.default_localhost(), config))
+
+            with ClientCache() as cache:
+                statistics = cache.get_host_statistics([f"127.0.0.1:{port}"])[f"127.0.0.1:{port}"]
+
+            assert statistics.refusal_rate == 1
+            assert statistics.turnaround is None
+
+            # the circuit breaker of the timed out host is open, so that further invocations do not try it again
+            with pytest.raises(RemoteHostsFailure):
+                asyncio.run(compile_remotely(arguments, [host], Host.default_localhost(), config))
+
+    def test_compile_remotely_retries_timeouts(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setenv(HOMCC_DIR_ENV_VAR, str(tmp_path / "homcc"))
+        monkeypatch.setattr(compilation, "_preprocess", lambda *_: {})
+
+        with socket.socket() as unresponsive_socket, socket.socket() as other_unresponsive_socket:
+            keys: List[str] = []
+
+            for sock in [unresponsive_socket, other_unresponsive_socket]:
+                sock.bind(("127.0.0.1", 0))
+                sock.listen()
+                keys.append(f"127.0.0.1:{sock.getsockname()[1]}")
+
+            arguments: Arguments = Arguments.from_vargs("g++", "-c", "example/src/main.cpp")
+            hosts: List[Host] = [Host.from_str(f"{key}/1") for key in keys]
+            config: ClientConfig = ClientConfig(files=[], compilation_request_timeout=0.5)
+
+            # a timed out request is retried at the next host before falling back to local compilation
+            with pytest.raises(RemoteCompilationTimeoutError):
+                asyncio.run(compile_remotely(arguments, hosts, Host.default_localhost(), config))
+
+            with ClientCache() as cache:
+                statistics: Dict[str, HostStatistics] = cache.get_host_statistics(keys)
+
+            assert statistics.keys() == set(keys)
+            assert all(host_statistics.turnaround is None for host_statistics in statistics.values())
+
+    def test_compile_remotely_retries_declined_requests(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setenv(HOMCC_DIR_ENV_VAR, str(tmp_path / "homcc"))
+        monkeypatch.setattr(compilation, "_preprocess", lambda *_: {})
+
+        # select the hosts in the given order
+        monkeypatch.setattr("homcc.client.client.RemoteHostSelector", lambda hosts, *_: iter(hosts))
+
+        def respond(*messages: Message):
+            async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+                decoder: MessageDecoder = MessageDecoder()
+
+                while not decoder.feed(await reader.readexactly(decoder.bytes_needed())):
+                    pass
+
+                for message in messages:
+                    writer.writelines(message.to_buffers())
+
+                await writer.drain()
+                writer.close()
+
+            return handle
+
+        # the compilation queue of the first host times out, while the second host compiles right away
+        queue_timeout_result: CompilationResultMessage = CompilationResultMessage(
+            [], "", "All 1 compilation slots were occupied for longer than 10s.", os.EX_TEMPFAIL, NoCompression(), []
+        )
+        result: CompilationResultMessage = CompilationResultMessage([], "", "", os.EX_OK, NoCompression(), [])
+        arguments: Arguments = Arguments.from_vargs("g++", "-c", "example/src/main.cpp")
+        keys: List[str] = []
+
+        async def compile_at_busy_and_free_host() -> int:
+            busy_server = await asyncio.start_server(
+                respond(QueuedMessage(1, None), queue_timeout_result), "127.0.0.1", 0
+            )
+            free_server = await asyncio.start_server(respond(result), "127.0.0.1", 0)
+
+            async with busy_server, free_server:
+                keys.extend(f"127.0.0.1:{server.sockets[0].getsockname()[1]}" for server in [busy_server, free_server])
+                hosts: List[Host] = [Host.from_str(f"{key}/1") for key in keys]
+                return await compile_remotely(arguments, hosts, Host.default_localhost(), ClientConfig.empty())
+
+        assert asyncio.run(compile_at_busy_and_free_host()) == os.EX_OK
+
+        with ClientCache() as cache:
+            statistics: Dict[str, HostStatistics] = cache.get_host_statistics(keys)
+
+        # the declined request counts as refused by the busy host
+        assert statistics[keys[0]].refusal_rate == 1 and statistics[keys[0]].turnaround is None
+        assert statistics[keys[1]].refusal_rate == 0 and statistics[keys[1]].turnaround is not None
+
+    def test_hedged_compilation(self):
+        finished: List[str] = []
+
+        async def compile_for(name: str, duration: float, race: HedgedCompilation) -> int:
+            await asyncio.sleep(duration)
+
+            if not race.claim():
+                raise asyncio.CancelledError
+
+            # the result of a compilation is the amount of compilations that finished so far
+            finished.append(name)
+            return len(finished)
+
+        async def failing_compilation() -> int:
+            raise ConnectionError
+
+        # the hedge is only started if the compilation straggles
+        race = HedgedCompilation(delay=0.5)
+        assert asyncio.run(race.run(compile_for("remote", 0.1, race), lambda: compile_for("hedge", 0, race))) == 1
+        assert finished == ["remote"]
+
+        # the first finished compilation wins and the other one is cancelled
+        race = HedgedCompilation(delay=0.1)
+        assert asyncio.run(race.run(compile_for("remote", 10, race), lambda: compile_for("hedge", 0.1, race))) == 2
+        assert finished == ["remote", "hedge"]
+
+        # failing hedges are ignored
+        race = HedgedCompilation(delay=0.1)
+        assert asyncio.run(race.run(compile_for("remote", 0.2, race), failing_compilation)) == 3
+        assert finished == ["remote", "hedge", "remote"]
+
+        # without delay, no hedge is started
+        race = HedgedCompilation(delay=None)
+        assert asyncio.run(race.run(compile_for("remote", 0.2, race), lambda: compile_for("hedge", 0, race))) == 4
+        assert finished == ["remote", "hedge", "remote", "remote"]
+
+    def test_get_hedging_delay(self):
+        host: Host = Host.from_str("remotehost/4")
+        statistics: HostStatistics = HostStatistics(0.01, None, None, 0, time.time())
+
+        assert get_hedging_delay(host, {}) is None
+        assert get_hedging_delay(host, {"remotehost:3126": statistics}) is None
+
+        statistics.turnaround = 0.1
+        assert get_hedging_delay(host, {"remotehost:3126": statistics}) == HEDGING_MIN_DELAY
+
+        statistics.turnaround = 10
+        assert get_hedging_delay(host, {"remotehost:3126": statistics}) > statistics.turnaround
+
+        # with enough recent turnarounds, the delay is their quantile
+        statistics.recent_turnarounds = [float(turnaround) for turnaround in range(100, 0, -1)]
+        assert get_hedging_delay(host, {"remotehost:3126": statistics}) == 95
+
+    def test_get_remote_slot_wait(self):
+        hosts: List[Host] = [Host.from_str("remotehost/4"), Host.from_str("otherhost/4")]
+        localhost: Host = Host.default_localhost()
+        expected_local_time: float = LocalHostCompilationSemaphore.DEFAULT_EXPECTED_COMPILATION_TIME
+
+        # without any remote turnaround, waiting for remote slots is not expected to pay off
+        assert get_remote_slot_wait(hosts, localhost, {}) == 0
+
+        statistics: Dict[str, HostStatistics] = {
+            "remotehost:3126": HostStatistics(0.5, 2.5, None, 0, time.time()),
+            "otherhost:3126": HostStatistics(0.1, 1.0, None, 0, time.time()),
+        }
+        assert get_remote_slot_wait(hosts, localhost, statistics) == pytest.approx(expected_local_time - 1.1)
+
+        # measured local compilations replace the expected local compilation time
+        statistics[f"{localhost.name}:{localhost.port}"] = HostStatistics(None, 0.5, None, 0, time.time())
+        assert get_remote_slot_wait(hosts, localhost, statistics) == 0
+
+    @pytest.mark.gplusplus
+    def test_compile_locally_hedged(self, tmp_path: Path):
+        # pylint: disable=protected-access
+        output: Path = tmp_path / "main.o"
+        arguments: Arguments = Arguments.from_vargs(
+            "g++",
+            "-Iexample/include",
+            "-MD",
+            "-MF",
+            str(tmp_path / "main.d"),
+            "-c",
+            "example/src/main.cpp",
+            f"-o{output}",
+        )
+
+        async def remote_compilation(race: HedgedCompilation) -> int:
+            assert race.claim()
+            return os.EX_TEMPFAIL
+
+        # the local compilation is killed if the remote compilation wins the race
+        race = HedgedCompilation(delay=0)
+        hedge = partial(compilation._compile_locally_hedged, arguments, race)
+        assert asyncio.run(race.run(remote_compilation(race), hedge)) == os.EX_TEMPFAIL
+        assert not list(tmp_path.iterdir())
+
+        # the temporary output replaces the actual output if the local compilation wins, dependency files were already
+        # created during preprocessing
+        race = HedgedCompilation(delay=0)
+        assert asyncio.run(compilation._compile_locally_hedged(arguments, race)) == os.EX_OK
+        assert list(tmp_path.iterdir()) == [output]
+
     def test_find_dependencies_error(self):
         with pytest.raises(subprocess.CalledProcessError):
             _: Set[str] = find_dependencies(
@@ -119,3 +482,16 @@ class TestCompilation:
         Path(output).unlink(missing_ok=True)
 
         assert compile_locally(Arguments.from_vargs(*args, "-OError"), Host.localhost_with_limit(1)) != os.EX_OK
+
+    def test_local_compilation_records_statistics(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setenv(HOMCC_DIR_ENV_VAR, str(tmp_path / "homcc"))
+        localhost: Host = Host.localhost_with_limit(1)
+        args: List[str] = ["g++", "-Iexample/include", "-c", "example/src/foo.cpp", f"-o{tmp_path / 'foo.o'}"]
+
+        assert compile_locally(Arguments.from_vargs(*args), localhost, record_statistics=True) == os.EX_OK
+
+        with ClientCache() as cache:
+            statistics = cache.get_host_statistics([f"{localhost.name}:{localhost.port}"])
+
+        turnaround: Optional[float] = statistics[f"{localhost.name}:{localhost.port}"].turnaround
+        assert turnaround is not None and turnaround > 0
@@ -0,0 +1,164 @@
+# Copyright (c) 2023 Celonis SE
+# Covered under the included MIT License:
+#   https://github.com/celonis/homcc/blob/main/LICENSE
+
+"""Tests for client/include_scanner.py"""
+import os
+import time
+from pathlib import Path
+from typing import List, Optional, Set
+
+import pytest
+
+from homcc.client.cache import ClientCache
+from homcc.client.compilation import filter_sendable_dependencies, find_dependencies
+from homcc.client.include_scanner import (
+    Include,
+    IncludeScanner,
+    SearchPaths,
+    parse_includes,
+    scan_dependencies,
+)
+from homcc.common.arguments import Arguments
+from homcc.common.parsing import HOMCC_DIR_ENV_VAR
+
+
+class TestIncludeScanner:
+    """Tests for the include scanner."""
+
+    @pytest.fixture(autouse=True)
+    def homcc_dir(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setenv(HOMCC_DIR_ENV_VAR, str(tmp_path / "homcc"))
+
+    def test_parse_includes(self):
+        content: bytes = b"\n".join(
+            [
+                b'#include "foo.h"',
+                b"  #  include <vector>  // comment",
+                b"#ifdef _WIN32",
+                b"#include <windows.h>",
+                b"#endif",
+                b"#include_next <stdlib.h>",
+                b"#include FOO_HEADER",
+                b"#include // malformed",
+                b"// #include <commented.h>",
+                b"#define INCLUDE_GUARD",
+            ]
+        )
+
+        assert parse_includes(content) == [
+            Include("foo.h", quoted=True, next=False),
+            Include("vector", quoted=False, next=False),
+            Include("windows.h", quoted=False, next=False),
+            Include("stdlib.h", quoted=False, next=True),
+            Include(None, quoted=False, next=False),
+        ]
+
+    def test_search_paths(self):
+        verbose_output: str = "\n".join(
+            [
+                "ignoring nonexistent directory \"/usr/local/include/x86_64-linux-gnu\"",
+                '#include "..." search starts here:',
+                " quote",
+                "#include <...> search starts here:",
+                " include/../include",
+                " /usr/include/c++/12",
+                " /usr/include",
+                "End of search list.",
+                " not/a/search/path",
+            ]
+        )
+
+        search_paths: SearchPaths = SearchPaths.from_verbose_output(verbose_output)
+
+        assert search_paths.quoted == ["quote"]
+        assert search_paths.angled == ["include", "/usr/include/c++/12", "/usr/include"]
+        assert search_paths.directories() == ["quote", "include", "/usr/include/c++/12", "/usr/include"]
+
+    def test_search_paths_per_invoked_compiler(self, tmp_path: Path):
+        compiler: Path = tmp_path / "clang"
+        compiler.write_text(
+            "#!/bin/sh\n"
+            'printf "#include <...> search starts here:\\n /usr/$(basename $0)\\nEnd of search list.\\n" >&2\n'
+        )
+        compiler.chmod(0o755)
+
+        # cross drivers resolve to the same executable, but derive their search paths from the name they are called by
+        cross_compiler: Path = tmp_path / "aarch64-linux-gnu-clang"
+        cross_compiler.symlink_to(compiler)
+
+        with ClientCache() as cache:
+            scanner: IncludeScanner = IncludeScanner(cache)
+
+            # query twice to cover both, invoking the compilers and looking their search paths up in the client cache
+            for _ in range(2):
+                assert scanner.search_paths(Arguments.from_vargs(str(compiler), "main.cpp"), "c++").angled == [
+                    "/usr/clang"
+                ]
+                assert scanner.search_paths(Arguments.from_vargs(str(cross_compiler), "main.cpp"), "c++").angled == [
+                    "/usr/aarch64-linux-gnu-clang"
+                ]
+
+    def test_resolve(self, tmp_path: Path):
+        for header in ["first/foo.h", "second/foo.h", "src/foo.h", "src/main.cpp"]:
+            (tmp_path / header).parent.mkdir(exist_ok=True)
+            (tmp_path / header).touch()
+
+        first, second, src = str(tmp_path / "first"), str(tmp_path / "second"), str(tmp_path / "src")
+        search_paths = SearchPaths(quoted=[], angled=[first, second])
+        scanner = IncludeScanner()
+
+        def resolve(include: Include, includer: str, index: Optional[int]) -> Optional[str]:
+            resolved = scanner.resolve(include, includer, index, search_paths)
+            return None if resolved is None else resolved[0]
+
+        main: str = f"{src}/main.cpp"
+        assert resolve(Include("foo.h", quoted=True, next=False), main, None) == f"{src}/foo.h"
+        assert resolve(Include("foo.h", quoted=False, next=False), main, None) == f"{first}/foo.h"
+        assert resolve(Include("foo.h", quoted=False, next=True), f"{first}/foo.h", 0) == f"{second}/foo.h"
+        assert resolve(Include("foo.h", quoted=False, next=True), f"{second}/foo.h", 1) is None
+        assert resolve(Include("bar.h", quoted=False, next=False), main, None) is None
+
+    @pytest.mark.gplusplus
+    def test_scan_dependencies(self, tmp_path: Path):
+        (tmp_path / "include").mkdir()
+        (tmp_path / "src").mkdir()
+        (tmp_path / "include" / "foo.h").write_text('#pragma once\n#include "bar.h"\n#include <vector>\n')
+        (tmp_path / "include" / "bar.h").write_text("#pragma once\n#define BAR\n")
+        (tmp_path / "src" / "local.h").write_text("#pragma once\n#define LOCAL\n")
+        (tmp_path / "src" / "main.cpp").write_text(
+            '#include <foo.h>\n#include "local.h"\n#ifdef _WIN32\n#include <windows.h>\n#endif\nint main() {}\n'
+        )
+
+        # headers need to be unmodified for a while before their include directives are cached
+        old_time_ns: int = time.time_ns() - 2 * ClientCache.RACY_MTIME_NS
+        for header in ["include/foo.h", "include/bar.h", "src/local.h", "src/main.cpp"]:
+            os.utime(tmp_path / header, ns=(old_time_ns, old_time_ns))
+
+        args: List[str] = ["g++", f"-I{tmp_path}/include", f"{tmp_path}/src/main.cpp"]
+        expected_dependencies: Set[str] = filter_sendable_dependencies(find_dependencies(Arguments.from_vargs(*args)))
+
+        # scan twice to cover both, parsing headers and looking them up in the client cache
+        for _ in range(2):
+            scanned_dependencies: Optional[Set[str]] = scan_dependencies(Arguments.from_vargs(*args))
+
+            assert scanned_dependencies is not None
+            assert filter_sendable_dependencies(scanned_dependencies) == expected_dependencies
+            assert find_dependencies(Arguments.from_vargs(*args), include_scanner=True) == expected_dependencies
+
+    @pytest.mark.gplusplus
+    def test_fallback(self, tmp_path: Path):
+        (tmp_path / "foo.h").write_text("#pragma once\n")
+        (tmp_path / "main.cpp").write_text('#define FOO_HEADER "foo.h"\n#include FOO_HEADER\nint main() {}\n')
+
+        arguments: Arguments = Arguments.from_vargs("g++", str(tmp_path / "main.cpp"))
+
+        # computed includes can not be resolved by the include scanner, the preprocessor is used instead
+        assert scan_dependencies(arguments) is None
+        assert find_dependencies(arguments, include_scanner=True) == {
+            str(tmp_path / "main.cpp"),
+            str(tmp_path / "foo.h"),
+        }
+
+        # implicitly included files are not supported either
+        assert scan_dependencies(Arguments.from_vargs("g++", "-include", "foo.h", str(tmp_path / "main.cpp"))) is None
@@ -0,0 +1,80 @@
+# Copyright (c) 2023 Celonis SE
+# Covered under the included MIT License:
+#   https://github.com/celonis/homcc/blob/main/LICENSE
+
+"""Tests for client/main.py"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Set
+
+import pytest
+
+import homcc
+from homcc.common.parsing import HOMCC_DIR_ENV_VAR
+
+
+class TestMain:
+    """Tests for the homcc client entry point."""
+
+    REMOTE_ONLY_MODULES: List[str] = [
+        "asyncio",
+        "sqlite3",
+        "homcc.client.cache",
+        "homcc.client.client",
+        "homcc.client.include_scanner",
+        "homcc.common.messages",
+    ]
+
+    RUN_CLIENT: str = "\n".join(
+        [
+            "import sys",
+            "from homcc.client.main import run",
+            "modules_path = sys.argv.pop()",
+            "sys.argv[0] = 'homcc'",
+            "try:",
+            "    run()",
+            "except SystemExit as sys_exit:",
+            "    assert sys_exit.code == 0",
+            "with open(modules_path, 'w') as modules_file:",
+            "    modules_file.write('\\n'.join(sys.modules))",
+        ]
+    )
+
+    @staticmethod
+    def imported_modules(args: List[str], tmp_path: Path) -> Set[str]:
+        """run the homcc client with the given arguments in a new interpreter and return all modules it imported"""
+        env: Dict[str, str] = dict(os.environ)
+        env.pop("_HOMCC_SAFEGUARD", None)
+        env.update(
+            {
+                HOMCC_DIR_ENV_VAR: str(tmp_path / "homcc"),
+                "HOMCC_HOSTS": "localhost/1\n127.0.0.1:1/1",  # unreachable remote host to fall back locally
+                "PYTHONPATH": os.pathsep.join([str(Path(homcc.__file__).parent.parent), env.get("PYTHONPATH", "")]),
+            }
+        )
+        modules_file: Path = tmp_path / "modules"
+        subprocess.run(
+            [sys.executable, "-c", TestMain.RUN_CLIENT, *args, str(modules_file)],
+            cwd=tmp_path,
+            env=env,
+            capture_output=True,
+            check=True,
+        )
+
+        return set(modules_file.read_text().splitlines())
+
+    @pytest.mark.gplusplus
+    def test_local_paths_skip_remote_modules(self, tmp_path: Path):
+        (tmp_path / "main.cpp").write_text("int main() {}\n")
+        subprocess.run(["g++", "-c", "main.cpp", "-o", "main.o"], cwd=tmp_path, check=True)
+
+        for args in [["g++", "--version"], ["g++", "main.o", "-o", "main"]]:
+            modules: Set[str] = self.imported_modules(args, tmp_path)
+            assert not modules.intersection(self.REMOTE_ONLY_MODULES), args
+
+        # compiling remotely requires them, even though there is no remote host and the compilation falls back
+        modules = self.imported_modules(["g++", "-c", "main.cpp", "-o", "main.o"], tmp_path)
+        assert modules.issuperset(self.REMOTE_ONLY_MODULES)
+        assert (tmp_path / "main").exists()
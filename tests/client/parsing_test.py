@@ -257,6 +257,9 @@ class TestParsingConfig:
         "docker_container=some_container",
         "log_level=INFO",
         "verbose=TRUE",
+        "include_scanner=on",
+        "hedging=yes",
+        "wait_for_remote_slots=on",
         # the following configs should be ignored
         "[homccd]",
         "LOG_LEVEL=DEBUG",
@@ -280,6 +283,9 @@ class TestParsingConfig:
             verbose=True,
             schroot_profile="foobar",
             docker_container="some_container",
+            include_scanner=True,
+            hedging=True,
+            wait_for_remote_slots=True,
         )
 
     def test_parse_multiple_config_files(self, tmp_path: Path):
@@ -297,6 +303,9 @@ class TestParsingConfig:
             docker_container="some_container",
             log_level="INFO",
             verbose=False,
+            include_scanner=True,
+            hedging=True,
+            wait_for_remote_slots=True,
         )
 
 
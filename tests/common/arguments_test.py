@@ -198,6 +198,14 @@ class TestArguments:
         assert not source_file_arguments.remove_source_file_args().source_files
         assert not source_file_arguments.add_arg("baz.cpp").source_files  # no change as property is cached
 
+    def test_include_directories(self):
+        args: List[str] = ["g++", "-Iinclude", "-I", "other/include", "-isystem/usr/local/include", "-O0", "foo.cpp"]
+        include_directories: List[str] = ["include", "other/include", "/usr/local/include"]
+
+        assert Arguments.from_vargs(*args).include_directories == include_directories
+        assert Arguments.from_vargs(*args, "-iquote", "quote").include_directories == include_directories + ["quote"]
+        assert not Arguments.from_vargs("g++", "-isysroot", "/sysroot", "foo.cpp").include_directories
+
     def test_single_source_file_args(self):
         single_source_file_args: List[str] = ["some/relative/path.c"]
         assert Arguments.from_vargs("g++", *single_source_file_args).source_files == single_source_file_args
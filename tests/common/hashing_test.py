@@ -0,0 +1,44 @@
+# Copyright (c) 2023 Celonis SE
+# Covered under the included MIT License:
+#   https://github.com/celonis/homcc/blob/main/LICENSE
+
+"""Tests the hashing module of homcc."""
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+from homcc.common.hashing import (
+    HASHING_CHUNK_SIZE,
+    MIN_FILES_PER_HASHING_WORKER,
+    hash_file_with_path,
+    hash_files_with_paths,
+)
+
+
+class TestHashing:
+    """Tests related to file hashing."""
+
+    @pytest.mark.parametrize("size", [0, 1, HASHING_CHUNK_SIZE, HASHING_CHUNK_SIZE + 1, 3 * HASHING_CHUNK_SIZE - 7])
+    def test_hash_file_with_path(self, tmp_path: Path, size: int):
+        content: bytes = os.urandom(size)
+        file: Path = tmp_path / "file"
+        file.write_bytes(content)
+
+        assert hash_file_with_path(str(file)) == hashlib.sha1(content).hexdigest()
+
+    @pytest.mark.parametrize("max_workers", [1, 4])
+    def test_hash_files_with_paths(self, tmp_path: Path, max_workers: int):
+        paths: List[str] = []
+
+        for index in range(4 * MIN_FILES_PER_HASHING_WORKER + 3):
+            file: Path = tmp_path / f"file{index}"
+            file.write_bytes(f"content{index}".encode())
+            paths.append(str(file))
+
+        expected_hashes: Dict[str, str] = {path: hashlib.sha1(Path(path).read_bytes()).hexdigest() for path in paths}
+
+        assert hash_files_with_paths(paths, max_workers) == expected_hashes
+        assert not hash_files_with_paths([], max_workers)
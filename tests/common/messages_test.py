@@ -4,6 +4,7 @@
 
 """Tests the messages module of homcc."""
 import os
+import socket
 from typing import Dict, List
 
 import pytest
@@ -12,10 +13,13 @@ from homcc.common.compression import LZMA, NoCompression
 from homcc.common.messages import (
     ArgumentMessage,
     CompilationResultMessage,
+    DependencyBatchRequestMessage,
     DependencyReplyMessage,
     DependencyRequestMessage,
     File,
     Message,
+    MessageDecoder,
+    QueuedMessage,
 )
 
 
@@ -60,6 +64,32 @@ class TestDependencyRequestMessage:
         assert message == serialized_message
 
 
+class TestDependencyBatchRequestMessage:
+    """Tests related to the DependencyBatchRequestMessage."""
+
+    def test_serialization(self):
+        sha1sums: List[str] = ["0a62827cfce18c7da06444d8e8c9eec876a7e65f", "1f7a8d7f8fc8aaa3b77ab0a5bc11e0d8a2c14b6e"]
+        message = DependencyBatchRequestMessage(sha1sums)
+
+        message_bytes: bytearray = message.to_bytes()
+
+        _, serialized_message = Message.from_bytes(message_bytes)
+
+        assert message == serialized_message
+
+
+class TestQueuedMessage:
+    """Tests related to the QueuedMessage."""
+
+    def test_serialization(self):
+        for message in [QueuedMessage(3, 1.5), QueuedMessage(1, None)]:
+            message_bytes: bytearray = message.to_bytes()
+
+            _, serialized_message = Message.from_bytes(message_bytes)
+
+            assert message == serialized_message
+
+
 class TestDependencyReplyMessage:
     """Tests related to the DependencyReplyMessage."""
 
@@ -117,3 +147,45 @@ class TestFile:
 
         assert len(object_file) == len(compressed_data)
         assert object_file.to_wire() == compressed_data
+
+
+class TestMessageDecoder:
+    """Tests related to the MessageDecoder."""
+
+    messages: List[Message] = [
+        DependencyRequestMessage("0a62827cfce18c7da06444d8e8c9eec876a7e65f"),
+        DependencyReplyMessage(bytearray(os.urandom(13337)), LZMA()),
+        CompilationResultMessage(
+            [File("foo.o", bytearray(os.urandom(1337)), NoCompression())], "stdout", "", 0, NoCompression(), []
+        ),
+        DependencyReplyMessage(bytearray(os.urandom(42)), NoCompression()),
+    ]
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 8, 1000, 1 << 20])
+    def test_feed(self, chunk_size: int):
+        stream: bytearray = bytearray().join(message.to_bytes() for message in self.messages)
+        decoder = MessageDecoder()
+        decoded_messages: List[Message] = []
+
+        for offset in range(0, len(stream), chunk_size):
+            decoded_messages.extend(decoder.feed(stream[offset : offset + chunk_size]))
+
+        assert decoded_messages == self.messages
+        assert not decoder.has_partial_message()
+        assert decoder.bytes_needed() == Message.MINIMUM_SIZE_BYTES
+
+    def test_receive_from(self):
+        decoder = MessageDecoder()
+        decoded_messages: List[Message] = []
+        sender, receiver = socket.socketpair()
+
+        with sender, receiver:
+            for message in self.messages:
+                sender.sendall(message.to_bytes())
+            sender.shutdown(socket.SHUT_WR)
+
+            while (received_messages := decoder.receive_from(receiver)) is not None:
+                decoded_messages.extend(received_messages)
+
+        assert decoded_messages == self.messages
+        assert not decoder.has_partial_message()
@@ -0,0 +1,88 @@
+# Copyright (c) 2023 Celonis SE
+# Covered under the included MIT License:
+#   https://github.com/celonis/homcc/blob/main/LICENSE
+
+"""Tests regarding the admission module of the server."""
+import threading
+import time
+from typing import List, Optional
+
+import pytest
+
+from homcc.server.admission import AdmissionQueue, AdmissionTicket
+
+
+class TestAdmissionQueue:
+    """Tests for the AdmissionQueue."""
+
+    def test_bounded_queue(self):
+        admission_queue = AdmissionQueue(limit=1, queue_limit=2)
+
+        assert admission_queue.try_acquire()
+        assert not admission_queue.try_acquire()
+
+        first: Optional[AdmissionTicket] = admission_queue.enqueue()
+        second: Optional[AdmissionTicket] = admission_queue.enqueue()
+        assert first is not None and second is not None
+        assert admission_queue.enqueue() is None
+
+        assert admission_queue.position(first) == 1
+        assert admission_queue.position(second) == 2
+
+        assert not admission_queue.acquire(first, time.monotonic())
+        assert admission_queue.position(second) == 1
+        assert len(admission_queue) == 1
+
+    def test_deadline(self):
+        admission_queue = AdmissionQueue(limit=1, queue_limit=1)
+        assert admission_queue.try_acquire()
+
+        ticket: Optional[AdmissionTicket] = admission_queue.enqueue()
+        assert ticket is not None
+
+        assert not admission_queue.acquire(ticket, time.monotonic() + 0.05)
+        assert len(admission_queue) == 0
+        assert admission_queue.occupied_slots == 1
+
+    @pytest.mark.timeout(5)
+    def test_first_in_first_out(self):
+        admission_queue = AdmissionQueue(limit=1, queue_limit=3)
+        assert admission_queue.try_acquire()
+
+        admitted: List[int] = []
+        tickets: List[Optional[AdmissionTicket]] = [admission_queue.enqueue() for _ in range(3)]
+
+        def wait_for_slot(index: int):
+            ticket: Optional[AdmissionTicket] = tickets[index]
+            assert ticket is not None
+            assert admission_queue.acquire(ticket, time.monotonic() + 5)
+            admitted.append(index)
+            admission_queue.release(0.1)
+
+        # the waiting threads are started in reverse order, but are admitted in the order they were enqueued in
+        threads: List[threading.Thread] = [threading.Thread(target=wait_for_slot, args=(i,)) for i in (2, 1, 0)]
+
+        for thread in threads:
+            thread.start()
+
+        # queued requests are admitted as soon as the slot is released
+        admission_queue.release(0.5)
+
+        for thread in threads:
+            thread.join()
+
+        assert admitted == [0, 1, 2]
+        assert admission_queue.occupied_slots == 0
+
+    def test_estimated_wait(self):
+        admission_queue = AdmissionQueue(limit=2, queue_limit=2)
+        assert admission_queue.estimated_wait(1) is None
+
+        assert admission_queue.try_acquire()
+        admission_queue.release(4.0)
+        assert admission_queue.estimated_wait(1) == 2.0
+        assert admission_queue.estimated_wait(3) == 6.0
+
+        assert admission_queue.try_acquire()
+        admission_queue.release(9.0)
+        assert admission_queue.estimated_wait(1) == pytest.approx((4.0 + AdmissionQueue.HOLD_TIME_SMOOTHING * 5) / 2)
@@ -6,8 +6,13 @@
 
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from threading import Thread
+from typing import List, Optional
 
-from homcc.server.cache import Cache
+import pytest
+from pytest_mock import MockerFixture
+
+from homcc.server.cache import Cache, ProbeCache, ResultCache
 
 
 class TestCache:
@@ -40,3 +45,199 @@ class TestCache:
             assert Path.read_bytes(Path(cache.get("hash3"))) == file3
 
             assert "other_hash" not in cache
+
+    def test_persistence(self, tmp_path: Path):
+        cache = Cache(tmp_path)
+        cache.put("hash1", bytearray([0x1, 0x2, 0x3, 0x9]))
+        cache.put("hash2", bytearray([0x3, 0x6, 0x3, 0x9]))
+
+        # simulate an interrupted write before the server restarts
+        (tmp_path / "cache" / f"{Cache.TEMPORARY_FILE_PREFIX}hash3").write_bytes(bytearray([0x4]))
+
+        restarted_cache = Cache(tmp_path)
+
+        assert len(restarted_cache) == 2
+        assert restarted_cache.get("hash1") == str(tmp_path / "cache" / "hash1")
+        assert restarted_cache.get("hash2") == str(tmp_path / "cache" / "hash2")
+        assert not (tmp_path / "cache" / f"{Cache.TEMPORARY_FILE_PREFIX}hash3").exists()
+
+    def test_eviction(self, tmp_path: Path):
+        cache = Cache(tmp_path, max_bytes=8, max_entries=3)
+
+        cache.put("hash1", bytearray(4))
+        cache.put("hash2", bytearray(2))
+        cache.put("hash3", bytearray(2))
+
+        assert cache.resident_bytes == 8
+        assert cache.evictions == 0
+
+        # "hash1" is the least recently used entry after accessing it, hence "hash2" will be evicted
+        cache.get("hash1")
+        cache.put("hash4", bytearray(1))
+
+        assert "hash2" not in cache
+        assert not (tmp_path / "cache" / "hash2").exists()
+        assert cache.resident_bytes == 7
+        assert cache.evictions == 1
+
+        # entries that are linked elsewhere must not be evicted, as they are still used by ongoing compilations
+        assert cache.link("hash1", str(tmp_path / "dependency"))
+        cache.put("hash5", bytearray(4))
+
+        assert "hash1" in cache
+        assert "hash3" not in cache
+        assert "hash4" not in cache
+        assert cache.resident_bytes == 8
+        assert cache.evictions == 3
+
+        # unpinned entries are evicted again, even if they are still hard-linked elsewhere, e.g. by a killed server
+        cache.unpin("hash1")
+        cache.put("hash6", bytearray(4))
+
+        assert "hash1" not in cache
+        assert (tmp_path / "dependency").exists()
+        assert cache.resident_bytes == 8
+        assert cache.evictions == 4
+
+    def test_stale_links_do_not_pin(self, tmp_path: Path):
+        cache = Cache(tmp_path / "persistent", max_bytes=4)
+        cache.put("hash1", bytearray(4))
+        assert cache.link("hash1", str(tmp_path / "dependency"))
+
+        # the instance folders of a killed server are never cleaned up, so that their links outlive the server
+        restarted_cache = Cache(tmp_path / "persistent", max_bytes=4)
+        restarted_cache.put("hash2", bytearray(4))
+
+        assert "hash1" not in restarted_cache
+        assert not (tmp_path / "persistent" / "cache" / "hash1").exists()
+
+    def test_link(self, tmp_path: Path):
+        cache = Cache(tmp_path)
+        cache.put("hash1", bytearray([0x1, 0x2]))
+
+        assert cache.link("hash1", str(tmp_path / "dependency"))
+        assert (tmp_path / "dependency").read_bytes() == bytearray([0x1, 0x2])
+        assert not cache.link("other_hash", str(tmp_path / "other_dependency"))
+
+    def test_uploads(self, tmp_path: Path):
+        cache = Cache(tmp_path)
+
+        # only the first request uploads the dependency, concurrent requests wait for it instead
+        assert cache.begin_upload("hash1")
+        assert not cache.begin_upload("hash1")
+        assert not cache.wait_for_upload("hash1", timeout=0)
+
+        uploader = Thread(target=lambda: (cache.put("hash1", bytearray([0x1])), cache.end_upload("hash1")))
+        uploader.start()
+
+        assert cache.wait_for_upload("hash1", timeout=10)
+        assert "hash1" in cache
+        assert not cache.begin_upload("hash1")
+        uploader.join()
+
+        # abandoned uploads can be taken over by other requests
+        assert cache.begin_upload("hash2")
+        cache.end_upload("hash2")
+
+        assert cache.wait_for_upload("hash2", timeout=0)
+        assert cache.begin_upload("hash2")
+
+
+class TestResultCache:
+    """Tests the server result cache."""
+
+    def test_read(self, tmp_path: Path):
+        result_cache = ResultCache(tmp_path, max_bytes=4)
+        result_cache.put("key1", bytearray([0x1, 0x2]))
+
+        assert (tmp_path / "results" / "key1").exists()
+        assert result_cache.read("key1") == bytearray([0x1, 0x2])
+        assert result_cache.read("other_key") is None
+
+        # results are evicted like dependencies once the cache exceeds its bounds
+        result_cache.put("key2", bytearray([0x3, 0x4, 0x5]))
+
+        assert result_cache.read("key1") is None
+        assert result_cache.read("key2") == bytearray([0x3, 0x4, 0x5])
+
+    def test_read_without_mutex(self, tmp_path: Path, mocker: MockerFixture):
+        result_cache = ResultCache(tmp_path)
+        result_cache.put("key", bytearray([0x1, 0x2]))
+        read_open = open
+
+        def unlocked_open(*args, **kwargs):
+            # other connections can look up and insert results while the file is read
+            assert not result_cache.cache_mutex.locked()
+            return read_open(*args, **kwargs)
+
+        mocker.patch("builtins.open", unlocked_open)
+        assert result_cache.read("key") == bytearray([0x1, 0x2])
+
+        # results that are evicted concurrently are treated as not cached
+        (tmp_path / "results" / "key").unlink()
+        assert result_cache.read("key") is None
+
+
+class TestProbeCache:
+    """Tests the server probe cache."""
+
+    def test_get(self, mocker: MockerFixture):
+        monotonic = mocker.patch("homcc.server.cache.time.monotonic", return_value=0)
+        probe_cache = ProbeCache(ttl=10)
+        probes: List[str] = []
+
+        def probe() -> str:
+            probes.append("probe")
+            return f"result{len(probes)}"
+
+        assert probe_cache.get("key", probe, fingerprint=1) == "result1"
+        assert probe_cache.get("key", probe, fingerprint=1) == "result1"
+        assert len(probes) == 1
+
+        # a changed fingerprint invalidates the memoized result immediately
+        assert probe_cache.get("key", probe, fingerprint=2) == "result2"
+        assert probe_cache.get("key", probe, fingerprint=2) == "result2"
+        assert len(probes) == 2
+
+        # memoized results expire after the TTL
+        monotonic.return_value = 9
+        assert probe_cache.get("key", probe, fingerprint=2) == "result2"
+        monotonic.return_value = 10
+        assert probe_cache.get("key", probe, fingerprint=2) == "result3"
+        assert len(probes) == 3
+
+    def test_get_failing_probe(self):
+        probe_cache = ProbeCache(ttl=10)
+
+        def failing_probe() -> bool:
+            raise OSError
+
+        with pytest.raises(OSError):
+            probe_cache.get("key", failing_probe)
+
+        assert len(probe_cache) == 0
+        assert probe_cache.get("key", lambda: True)
+
+    def test_get_negative_probe(self):
+        probe_cache = ProbeCache(ttl=10)
+        probes: List[Optional[bool]] = [False, None, True]
+
+        # e.g. a missing compiler or a stopped docker container are probed again, until the probe succeeds
+        assert probe_cache.get("key", lambda: probes.pop(0)) is False
+        assert probe_cache.get("key", lambda: probes.pop(0)) is None
+        assert len(probe_cache) == 0
+
+        assert probe_cache.get("key", lambda: probes.pop(0)) is True
+        assert probe_cache.get("key", lambda: probes.pop(0)) is True
+        assert len(probe_cache) == 1
+
+    def test_max_entries(self, mocker: MockerFixture):
+        mocker.patch.object(ProbeCache, "MAX_ENTRIES", 2)
+        probe_cache = ProbeCache(ttl=10)
+
+        for key in ["key1", "key2", "key1", "key3"]:
+            probe_cache.get(key, lambda: True)
+
+        # the entry that expires first is dropped, memoized results are not refreshed by hits
+        assert len(probe_cache) == 2
+        assert list(probe_cache.probes) == ["key2", "key3"]
@@ -3,6 +3,7 @@
 #   https://github.com/celonis/homcc/blob/main/LICENSE
 
 """Tests for the server environment."""
+import os
 from pathlib import Path
 from typing import List
 from unittest.mock import MagicMock
@@ -13,7 +14,7 @@ from pytest_mock.plugin import MockerFixture
 from homcc.common.arguments import Arguments
 from homcc.common.compression import NoCompression
 from homcc.common.shell_environment import HostShellEnvironment
-from homcc.server.cache import Cache
+from homcc.server.cache import Cache, ProbeCache
 from homcc.server.environment import ArgumentsExecutionResult, Environment
 
 
@@ -26,6 +27,9 @@ def create_mock_environment(instance_folder: str, mapped_cwd: str) -> Environmen
     environment.mapped_cwd = mapped_cwd
     environment.shell_env = HostShellEnvironment()
     environment.compression = NoCompression()
+    environment.sandbox = (None, None)
+    environment.probe_cache = None
+    environment.linked_dependencies = []
 
     return environment
 
@@ -133,8 +137,8 @@ class TestServerEnvironment:
         lock_mock.__exit__ = mocker.Mock(return_value=None)
 
         environment = create_mock_environment("", "")
-        # pylint: disable=protected-access
-        Cache._create_cache_folder = lambda *_: None  # type: ignore
+        mocker.patch.object(Cache, "_create_cache_folder")
+        mocker.patch.object(Cache, "_load_cache_folder")
         cache = Cache(Path(""))
         cache.cache = {"hash2": "some/path/to/be/linked"}
 
@@ -216,6 +220,28 @@ class TestServerCompilation:
         assert environment.compiler_exists(Arguments.from_vargs("g++", "foo"))
         assert not environment.compiler_exists(Arguments.from_vargs("clang-HOMCC_TEST_COMPILER_EXISTS", "foo"))
 
+    def test_probe_cache(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        probes_file: Path = tmp_path / "probes"
+        compiler: Path = tmp_path / "g++"
+        compiler.write_text(f"#!/bin/sh\necho probe >> {probes_file}\necho x86_64-linux-gnu\n")
+        compiler.chmod(0o755)
+        monkeypatch.setenv("PATH", f"{tmp_path}:{os.environ['PATH']}")
+
+        environment = create_mock_environment("instance-folder", "instance-folder/some-folder")
+        environment.probe_cache = ProbeCache(ttl=60)
+        arguments: Arguments = Arguments.from_vargs("g++", "foo")
+
+        for _ in range(3):
+            assert environment.compiler_exists(arguments)
+            assert environment.get_compiler_target_triple(arguments) == "x86_64-linux-gnu"
+
+        assert len(probes_file.read_text().splitlines()) == 1
+
+        # replacing the compiler binary invalidates its memoized probes
+        compiler.write_text(f"#!/bin/sh\necho probe >> {probes_file}\necho aarch64-linux-gnu\n")
+        assert environment.get_compiler_target_triple(arguments) == "aarch64-linux-gnu"
+        assert len(probes_file.read_text().splitlines()) == 2
+
     def test_map_source_file_to_object_file(self):
         instance_path: str = "/tmp/instance/"
         mapped_cwd: str = "/tmp/instance/user/some_user/"
@@ -28,6 +28,12 @@ class TestParsingConfig:
         "AdDrEsS=0.0.0.0",
         "LOG_LEVEL=DEBUG",
         "verbose=TRUE",
+        "cache_folder=/var/cache/homccd",
+        "result_cache_size_limit=4096",
+        "probe_cache_ttl=0",
+        "connections_limit=168",
+        "queue_limit=0",
+        "queue_timeout=2.5",
         # the following configs should be ignored
         "[homcc]",
         "LOG_LEVEL=INFO",
@@ -50,6 +56,17 @@ class TestParsingConfig:
         assert not cap.err
         assert f"homccd {server.__version__}" in cap.out
 
+    @pytest.mark.parametrize("option", ["--cache-size-limit", "--cache-entries-limit", "--result-cache-size-limit"])
+    def test_positive_cache_limits(self, option: str, capfd: CaptureFixture):
+        assert parse_cli_args([option, "42"])[option[2:].replace("-", "_")] == 42
+
+        for value in ["0", "-1"]:
+            with pytest.raises(SystemExit) as sys_exit:
+                parse_cli_args([option, value])
+
+            assert sys_exit.value.code == 2
+            assert f"{value} is not a positive integer" in capfd.readouterr().err
+
     def test_parse_config_file(self, tmp_path: Path):
         tmp_config_file: Path = tmp_path / HOMCC_CONFIG_FILENAME
         tmp_config_file.write_text("\n".join(self.config))
@@ -61,6 +78,12 @@ class TestParsingConfig:
             address="0.0.0.0",
             log_level="DEBUG",
             verbose=True,
+            cache_folder="/var/cache/homccd",
+            result_cache_size_limit=4096,
+            probe_cache_ttl=0,
+            connections_limit=168,
+            queue_limit=0,
+            queue_timeout=2.5,
         )
 
     def test_parse_multiple_config_files(self, tmp_path: Path):
@@ -77,4 +100,10 @@ class TestParsingConfig:
             address="0.0.0.0",
             log_level="INFO",
             verbose=False,
+            cache_folder="/var/cache/homccd",
+            result_cache_size_limit=4096,
+            probe_cache_ttl=0,
+            connections_limit=168,
+            queue_limit=0,
+            queue_timeout=2.5,
         )
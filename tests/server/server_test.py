@@ -3,7 +3,11 @@
 #   https://github.com/celonis/homcc/blob/main/LICENSE
 
 """Tests regarding the server."""
+import os
 import socket
+import threading
+import time
+from pathlib import Path
 from typing import List
 from unittest.mock import MagicMock, patch
 
@@ -11,16 +15,31 @@ import pytest
 from pytest_mock import MockerFixture
 
 from homcc.common.compression import NoCompression
+from homcc.common.constants import TCP_BUFFER_SIZE
 from homcc.common.messages import (
     ArgumentMessage,
     CompilationResultMessage,
+    ConnectionRefusedMessage,
+    DependencyBatchRequestMessage,
     DependencyReplyMessage,
     DependencyRequestMessage,
     File,
     Message,
+    QueuedMessage,
 )
+from homcc.server.admission import AdmissionQueue
+from homcc.server.cache import Cache
 from homcc.server.parsing import ServerConfig
-from homcc.server.server import TCPRequestHandler, start_server, stop_server
+from homcc.server.server import (
+    CONNECTION_REJECTION_TIMEOUT,
+    DEPENDENCY_MAX_RETRIES,
+    AsyncTCPServer,
+    TCPRequestHandler,
+    TCPServer,
+    sendmsg_all,
+    start_server,
+    stop_server,
+)
 
 
 class TestServer:
@@ -30,6 +49,7 @@ class TestServer:
     def setup_mock(self):
         self.request_handler = TCPRequestHandler.__new__(TCPRequestHandler)
         self.request_handler.server = MagicMock()
+        self.request_handler.server.probe_cache = None
         self.request_handler.request = MagicMock()
         self.request_handler.environment = MagicMock()
 
@@ -198,3 +218,225 @@ class TestServerReceive:
 
             self.client_stop()
             stop_server(server)
+
+
+class TestRejectConnection:
+    """Tests rejecting connections of the threaded server."""
+
+    @pytest.mark.timeout(5)
+    def test_close_connection_for_request(self):
+        request, client = socket.socketpair()
+        with client:
+            rejecting_thread = threading.Thread(
+                target=TCPServer.close_connection_for_request, args=(request, "Limit 1 reached")
+            )
+            rejecting_thread.start()
+
+            # the client receives the message followed by the end of the stream
+            _, message = Message.from_bytes(bytearray(client.recv(TCP_BUFFER_SIZE)))
+            assert isinstance(message, ConnectionRefusedMessage)
+            assert message.get_info() == "Limit 1 reached"
+            assert client.recv(TCP_BUFFER_SIZE) == b""
+
+            # the socket is only closed once the client closed the connection as well
+            rejecting_thread.join(timeout=0.2)
+            assert rejecting_thread.is_alive()
+
+            client.shutdown(socket.SHUT_WR)
+            rejecting_thread.join()
+
+        assert request.fileno() == -1
+
+    @pytest.mark.timeout(5)
+    def test_reject_connections_without_blocking(self, unused_tcp_port):
+        config: ServerConfig = ServerConfig(
+            files=[], address="0.0.0.0", port=unused_tcp_port, limit=1, connections_limit=1
+        )
+
+        server, _ = start_server(config)
+        with server:
+            # the first connection occupies the only available slot, while rejected clients do not close their
+            # connections, which must not delay rejecting further connections
+            with socket.create_connection(("localhost", unused_tcp_port)):
+                while server.current_amount_connections < 1:
+                    time.sleep(0.01)
+
+                rejected_sockets: List[socket.socket] = []
+
+                for _ in range(3):
+                    rejected_sockets.append(socket.create_connection(("localhost", unused_tcp_port)))
+                    rejected_sockets[-1].settimeout(CONNECTION_REJECTION_TIMEOUT / 10)
+                    _, message = Message.from_bytes(bytearray(rejected_sockets[-1].recv(TCP_BUFFER_SIZE)))
+
+                    assert isinstance(message, ConnectionRefusedMessage)
+                    assert rejected_sockets[-1].recv(TCP_BUFFER_SIZE) == b""
+
+                for rejected_socket in rejected_sockets:
+                    rejected_socket.close()
+
+            stop_server(server)
+
+
+class TestAsyncServer:
+    """Tests the event loop based server."""
+
+    @pytest.mark.timeout(5)
+    def test_reject_connection(self, unused_tcp_port):
+        config: ServerConfig = ServerConfig(
+            files=[], address="0.0.0.0", port=unused_tcp_port, limit=1, event_loop=True, connections_limit=1
+        )
+
+        server, _ = start_server(config)
+        with server:
+            assert isinstance(server, AsyncTCPServer)
+
+            # the first connection occupies the only available slot
+            with socket.create_connection(("localhost", unused_tcp_port)):
+                with socket.create_connection(("localhost", unused_tcp_port)) as rejected_socket:
+                    _, message = Message.from_bytes(bytearray(rejected_socket.recv(TCP_BUFFER_SIZE)))
+
+                    assert isinstance(message, ConnectionRefusedMessage)
+                    assert message.get_info() == "Limit 1 reached"
+
+            stop_server(server)
+
+
+class TestCompilationSlots:
+    """Tests queueing compilations that exceed the compilation slots of the server."""
+
+    @pytest.fixture(autouse=True)
+    def setup_mock(self):
+        # pylint: disable=protected-access
+        # justification: needed for mocking the dependency handling
+        self.request_handler = TCPRequestHandler.__new__(TCPRequestHandler)
+        self.request_handler.server = MagicMock()
+        self.request_handler.server.admission_queue = AdmissionQueue(limit=1, queue_limit=1)
+        self.request_handler.server.queue_timeout = 5
+        self.request_handler.environment = MagicMock()
+        self.request_handler.result_cache_key = None
+        self.request_handler.compiler_arguments = MagicMock()
+        self.request_handler._request_next_dependencies = MagicMock(return_value=False)  # type: ignore[assignment]
+        self.request_handler.send_message = MagicMock()  # type: ignore[assignment]
+
+        # another compilation occupies the only compilation slot
+        assert self.request_handler.server.admission_queue.try_acquire()
+
+    def sent_messages(self) -> List[Message]:
+        return [call.args[0] for call in self.request_handler.send_message.call_args_list]
+
+    @pytest.mark.timeout(5)
+    def test_queue_compilation(self):
+        admission_queue: AdmissionQueue = self.request_handler.server.admission_queue
+        threading.Timer(0.1, admission_queue.release, args=(1.0,)).start()
+
+        # the compilation starts as soon as the slot is released and releases it again afterwards
+        self.request_handler.check_dependencies_exist()
+
+        self.request_handler.environment.do_compilation.assert_called_once()
+        assert self.sent_messages()[0] == QueuedMessage(1, None)
+        assert admission_queue.occupied_slots == 0
+        assert admission_queue.average_hold_time is not None and admission_queue.average_hold_time < 1.0
+
+    def test_queue_timeout(self):
+        self.request_handler.server.queue_timeout = 0.1
+        self.request_handler.check_dependencies_exist()
+
+        self.request_handler.environment.do_compilation.assert_not_called()
+        queued_message, result_message = self.sent_messages()
+        assert isinstance(queued_message, QueuedMessage)
+        assert isinstance(result_message, CompilationResultMessage)
+        assert result_message.get_return_code() == os.EX_TEMPFAIL
+        assert len(self.request_handler.server.admission_queue) == 0
+
+    def test_queue_full(self):
+        self.request_handler.server.admission_queue.queue_limit = 0
+        self.request_handler.check_dependencies_exist()
+
+        self.request_handler.environment.do_compilation.assert_not_called()
+        (result_message,) = self.sent_messages()
+        assert isinstance(result_message, CompilationResultMessage)
+        assert result_message.get_return_code() == os.EX_TEMPFAIL
+
+
+class TestDependencyTransfer:
+    """Tests declining compilations whose dependencies can not be transferred."""
+
+    @pytest.fixture(autouse=True)
+    def setup_mock(self, tmp_path: Path):
+        self.request_handler = TCPRequestHandler.__new__(TCPRequestHandler)
+        self.request_handler.server = MagicMock()
+        self.request_handler.server.cache = Cache(tmp_path)
+        self.request_handler.environment = MagicMock()
+        self.request_handler.environment.compression = NoCompression()
+        self.request_handler.environment.link_dependency_to_cache.return_value = False
+        self.request_handler.environment.unmap_path.side_effect = lambda path: path
+        self.send_message = MagicMock()
+        self.request_handler.send_message = self.send_message  # type: ignore[assignment]
+        self.request_handler.terminate = False
+
+        self.request_handler.needed_dependencies = {"/foo.h": "hash"}
+        self.request_handler.needed_dependency_keys = ["/foo.h"]
+        self.request_handler.requested_dependencies = []
+        self.request_handler.uploading_hashes = set()
+        self.request_handler.dependencies_deadline = time.monotonic() + 10
+        self.request_handler.dependency_retries = {}
+        self.request_handler.dependency_error = None
+
+    def sent_messages(self) -> List[Message]:
+        return [call.args[0] for call in self.send_message.call_args_list]
+
+    @pytest.mark.timeout(5)
+    def test_stalled_upload(self):
+        # another connection started uploading the dependency, but never finishes
+        assert self.request_handler.server.cache.begin_upload("hash")
+        self.request_handler.dependencies_deadline = time.monotonic() + 0.2
+
+        self.request_handler.check_dependencies_exist()
+
+        message = self.sent_messages()[-1]
+        assert isinstance(message, CompilationResultMessage)
+        assert message.get_return_code() == os.EX_TEMPFAIL
+        assert "'/foo.h' was not uploaded" in message.get_stderr()
+        assert self.request_handler.terminate
+
+    def test_mismatching_dependency(self):
+        self.request_handler.check_dependencies_exist()
+
+        # the dependency is requested again until it mismatched more often than the retries allow
+        for _ in range(DEPENDENCY_MAX_RETRIES + 1):
+            assert isinstance(self.sent_messages()[-1], DependencyBatchRequestMessage)
+            self.request_handler._handle_dependency_reply_message(  # pylint: disable=protected-access
+                DependencyReplyMessage(bytearray(b"changed"), NoCompression())
+            )
+
+        assert len(self.sent_messages()) == DEPENDENCY_MAX_RETRIES + 2
+
+        message = self.sent_messages()[-1]
+        assert isinstance(message, CompilationResultMessage)
+        assert message.get_return_code() == os.EX_TEMPFAIL
+        assert "'/foo.h' did not match its hash" in message.get_stderr()
+        assert self.request_handler.terminate
+        assert not self.request_handler.uploading_hashes
+
+
+class TestSendMessage:
+    """Tests sending messages via vectored I/O."""
+
+    def test_sendmsg_all(self):
+        buffers: List[bytearray] = [bytearray(os.urandom(size)) for size in [0, 1, 7, 1 << 16, 42] * 300]
+
+        sender, receiver = socket.socketpair()
+        with sender, receiver:
+            # the buffers exceed the socket buffer and IOV_MAX, so they are only sent partially per sendmsg call
+            sending_thread = threading.Thread(target=sendmsg_all, args=(sender, buffers))
+            sending_thread.start()
+
+            received: bytearray = bytearray()
+            expected_size: int = sum(len(buffer) for buffer in buffers)
+
+            while len(received) < expected_size:
+                received += receiver.recv(TCP_BUFFER_SIZE)
+
+            sending_thread.join()
+
+        assert received == bytearray().join(buffers)